@@ -11,6 +11,7 @@
 #  included in the root directory of this package.
 
 from __future__ import absolute_import, division
+import functools
 import math
 
 import libtbx
@@ -136,15 +137,21 @@ def fft(self):
     #(512**3)*8*2*bytes_to_gb
     #2.0
 
-    fft = fftpack.complex_to_complex_3d(self.gridding)
-    grid_complex = flex.complex_double(
-      reals=self.reciprocal_space_grid,
-      imags=flex.double(self.reciprocal_space_grid.size(), 0))
-    grid_transformed = fft.forward(grid_complex)
-    #self.grid_real = flex.pow2(flex.abs(grid_transformed))
-    self.grid_real = flex.pow2(flex.real(grid_transformed))
-    #self.grid_real = flex.pow2(flex.imag(self.grid_transformed))
-    del grid_transformed
+    if self.params.fft3d.real_to_complex:
+      self.grid_real = real_fft3d_power(
+        self.reciprocal_space_grid, nproc=self.params.nproc)
+      # the reciprocal space grid is not needed again, so release it now
+      del self.reciprocal_space_grid
+    else:
+      fft = fftpack.complex_to_complex_3d(self.gridding)
+      grid_complex = flex.complex_double(
+        reals=self.reciprocal_space_grid,
+        imags=flex.double(self.reciprocal_space_grid.size(), 0))
+      grid_transformed = fft.forward(grid_complex)
+      #self.grid_real = flex.pow2(flex.abs(grid_transformed))
+      self.grid_real = flex.pow2(flex.real(grid_transformed))
+      #self.grid_real = flex.pow2(flex.imag(self.grid_transformed))
+      del grid_transformed
 
     if self.params.debug:
       self.debug_write_ccp4_map(map_data=self.grid_real, file_name="fft3d.map")
@@ -154,12 +161,14 @@ def fft(self):
       self.find_peaks_clean()
 
   def find_peaks(self):
-    grid_real_binary = self.grid_real.deep_copy()
-    rmsd = math.sqrt(
-      flex.mean(flex.pow2(grid_real_binary.as_1d()-flex.mean(grid_real_binary.as_1d()))))
-    grid_real_binary.set_selected(grid_real_binary < (self.params.rmsd_cutoff)*rmsd, 0)
-    grid_real_binary.as_1d().set_selected(grid_real_binary.as_1d() > 0, 1)
-    grid_real_binary = grid_real_binary.iround()
+    # threshold the map without taking a copy of it
+    grid_real = self.grid_real.as_1d()
+    n = grid_real.size()
+    rmsd = math.sqrt(flex.mean_and_variance(
+      grid_real).unweighted_sample_variance() * (n - 1) / n)
+    threshold = self.params.rmsd_cutoff * rmsd
+    grid_real_binary = ((grid_real >= threshold) & (grid_real > 0)).as_int()
+    grid_real_binary.reshape(self.grid_real.accessor())
     from cctbx import masks
     flood_fill = masks.flood_fill(grid_real_binary, self.fft_cell)
     if flood_fill.n_voids() < 4:
@@ -678,6 +687,72 @@ def optimise_peaks(self, peaks, reciprocal_lattice_points):
     return optimised_peaks
 
 
+def _map_slabs(func, n, nproc):
+  '''
+  Call func(i0, i1) over slabs covering range(n), on nproc threads.
+
+  '''
+  step = max(1, -(-n // (4 * nproc)))
+  slabs = [(i, min(i + step, n)) for i in range(0, n, step)]
+  if nproc > 1:
+    from multiprocessing.pool import ThreadPool
+    pool = ThreadPool(nproc)
+    try:
+      pool.map(lambda slab: func(*slab), slabs)
+    finally:
+      pool.close()
+      pool.join()
+  else:
+    for slab in slabs:
+      func(*slab)
+
+
+def real_fft3d_power(grid, nproc=1):
+  '''
+  Compute the squared real part of the 3D FFT of a real grid. This gives the
+  same result as the squared real part of a complex-to-complex FFT of the grid,
+  but only half of the transform is computed and held in memory. The missing
+  half is filled in using F(-h) = F(h)*. Each axis is transformed in slabs, and
+  the slabs may be transformed on several threads.
+
+  :param grid: The 3D grid
+  :param nproc: The number of threads to use
+  :return: The squared real part of the transform
+
+  '''
+  import numpy
+  n0, n1, n2 = grid.all()
+  h2 = n2 // 2 + 1
+  data = grid.as_numpy_array().reshape(n0, n1, n2)
+  transformed = numpy.empty((n0, n1, h2), dtype=numpy.complex128)
+
+  def transform_axes_2_and_1(data, transformed, i0, i1):
+    transformed[i0:i1] = numpy.fft.fft(
+      numpy.fft.rfft(data[i0:i1], axis=2), axis=1)
+
+  def transform_axis_0(transformed, k0, k1):
+    transformed[:, :, k0:k1] = numpy.fft.fft(
+      transformed[:, :, k0:k1], axis=0)
+
+  _map_slabs(functools.partial(
+    transform_axes_2_and_1, data, transformed), n0, nproc)
+  del data
+  _map_slabs(functools.partial(transform_axis_0, transformed), h2, nproc)
+
+  power = transformed.real
+  numpy.square(power, out=power)
+  result = numpy.empty((n0, n1, n2))
+  result[:, :, :h2] = power
+  minus_j = (-numpy.arange(n1)) % n1
+  minus_k = n2 - numpy.arange(h2, n2)
+  for i in range(n0):
+    result[i, :, h2:] = power[(-i) % n0][minus_j][:, minus_k]
+  del power, transformed
+  result = flex.double(result)
+  result.reshape(flex.grid(n0, n1, n2))
+  return result
+
+
 def sampling_volume_map(data, angle_range, beam_vector, rotation_axis,
                         rl_grid_spacing, d_min, b_iso):
     from dials.algorithms.indexing import sampling_volume_map
@@ -106,6 +106,13 @@
     peak_volume_cutoff = 0.15
       .type = float
       .expert_level = 2
+    real_to_complex = False
+      .type = bool
+      .expert_level = 2
+      .help = "Use a real-to-complex FFT, which only computes half of the"
+              "transform, in place of a complex-to-complex FFT. This"
+              "substantially reduces the memory needed for large grids. The"
+              "transform is split across nproc threads."
     reciprocal_space_grid {
       n_points = 256
         .type = int(value_min=0)
@@ -196,6 +203,23 @@
       rmsd_weight = 1
         .type = float(value_min=0)
     }
+    prescreen
+      .expert_level = 2
+    {
+      n_indexed_cutoff = 0.0
+        .type = float(value_min=0, value_max=1)
+        .help = "Only refine candidate models that index at least this"
+                "fraction of the reflections indexed by the best candidate."
+      early_termination = False
+        .type = bool
+        .help = "Refine the candidate models in batches of nproc, in order"
+                "of the number of reflections indexed, and stop once none of"
+                "the remaining candidates could change the solution chosen."
+                "With the filter solution scorer this is once the remaining"
+                "candidates index too few reflections to pass its first"
+                "filter. The weighted solution scorer gives no such bound, so"
+                "all the candidates are refined."
+    }
   }
   index_assignment {
     method = *simple local
@@ -317,6 +341,16 @@
   {
     characteristic_grid = 0.02
       .type = float(value_min=0)
+    coarse_grid = None
+      .type = float(value_min=0)
+      .help = "If set, first search the directions on a grid with this"
+              "characteristic spacing, then only search the directions on"
+              "the characteristic_grid that are close to the best scoring"
+              "coarse directions."
+    coarse_n_best = 50
+      .type = int(value_min=1)
+      .help = "The number of best scoring coarse directions around which to"
+              "search the finer grid."
   }
   stills {
     indexer = *Auto stills sweeps
@@ -1404,17 +1438,26 @@ def run_one_refinement(args):
       params.refinement.reflections.outlier.tukey.iqr_multiplier = \
         2 * params.refinement.reflections.outlier.tukey.iqr_multiplier
 
-    args = []
-
     from dials.algorithms.indexing.compare_orientation_matrices \
          import difference_rotation_matrix_axis_angle
-    for cm in candidate_orientation_matrices:
+
+    def make_experiments(cm):
+      experiments = ExperimentList()
+      for imageset in self.imagesets:
+        experiments.append(Experiment(imageset=imageset,
+                                      beam=imageset.get_beam(),
+                                      detector=imageset.get_detector(),
+                                      goniometer=imageset.get_goniometer(),
+                                      scan=imageset.get_scan(),
+                                      crystal=cm))
+      return experiments
+
+    def prepare_candidate(cm):
       sel = (self.reflections['id'] == -1)
       if self.d_min is not None:
         sel &= (1/self.reflections['rlp'].norms() > self.d_min)
       xo, yo, zo = self.reflections['xyzobs.mm.value'].parts()
       imageset_id = self.reflections['imageset_id']
-      experiments = ExperimentList()
       for i_imageset, imageset in enumerate(self.imagesets):
         scan = imageset.get_scan()
         if scan is not None:
@@ -1423,16 +1466,11 @@ def run_one_refinement(args):
             # only use reflections from the first 360 degrees of the scan
             sel.set_selected(
               (imageset_id == i_imageset) & (zo > ((start * math.pi/180) + 2 * math.pi)), False)
-        experiments.append(Experiment(imageset=imageset,
-                                      beam=imageset.get_beam(),
-                                      detector=imageset.get_detector(),
-                                      goniometer=imageset.get_goniometer(),
-                                      scan=scan,
-                                      crystal=cm))
+      experiments = make_experiments(cm)
       refl = self.reflections.select(sel)
       self.index_reflections(experiments, refl)
       if refl.get_flags(refl.flags.indexed).count(True) == 0:
-        continue
+        return None
 
       from rstbx.dps_core.cell_assessment import SmallUnitCellVolume
       threshold = self.params.basis_vector_combinations.sys_absent_threshold
@@ -1443,22 +1481,22 @@ def run_one_refinement(args):
         except SmallUnitCellVolume:
           logger.debug("correct_non_primitive_basis SmallUnitCellVolume error for unit cell %s:"
                        %experiments[0].crystal.get_unit_cell())
-          continue
+          return None
         except RuntimeError as e:
           if 'Krivy-Gruber iteration limit exceeded' in str(e):
             logger.debug("correct_non_primitive_basis Krivy-Gruber iteration limit exceeded error for unit cell %s:"
                          %experiments[0].crystal.get_unit_cell())
-            continue
+            return None
           raise
         if experiments[0].crystal.get_unit_cell().volume() < self.params.min_cell_volume:
-          continue
+          return None
 
       if self.params.known_symmetry.space_group is not None:
         target_space_group = self.target_symmetry_primitive.space_group()
         new_crystal, cb_op_to_primitive = self.apply_symmetry(
           experiments[0].crystal, target_space_group)
         if new_crystal is None:
-          continue
+          return None
         experiments[0].crystal.update(new_crystal)
         if not cb_op_to_primitive.is_identity_op():
           sel = refl['id'] > -1
@@ -1486,22 +1524,68 @@ def run_one_refinement(args):
             break
         if orientation_too_similar:
           logger.debug("skipping crystal: too similar to other crystals")
-          continue
+          return None
 
-      args.append((params, refl, experiments))
+      # Only return the crystal, the experiments are rebuilt by the caller
+      return refl, experiments[0].crystal
 
+    # Index the reflections with each candidate in parallel
     from libtbx import easy_mp
-    results = easy_mp.parallel_map(
-      run_one_refinement,
-      args,
+    prepared = easy_mp.parallel_map(
+      prepare_candidate,
+      candidate_orientation_matrices,
       processes=self.params.nproc,
       preserve_exception_message=True,
     )
+    prepared = [p for p in prepared if p is not None]
 
-    for soln in results:
-      if soln is None:
-        continue
-      solutions.append(soln)
+    # Pre-screen the candidates by the number of reflections indexed. With
+    # early termination, refine those indexing the most reflections first;
+    # otherwise keep the original order so that ties are broken as before
+    prescreen = self.params.basis_vector_combinations.prescreen
+    args = []
+    args_n_indexed = []
+    if len(prepared):
+      n_indexed = [(refl['id'] > -1).count(True) for refl, crystal in prepared]
+      max_n_indexed = max(n_indexed)
+      candidates = zip(n_indexed, prepared)
+      if prescreen.early_termination:
+        candidates = sorted(candidates, key=lambda x: x[0], reverse=True)
+      for n, (refl, crystal) in candidates:
+        if n < prescreen.n_indexed_cutoff * max_n_indexed:
+          logger.debug("skipping crystal: only %d of %d reflections indexed" %(
+            n, max_n_indexed))
+          continue
+        args.append((params, refl, make_experiments(crystal)))
+        args_n_indexed.append(n)
+
+    # Refine the candidates. If early termination is enabled, refine them in
+    # batches and stop once the remaining candidates cannot change the best
+    # solution
+    if prescreen.early_termination:
+      batch_size = self.params.nproc
+    else:
+      batch_size = max(len(args), 1)
+    for i in range(0, len(args), batch_size):
+      batch = args[i:i+batch_size]
+      results = easy_mp.parallel_map(
+        run_one_refinement,
+        batch,
+        processes=self.params.nproc,
+        preserve_exception_message=True,
+      )
+
+      for soln in results:
+        if soln is None:
+          continue
+        solutions.append(soln)
+
+      remaining = args_n_indexed[i+batch_size:]
+      if (prescreen.early_termination and len(remaining) and len(solutions)
+          and solutions.is_dominant(remaining[0])):
+        logger.debug("Best solution dominates the %d remaining candidates" %
+                     len(remaining))
+        break
 
     if len(solutions):
       logger.info("Candidate solutions:")
@@ -1785,6 +1869,11 @@ def filter_doubled_cell(solutions):
 
 # Tracker for solutions based on code in rstbx/dps_core/basis_choice.py
 class SolutionTrackerFilter(object):
+
+  # Solutions indexing less than this fraction of the reflections indexed by
+  # the best one are discarded before any other filter is applied
+  prefilter_n_indexed_cutoff = 0.05
+
   def __init__(self, check_doubled_cell=True, likelihood_cutoff=0.8,
                volume_cutoff=1.25, n_indexed_cutoff=0.9):
     self.check_doubled_cell = check_doubled_cell
@@ -1831,7 +1920,7 @@ def update_analysis(self):
     # pre-filter out solutions that only account for a very small
     # percentage of the indexed spots relative to the best one
     self.filtered_solutions = self.filter_by_n_indexed(
-      self.all_solutions, n_indexed_cutoff=0.05) # 5 percent
+      self.all_solutions, n_indexed_cutoff=self.prefilter_n_indexed_cutoff)
 
     if self.check_doubled_cell:
       self.filtered_solutions = filter_doubled_cell(self.filtered_solutions)
@@ -1852,6 +1941,19 @@ def best_solution(self):
                  if s.model_likelihood == self.best_filtered_liklihood]
     return solutions[0]
 
+  def is_dominant(self, n_indexed):
+    """Whether adding solutions indexing at most n_indexed reflections cannot
+    change the best solution. The likelihood and cell of a solution are only
+    known once it has been refined, and either can remove the current best
+    solution in the likelihood, volume or doubled cell filters. The only
+    solutions that cannot affect the result are those removed by the first
+    filter on the number of indexed reflections, which does not depend on the
+    other solutions' likelihoods or cells."""
+    if len(self.all_solutions) == 0:
+      return False
+    max_n_indexed = max(s.n_indexed for s in self.all_solutions)
+    return n_indexed < self.prefilter_n_indexed_cutoff * max_n_indexed
+
   def __str__(self):
     rows = []
     rows.append(
@@ -1915,6 +2017,14 @@ def best_solution(self):
     perm = flex.sort_permutation(scores)
     return self.all_solutions[perm[0]]
 
+  def is_dominant(self, n_indexed):
+    """Whether adding solutions indexing at most n_indexed reflections cannot
+    change the best solution. This is never known: the volume and rmsd scores
+    are relative to the smallest volume and rmsd, so a new solution with a
+    smaller cell or rmsd raises the scores of all the others by an unbounded
+    amount, and for power != 1 may also reorder them."""
+    return False
+
   def solution_scores(self):
     scores = sum(flex.pow(score.as_double(), self.power)
                  for score in (
@@ -24,6 +24,49 @@
 from dxtbx.model.experiment_list import Experiment, ExperimentList
 
 
+def compute_functional_batch(reciprocal_lattice_points, vectors, nproc=1,
+                             max_block_elements=2**22):
+  '''
+  Compute the real space grid search functional, the sum over the reciprocal
+  lattice points of cos(2 pi S.v), for many trial vectors. The trial vectors
+  are scored in blocks, each with a single matrix product, and the blocks may
+  be scored on several threads.
+
+  :param reciprocal_lattice_points: The reciprocal lattice points
+  :param vectors: The trial vectors
+  :param nproc: The number of threads to use
+  :param max_block_elements: The maximum size of the intermediate array
+  :return: The functional for each trial vector
+
+  '''
+  import numpy
+  rlp = reciprocal_lattice_points.as_double().as_numpy_array().reshape(-1, 3)
+  v = vectors.as_double().as_numpy_array().reshape(-1, 3)
+  block_size = max(1, max_block_elements // max(len(rlp), 1))
+  blocks = [(i, min(i + block_size, len(v)))
+            for i in range(0, len(v), block_size)]
+  result = numpy.zeros(len(v))
+
+  def score_block(block):
+    i0, i1 = block
+    s_dot_v = numpy.dot(rlp, v[i0:i1].T)
+    s_dot_v *= 2 * math.pi
+    result[i0:i1] = numpy.cos(s_dot_v, out=s_dot_v).sum(axis=0)
+
+  if nproc > 1 and len(blocks) > 1:
+    from multiprocessing.pool import ThreadPool
+    pool = ThreadPool(min(nproc, len(blocks)))
+    try:
+      pool.map(score_block, blocks)
+    finally:
+      pool.close()
+      pool.join()
+  else:
+    for block in blocks:
+      score_block(block)
+  return flex.double(result)
+
+
 class indexer_real_space_grid_search(indexer_base):
 
   def __init__(self, reflections, imagesets, params):
@@ -54,29 +97,47 @@ def real_space_grid_search(self):
 
     logger.info("Indexing from %i reflections" %len(reciprocal_lattice_points))
 
-    def compute_functional(vector):
-      two_pi_S_dot_v = 2 * math.pi * reciprocal_lattice_points.dot(vector)
-      return flex.sum(flex.cos(two_pi_S_dot_v))
-
     from rstbx.array_family import flex
     from rstbx.dps_core import SimpleSamplerTool
     assert self.target_symmetry_primitive is not None
     assert self.target_symmetry_primitive.unit_cell() is not None
-    SST = SimpleSamplerTool(
-      self.params.real_space_grid_search.characteristic_grid)
-    SST.construct_hemisphere_grid(SST.incr)
+
+    def search_directions(grid):
+      SST = SimpleSamplerTool(grid)
+      SST.construct_hemisphere_grid(SST.incr)
+      return flex.vec3_double([direction.dvec for direction in SST.angles])
+
+    def search_vectors(directions):
+      vectors = flex.vec3_double()
+      for direction in directions:
+        for l in unique_cell_dimensions:
+          vectors.append((matrix.col(direction) * l).elems)
+      logger.info("Number of search vectors: %i" %len(vectors))
+      return vectors, compute_functional_batch(
+        reciprocal_lattice_points, vectors, nproc=self.params.nproc)
+
     cell_dimensions = self.target_symmetry_primitive.unit_cell().parameters()[:3]
     unique_cell_dimensions = set(cell_dimensions)
-    logger.info(
-      "Number of search vectors: %i" %(len(SST.angles) * len(unique_cell_dimensions)))
-    vectors = flex.vec3_double()
-    function_values = flex.double()
-    for i, direction in enumerate(SST.angles):
-      for l in unique_cell_dimensions:
-        v = matrix.col(direction.dvec) * l
-        f = compute_functional(v.elems)
-        vectors.append(v.elems)
-        function_values.append(f)
+    grid_params = self.params.real_space_grid_search
+    directions = search_directions(grid_params.characteristic_grid)
+    if grid_params.coarse_grid is not None:
+      # Search a coarse grid, then only the directions of the fine grid that
+      # are within the coarse grid spacing of the best coarse directions.
+      # Since cos is even, directions are the same as their inverse.
+      coarse_vectors, coarse_values = search_vectors(
+        search_directions(grid_params.coarse_grid))
+      perm = flex.sort_permutation(coarse_values, reverse=True)
+      best = coarse_vectors.select(perm[:grid_params.coarse_n_best])
+      cos_max_angle = math.cos(2 * grid_params.coarse_grid)
+      near = flex.bool(len(directions), False)
+      for v in best:
+        near |= flex.abs(directions.dot(matrix.col(v).normalize().elems)) >= cos_max_angle
+      directions = directions.select(near)
+      vectors, function_values = search_vectors(directions)
+      vectors.extend(coarse_vectors)
+      function_values.extend(coarse_values)
+    else:
+      vectors, function_values = search_vectors(directions)
 
     perm = flex.sort_permutation(function_values, reverse=True)
     vectors = vectors.select(perm)
@@ -110,8 +171,9 @@ def compute_functional(vector):
     if self.params.optimise_initial_basis_vectors:
       optimised_basis_vectors = optimise_basis_vectors(
         reciprocal_lattice_points, basis_vectors)
-      optimised_function_values = flex.double([
-        compute_functional(v) for v in optimised_basis_vectors])
+      optimised_function_values = compute_functional_batch(
+        reciprocal_lattice_points, flex.vec3_double(optimised_basis_vectors),
+        nproc=self.params.nproc)
 
       perm = flex.sort_permutation(optimised_function_values, reverse=True)
       optimised_basis_vectors = optimised_basis_vectors.select(perm)
@@ -121,9 +183,13 @@ def compute_functional(vector):
 
     logger.info("Number of unique vectors: %i" %len(unique_vectors))
 
+    unique_function_values = compute_functional_batch(
+      reciprocal_lattice_points,
+      flex.vec3_double([v.elems for v in unique_vectors]),
+      nproc=self.params.nproc)
     for i in range(len(unique_vectors)):
       logger.debug("%s %s %s" %(
-        str(compute_functional(unique_vectors[i].elems)),
+        str(unique_function_values[i]),
         str(unique_vectors[i].length()),
         str(unique_vectors[i].elems)))
 
@@ -69,6 +69,37 @@ def generate_phil_scope():
           .type = float(value_min=0.0,value_max=1.0)
           .help = "The maximum percentage of total physical memory to use for"
                   "allocating shoebox arrays."
+
+        spool = False
+          .type = bool
+          .help = "Write the integrated reflections to disk as each block"
+                  "finishes rather than merging them into the reflection"
+                  "table in memory. Reflections split over block boundaries"
+                  "are kept in memory until all the blocks they span have"
+                  "finished. The blocks are then concatenated into a single"
+                  "file, which is only read once the input reflections have"
+                  "been released. Note that the reflections are then in the"
+                  "order in which the blocks finished, not the input order."
+
+        spool_directory = None
+          .type = path
+          .help = "The directory in which to spool the reflections. By"
+                  "default the current directory is used."
+      }
+
+      prefetch {
+
+        depth = 0
+          .type = int(value_min=0)
+          .help = "The number of images to read and decode ahead on a"
+                  "background thread while the current image is being"
+                  "processed. If 0, the images are read as they are needed."
+
+        max_memory_usage = 0.1
+          .type = float(value_min=0.0,value_max=1.0)
+          .help = "The maximum percentage of total physical memory to use for"
+                  "prefetched images. The prefetch depth is reduced if"
+                  "necessary."
       }
 
       debug {
@@ -146,6 +177,20 @@ def generate_phil_scope():
             .type = int(value_min=1)
             .help = "The minimum number of spots to use in each subsample."
 
+          cache_shoeboxes = False
+            .type = bool
+            .help = "Cache the reference shoeboxes to disk during profile"
+                    "modelling and validate the profiles using the cached"
+                    "shoeboxes rather than re-reading the images. Each image is"
+                    "then read at most twice: once for modelling and once for"
+                    "integration. Note that the shoeboxes for each block are"
+                    "kept in memory until the block has been processed."
+
+          cache_directory = None
+            .type = path
+            .help = "The directory in which to create the shoebox cache. If"
+                    "None, the current working directory is used."
+
         }
       }
 
@@ -187,6 +232,15 @@ def generate_phil_scope():
         nproc = 1
           .type = int(value_min=1)
           .help = "The number of processes to use per cluster job"
+
+        schedule = *static dynamic
+          .type = choice
+          .help = "How to assign blocks to processes. With static scheduling"
+                  "the blocks are processed in order. With dynamic scheduling"
+                  "the blocks are dispatched to processes on demand, starting"
+                  "with the blocks needing the most shoebox memory, so that"
+                  "processes are not left idle waiting for a few expensive"
+                  "blocks at the end of the job."
       }
 
       summation {
@@ -308,6 +362,8 @@ class Validation(object):
       def __init__(self):
         self.number_of_partitions = 2
         self.min_partition_size = 100
+        self.cache_shoeboxes = False
+        self.cache_directory = None
 
     def __init__(self):
       self.fitting = True
@@ -343,6 +399,7 @@ def from_phil(params):
     mp.method = params.mp.method
     mp.nproc = params.mp.nproc
     mp.njobs = params.mp.njobs
+    mp.schedule = params.mp.schedule
 
     # Set the lookup parameters
     lookup = processor.Lookup()
@@ -355,11 +412,24 @@ def from_phil(params):
     block.threshold = params.block.threshold
     block.force = params.block.force
     block.max_memory_usage = params.block.max_memory_usage
+    block.spool = params.block.spool
+    block.spool_directory = params.block.spool_directory
+
+    # The reference reflections for profile modelling are not spooled
+    modelling_block = processor.Block()
+    modelling_block.update(block)
+    modelling_block.spool = False
+
+    # Set the prefetch parameters
+    prefetch = processor.Prefetch()
+    prefetch.depth = params.prefetch.depth
+    prefetch.max_memory_usage = params.prefetch.max_memory_usage
 
     # Set the modelling processor parameters
     result.modelling.mp = mp
     result.modelling.lookup = lookup
-    result.modelling.block = block
+    result.modelling.block = modelling_block
+    result.modelling.prefetch = prefetch
     if params.debug.during == 'modelling':
       result.modelling.debug.output = params.debug.output
     result.modelling.debug.select = params.debug.select
@@ -369,6 +439,7 @@ def from_phil(params):
     result.integration.mp = mp
     result.integration.lookup = lookup
     result.integration.block = block
+    result.integration.prefetch = prefetch
     if params.debug.during == 'integration':
       result.integration.debug.output = params.debug.output
     result.integration.debug.select = params.debug.select
@@ -392,6 +463,10 @@ def from_phil(params):
       params.profile.validation.number_of_partitions
     result.profile.validation.min_partition_size = \
       params.profile.validation.min_partition_size
+    result.profile.validation.cache_shoeboxes = \
+      params.profile.validation.cache_shoeboxes
+    result.profile.validation.cache_directory = \
+      params.profile.validation.cache_directory
 
     # Return the result
     return result
@@ -489,6 +564,7 @@ def __call__(self):
     if True in [
       overlaps_scope.foreground_foreground.enable,
       overlaps_scope.foreground_background.enable,
+      overlaps_scope.shoebox_fraction.enable,
       ]:
       from dials.algorithms.integration.overlaps_filter import OverlapsFilterMultiExpt
       overlaps_filter = OverlapsFilterMultiExpt(self.reflections, self.experiments)
@@ -496,6 +572,9 @@ def __call__(self):
         overlaps_filter.remove_foreground_foreground_overlaps()
       if overlaps_scope.foreground_background.enable:
         overlaps_filter.remove_foreground_background_overlaps()
+      if overlaps_scope.shoebox_fraction.enable:
+        overlaps_filter.remove_shoebox_overlaps(
+          overlaps_scope.shoebox_fraction.max_fraction)
       self.reflections = overlaps_filter.refl
 
 class FinalizerRot(FinalizerBase):
@@ -975,6 +1054,8 @@ def integrate(self):
     from dials.array_family import flex
     from dials.algorithms.profile_model.modeller import MultiExpProfileModeller
     from dials.algorithms.integration.validation import ValidatedMultiExpProfileModeller
+    from tempfile import mkdtemp
+    from os import getcwd
 
     # Ensure we get the same random sample each time
     seed(0)
@@ -1073,83 +1154,20 @@ def integrate(self):
             profile_fitter_single.add(expr.profile.fitting_class()(expr))
           profile_fitter.add(profile_fitter_single)
 
-        # Create the data processor
-        executor = ProfileModellerExecutor(
-          self.experiments,
-          profile_fitter)
-        processor = ProcessorBuilder(
-          self.ProcessorClass,
-          self.experiments,
-          reference,
-          self.params.modelling).build()
-        processor.executor = executor
-
-        # Process the reference profiles
-        reference, profile_fitter_list, time_info = processor.process()
-
-        # Set the reference spots info
-        #self.reflections.set_selected(selection, reference)
-
-        # Finalize the profile models for validation
-        assert len(profile_fitter_list) > 0, "No profile fitters"
-        profile_fitter = None
-        for index, pf in profile_fitter_list.iteritems():
-          if pf is None:
-            continue
-          if profile_fitter is None:
-            profile_fitter = pf
-          else:
-            profile_fitter.accumulate(pf)
-        profile_fitter.finalize()
-
-        # Get the finalized modeller
-        finalized_profile_fitter = profile_fitter.finalized_model()
-
-        # Print profiles
-        if self.params.debug_reference_output:
-          reference_debug = []
-          for i in range(len(finalized_profile_fitter)):
-            m = finalized_profile_fitter[i]
-            p = []
-            for j in range(len(m)):
-              try:
-                p.append((m.data(j), m.mask(j)))
-              except Exception:
-                p.append(None)
-          reference_debug.append(p)
-          with open(self.params.debug_reference_filename, "wb") as outfile:
-            import cPickle as pickle
-            pickle.dump(reference_debug, outfile)
-
-        for i in range(len(finalized_profile_fitter)):
-          m = finalized_profile_fitter[i]
-          logger.debug("")
-          logger.debug("Profiles for experiment %d" % i)
-          for j in range(len(m)):
-            logger.debug("Profile %d" % j)
-            try:
-              logger.debug(pprint.profile3d(m.data(j)))
-            except Exception:
-              logger.debug("** NO PROFILE **")
-
-        # Print the modeller report
-        self.profile_model_report = ProfileModelReport(
-          self.experiments,
-          finalized_profile_fitter,
-          reference)
-        logger.info("")
-        logger.info(self.profile_model_report.as_str(prefix=' '))
-
-        # Print the time info
-        logger.info("")
-        logger.info(str(time_info))
-        logger.info("")
-
-        # If we have more than 1 fold then do the validation
-        if num_folds > 1:
+        # Remove the shoebox cache however modelling and validation end
+        try:
+          # If validating then optionally cache the reference shoeboxes so that
+          # the images don't need to be read again for the validation
+          if num_folds > 1 and self.params.profile.validation.cache_shoeboxes:
+            self.params.modelling.cache.directory = mkdtemp(
+              prefix='shoebox_cache_',
+              dir=self.params.profile.validation.cache_directory or getcwd())
+            self.params.modelling.cache.mode = 'write'
+            logger.info(" Caching reference shoeboxes in %s\n" %
+                        self.params.modelling.cache.directory)
 
           # Create the data processor
-          executor = ProfileValidatorExecutor(
+          executor = ProfileModellerExecutor(
             self.experiments,
             profile_fitter)
           processor = ProcessorBuilder(
@@ -1160,22 +1178,103 @@ def integrate(self):
           processor.executor = executor
 
           # Process the reference profiles
-          reference, validation, time_info = processor.process()
+          reference, profile_fitter_list, time_info = processor.process()
+
+          # Set the reference spots info
+          #self.reflections.set_selected(selection, reference)
+
+          # Finalize the profile models for validation
+          assert len(profile_fitter_list) > 0, "No profile fitters"
+          profile_fitter = None
+          for index, pf in profile_fitter_list.iteritems():
+            if pf is None:
+              continue
+            if profile_fitter is None:
+              profile_fitter = pf
+            else:
+              profile_fitter.accumulate(pf)
+          profile_fitter.finalize()
+
+          # Get the finalized modeller
+          finalized_profile_fitter = profile_fitter.finalized_model()
+
+          # Print profiles
+          if self.params.debug_reference_output:
+            reference_debug = []
+            for i in range(len(finalized_profile_fitter)):
+              m = finalized_profile_fitter[i]
+              p = []
+              for j in range(len(m)):
+                try:
+                  p.append((m.data(j), m.mask(j)))
+                except Exception:
+                  p.append(None)
+            reference_debug.append(p)
+            with open(self.params.debug_reference_filename, "wb") as outfile:
+              import cPickle as pickle
+              pickle.dump(reference_debug, outfile)
+
+          for i in range(len(finalized_profile_fitter)):
+            m = finalized_profile_fitter[i]
+            logger.debug("")
+            logger.debug("Profiles for experiment %d" % i)
+            for j in range(len(m)):
+              logger.debug("Profile %d" % j)
+              try:
+                logger.debug(pprint.profile3d(m.data(j)))
+              except Exception:
+                logger.debug("** NO PROFILE **")
 
           # Print the modeller report
-          self.profile_validation_report = ProfileValidationReport(
+          self.profile_model_report = ProfileModelReport(
             self.experiments,
-            profile_fitter,
-            reference,
-            num_folds)
+            finalized_profile_fitter,
+            reference)
           logger.info("")
-          logger.info(self.profile_validation_report.as_str(prefix=' '))
+          logger.info(self.profile_model_report.as_str(prefix=' '))
 
           # Print the time info
           logger.info("")
           logger.info(str(time_info))
           logger.info("")
 
+          # If we have more than 1 fold then do the validation
+          if num_folds > 1:
+
+            # Read the cached shoeboxes if available
+            if self.params.modelling.cache.mode == 'write':
+              self.params.modelling.cache.mode = 'read'
+
+            # Create the data processor
+            executor = ProfileValidatorExecutor(
+              self.experiments,
+              profile_fitter)
+            processor = ProcessorBuilder(
+              self.ProcessorClass,
+              self.experiments,
+              reference,
+              self.params.modelling).build()
+            processor.executor = executor
+
+            # Process the reference profiles
+            reference, validation, time_info = processor.process()
+
+            # Print the modeller report
+            self.profile_validation_report = ProfileValidationReport(
+              self.experiments,
+              profile_fitter,
+              reference,
+              num_folds)
+            logger.info("")
+            logger.info(self.profile_validation_report.as_str(prefix=' '))
+
+            # Print the time info
+            logger.info("")
+            logger.info(str(time_info))
+            logger.info("")
+        finally:
+          self._clear_shoebox_cache()
+
         # Set to the finalized fitter
         profile_fitter = finalized_profile_fitter
 
@@ -1195,8 +1294,20 @@ def integrate(self):
       self.params.integration).build()
     processor.executor = executor
 
-    # Process the reflections
-    self.reflections, _, time_info = processor.process()
+    # Process the reflections. If they are spooled then the processor takes
+    # over the input reflections, releasing them as the jobs are processed,
+    # and returns the file the processed reflections were written to.
+    if self.params.integration.block.spool:
+      from os import remove
+      self.reflections = None
+      filename, _, time_info = processor.process()
+      del processor
+      try:
+        self.reflections = flex.reflection_table.from_file(filename)
+      finally:
+        remove(filename)
+    else:
+      self.reflections, _, time_info = processor.process()
 
     # Finalize the reflections
     finalize = self.FinalizerClass(
@@ -1221,6 +1332,17 @@ def integrate(self):
     # Return the reflections
     return self.reflections
 
+  def _clear_shoebox_cache(self):
+    '''
+    Delete the cached reference shoeboxes
+
+    '''
+    from shutil import rmtree
+    if self.params.modelling.cache.directory is not None:
+      rmtree(self.params.modelling.cache.directory, ignore_errors=True)
+    self.params.modelling.cache.directory = None
+    self.params.modelling.cache.mode = None
+
   def report(self):
     '''
     Return the report of the processing
@@ -1327,13 +1449,15 @@ class IntegratorFactory(object):
   '''
 
   @staticmethod
-  def create(params, experiments, reflections):
+  def create(params, experiments, reflections, parameters=None):
     '''
     Create the integrator from the input configuration.
 
     :param params: The input phil parameters
     :param experiments: The list of experiments
     :param reflections: The reflections to integrate
+    :param parameters: Integration parameters converted from the phil
+                       parameters by a previous call, to reuse
     :return: The integrator class
 
     '''
@@ -1396,8 +1520,12 @@ def create(params, experiments, reflections):
       for experiment in experiments:
         experiment.scan = None
 
+    # Convert the phil parameters if necessary
+    if parameters is None:
+      parameters = Parameters.from_phil(params.integration)
+
     # Return an instantiation of the class
     return IntegratorClass(
       experiments,
       reflections,
-      Parameters.from_phil(params.integration))
+      parameters)
@@ -16,6 +16,15 @@
       .help = "Remove all spots in which neighbors' foreground"
               "impinges on the spot's background"
   }
+  shoebox_fraction {
+    enable = False
+      .type = bool
+      .help = "Remove all spots in which the fraction of the shoebox"
+              "overlapped by neighbouring shoeboxes exceeds max_fraction"
+    max_fraction = 0.5
+      .type = float(value_min=0, value_max=1)
+      .help = "The maximum fraction of the shoebox which may be overlapped"
+  }
 }
 """, process_includes=True)
 
@@ -132,6 +141,20 @@ def is_overlap(code):
       return self.is_fgd(code) and self.is_bgd(code)
     self.refl = self.refl.select(self.filter_using_simple_mask(mask_lambda=is_overlap))
 
+  def compute_shoebox_overlap_fraction(self):
+    """Return the fraction of each shoebox overlapped by the shoeboxes of the
+    other observations on the same panel.
+    """
+    from dials.algorithms.shoebox import OverlapFinder
+    find_overlapping = OverlapFinder()
+    overlaps = find_overlapping(
+      flex.size_t(len(self.refl), 0), self.refl['panel'], self.refl['bbox'])
+    return self.refl.compute_shoebox_overlap_fraction(overlaps)
+
+  def remove_shoebox_overlaps(self, max_fraction):
+    self.refl = self.refl.select(
+      self.compute_shoebox_overlap_fraction() <= max_fraction)
+
 class OverlapsFilterMultiExpt(object):
 
   def __init__(self, refl, expt):
@@ -145,6 +168,10 @@ def remove_foreground_background_overlaps(self):
     for f in self.filters:
       f.remove_foreground_background_overlaps()
 
+  def remove_shoebox_overlaps(self, max_fraction):
+    for f in self.filters:
+      f.remove_shoebox_overlaps(max_fraction)
+
   @property
   def refl(self):
     rlist = [f.refl for f in self.filters]
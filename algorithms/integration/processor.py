@@ -42,12 +42,14 @@ def __init__(self):
     self.nproc = 1
     self.njobs = 1
     self.nthreads = 1
+    self.schedule = "static"
 
   def update(self, other):
     self.method = other.method
     self.nproc = other.nproc
     self.njobs = other.njobs
     self.nthreads = other.nthreads
+    self.schedule = other.schedule
 
 class Lookup(object):
   '''
@@ -71,6 +73,8 @@ def __init__(self):
     self.threshold = 0.99
     self.force = False
     self.max_memory_usage = 0.75
+    self.spool = False
+    self.spool_directory = None
 
   def update(self, other):
     self.size = other.size
@@ -78,6 +82,8 @@ def update(self, other):
     self.threshold = other.threshold
     self.force = other.force
     self.max_memory_usage = other.max_memory_usage
+    self.spool = other.spool
+    self.spool_directory = other.spool_directory
 
 class Shoebox(object):
   '''
@@ -109,6 +115,44 @@ def update(self, other):
     self.split_experiments = other.split_experiments
     self.separate_files = other.separate_files
 
+class Cache(object):
+  '''
+  Shoebox cache parameters
+
+  '''
+  def __init__(self):
+    self.directory = None
+    self.mode = None
+
+  def update(self, other):
+    self.directory = other.directory
+    self.mode = other.mode
+
+  def filename(self, index):
+    '''
+    Get the cache filename for a job
+
+    :param index: The job index
+    :return: The filename
+
+    '''
+    from os.path import join
+    assert self.directory is not None, "No cache directory set"
+    return join(self.directory, 'shoeboxes_%d.pickle' % index)
+
+class Prefetch(object):
+  '''
+  Image prefetch parameters
+
+  '''
+  def __init__(self):
+    self.depth = 0
+    self.max_memory_usage = 0.1
+
+  def update(self, other):
+    self.depth = other.depth
+    self.max_memory_usage = other.max_memory_usage
+
 class Parameters(object):
   '''
   Class to handle parameters for the processor
@@ -124,6 +168,8 @@ def __init__(self):
     self.block = Block()
     self.shoebox = Shoebox()
     self.debug = Debug()
+    self.cache = Cache()
+    self.prefetch = Prefetch()
 
   def update(self, other):
     '''
@@ -135,6 +181,8 @@ def update(self, other):
     self.block.update(other.block)
     self.shoebox.update(other.shoebox)
     self.debug.update(other.debug)
+    self.cache.update(other.cache)
+    self.prefetch.update(other.prefetch)
 
 
 class TimingInfo(object):
@@ -150,12 +198,26 @@ def __init__(self):
     self.finalize = 0
     self.total = 0
     self.user = 0
+    self.read_wait = 0
+    self.num_images_read = 0
+
+  def read_overlap(self):
+    '''
+    The fraction of the read time hidden behind processing by prefetching.
+
+    '''
+    if self.read <= 0:
+      return 0
+    return max(0, 1.0 - self.read_wait / self.read)
 
   def __str__(self):
     ''' Convert to string. '''
     from libtbx.table_utils import format as table
     rows = [
+      ["Images read"      , "%d" % (self.num_images_read)      ],
       ["Read time"        , "%.2f seconds" % (self.read)       ],
+      ["Read wait time"   , "%.2f seconds" % (self.read_wait)  ],
+      ["Read overlap"     , "%.1f %%" % (100*self.read_overlap())],
       ["Extract time"     , "%.2f seconds" % (self.extract)    ],
       ["Pre-process time" , "%.2f seconds" % (self.initialize) ],
       ["Process time"     , "%.2f seconds" % (self.process)    ],
@@ -228,51 +290,70 @@ def process(self):
     '''
     from time import time
     from dials.util.mp import multi_node_parallel_map
+    from dials.util.mp import dynamic_multi_node_parallel_map
     import platform
     from math import ceil
     start_time = time()
-    self.manager.initialize()
-    mp_method = self.manager.params.mp.method
-    mp_njobs = self.manager.params.mp.njobs
-    mp_nproc = self.manager.params.mp.nproc
-    if (mp_njobs * mp_nproc) > 1 and platform.system() == "Windows": # platform.system() forks which is bad for MPI, so don't use it unless nproc > 1
-      logger.warn("")
-      logger.warn("*" * 80)
-      logger.warn("Multiprocessing is not available on windows. Setting nproc = 1")
-      logger.warn("*" * 80)
-      logger.warn("")
-      mp_nproc = 1
-      mp_njobs = 1
-    assert mp_nproc > 0, "Invalid number of processors"
-    if mp_nproc * mp_njobs > len(self.manager):
-      mp_nproc = min(mp_nproc, len(self.manager))
-      mp_njobs = int(ceil(len(self.manager) / mp_nproc))
-    logger.info(self.manager.summary())
-    if mp_njobs > 1:
-      assert mp_method is not 'none' and mp_method is not None
-      logger.info(' Using %s with %d parallel job(s) and %d processes per node\n' % (mp_method, mp_njobs, mp_nproc))
-    else:
-      logger.info(' Using multiprocessing with %d parallel job(s)\n' % (mp_nproc))
-    if mp_njobs * mp_nproc > 1:
-      def process_output(result):
-        for message in result[1]:
-          logger.log(message.levelno, message.msg)
-        self.manager.accumulate(result[0])
-        result[0].reflections = None
-        result[0].data = None
-      multi_node_parallel_map(
-        func                       = ExecuteParallelTask(),
-        iterable                   = list(self.manager.tasks()),
-        njobs                      = mp_njobs,
-        nproc                      = mp_nproc,
-        callback                   = process_output,
-        cluster_method             = mp_method,
-        preserve_order             = True,
-        preserve_exception_message = True)
-    else:
-      for task in self.manager.tasks():
-        self.manager.accumulate(task())
-    self.manager.finalize()
+    try:
+      self.manager.initialize()
+      mp_method = self.manager.params.mp.method
+      mp_njobs = self.manager.params.mp.njobs
+      mp_nproc = self.manager.params.mp.nproc
+      if (mp_njobs * mp_nproc) > 1 and platform.system() == "Windows": # platform.system() forks which is bad for MPI, so don't use it unless nproc > 1
+        logger.warn("")
+        logger.warn("*" * 80)
+        logger.warn("Multiprocessing is not available on windows. Setting nproc = 1")
+        logger.warn("*" * 80)
+        logger.warn("")
+        mp_nproc = 1
+        mp_njobs = 1
+      assert mp_nproc > 0, "Invalid number of processors"
+      if mp_nproc * mp_njobs > len(self.manager):
+        mp_nproc = min(mp_nproc, len(self.manager))
+        mp_njobs = int(ceil(len(self.manager) / mp_nproc))
+      logger.info(self.manager.summary())
+      if mp_njobs > 1:
+        assert mp_method is not 'none' and mp_method is not None
+        logger.info(' Using %s with %d parallel job(s) and %d processes per node\n' % (mp_method, mp_njobs, mp_nproc))
+      else:
+        logger.info(' Using multiprocessing with %d parallel job(s)\n' % (mp_nproc))
+      if mp_njobs * mp_nproc > 1:
+        tasks = list(self.manager.tasks())
+        def process_output(result):
+          for message in result[1]:
+            logger.log(message.levelno, message.msg)
+          self.manager.accumulate(result[0])
+          # Release the input reflections of the finished task
+          tasks[result[0].index].reflections = None
+          result[0].reflections = None
+          result[0].data = None
+        if self.manager.params.mp.schedule == 'dynamic':
+          logger.info(' Dispatching blocks on demand, largest first\n')
+          dynamic_multi_node_parallel_map(
+            func                       = ExecuteParallelTask(),
+            iterable                   = tasks,
+            costs                      = self.manager.costs(),
+            njobs                      = mp_njobs,
+            nproc                      = mp_nproc,
+            callback                   = process_output,
+            cluster_method             = mp_method,
+            preserve_exception_message = True)
+        else:
+          multi_node_parallel_map(
+            func                       = ExecuteParallelTask(),
+            iterable                   = tasks,
+            njobs                      = mp_njobs,
+            nproc                      = mp_nproc,
+            callback                   = process_output,
+            cluster_method             = mp_method,
+            preserve_order             = True,
+            preserve_exception_message = True)
+      else:
+        for task in self.manager.tasks():
+          self.manager.accumulate(task())
+      self.manager.finalize()
+    finally:
+      self.manager.cleanup()
     end_time = time()
     self.manager.time.user_time = end_time - start_time
     result1, result2 = self.manager.result()
@@ -324,13 +405,130 @@ def __call__(self):
 
     '''
     result = Result(self.index, self.reflections, None)
+    result.num_images_read = 0
     result.read_time = 0
+    result.read_wait_time = 0
     result.extract_time = 0
     result.process_time = 0
     result.total_time = 0
     return result
 
 
+class ImageReader(object):
+  '''
+  A class to read the images and masks of an imageset in order. If the depth
+  is greater than zero, up to that many images are decoded ahead on a
+  background thread while the caller processes the current image.
+
+  '''
+
+  def __init__(self, imageset, lookup_mask=None, depth=0):
+    '''
+    Initialise the reader.
+
+    :param imageset: The imageset to read
+    :param lookup_mask: An optional mask to combine with the image mask
+    :param depth: The number of images to prefetch
+
+    '''
+    assert depth >= 0, "Prefetch depth must be >= 0"
+    self.imageset = imageset
+    self.lookup_mask = lookup_mask
+    self.depth = depth
+    self.read_time = 0.0
+    self.wait_time = 0.0
+    self.num_read = 0
+
+  @staticmethod
+  def compute_image_memory(imageset):
+    '''
+    Estimate the memory needed for one corrected image and its mask.
+
+    :param imageset: The imageset
+    :return: The number of bytes
+
+    '''
+    num_pixels = 0
+    for panel in imageset.get_detector():
+      xsize, ysize = panel.get_image_size()
+      num_pixels += xsize * ysize
+    return num_pixels * (8 + 1)
+
+  def read(self, index):
+    '''
+    Read an image and its mask.
+
+    :param index: The index of the image in the imageset
+    :return: The image and mask
+
+    '''
+    from time import time
+    st = time()
+    image = self.imageset.get_corrected_data(index)
+    mask = self.imageset.get_mask(index)
+    if self.lookup_mask is not None:
+      assert len(mask) == len(self.lookup_mask), \
+        "Mask/Image are incorrect size %d %d" % (
+          len(mask),
+          len(self.lookup_mask))
+      mask = tuple(m1 & m2 for m1, m2 in zip(self.lookup_mask, mask))
+    self.read_time += time() - st
+    self.num_read += 1
+    return image, mask
+
+  def __iter__(self):
+    '''
+    Iterate through the images and masks.
+
+    '''
+    from time import time
+    if self.depth == 0:
+      for i in range(len(self.imageset)):
+        st = time()
+        item = self.read(i)
+        self.wait_time += time() - st
+        yield item
+      return
+
+    from Queue import Queue, Empty
+    from threading import Thread, Event
+    import sys
+
+    # Read the images on a single thread since the imageset is not thread safe
+    queue = Queue(maxsize=self.depth)
+    stop = Event()
+    def worker():
+      try:
+        for i in range(len(self.imageset)):
+          if stop.is_set():
+            return
+          queue.put((None, self.read(i)))
+      except Exception:
+        queue.put((sys.exc_info(), None))
+    thread = Thread(target=worker)
+    thread.daemon = True
+    thread.start()
+
+    # Yield the images as they become available. If iteration stops early,
+    # drain the queue so that the reader thread can finish
+    try:
+      for i in range(len(self.imageset)):
+        st = time()
+        error, item = queue.get()
+        self.wait_time += time() - st
+        if error is not None:
+          raise error[0], error[1], error[2]
+        yield item
+    finally:
+      stop.set()
+      while thread.is_alive():
+        try:
+          queue.get(timeout=0.1)
+        except Empty:
+          pass
+      thread.join()
+
+
 class Task(object):
   '''
   A class to perform a processing task.
@@ -426,13 +624,14 @@ def __call__(self):
       allocate=False,
       flatten=self.params.shoebox.flatten)
 
-    # Create the processor
+    # Create the processor. If the shoeboxes are to be cached then they need
+    # to be kept until all the frames have been processed
     processor = ShoeboxProcessor(
       self.reflections,
       len(imageset.get_detector()),
       frame0,
       frame1,
-      self.params.debug.output)
+      self.params.debug.output or self.params.cache.mode == 'write')
 
     # Compute percentage of max available. The function is not portable to
     # windows so need to add a check if the function fails. On windows no
@@ -462,20 +661,18 @@ def __call__(self):
         logger.info('  Required shoebox memory: %g GB' % (sbox_memory/1e9))
         logger.info('')
 
+    # Limit the number of prefetched images by the memory they may use
+    depth = self.params.prefetch.depth
+    if depth > 0 and total_memory is not None:
+      image_memory = ImageReader.compute_image_memory(imageset)
+      limit_memory = total_memory * self.params.prefetch.max_memory_usage
+      depth = min(depth, int(limit_memory // image_memory))
+      if depth < self.params.prefetch.depth:
+        logger.info(' Limiting image prefetch depth to %d' % depth)
+
     # Loop through the imageset, extract pixels and process reflections
-    read_time = 0.0
-    for i in range(len(imageset)):
-      st = time()
-      image = imageset.get_corrected_data(i)
-      mask = imageset.get_mask(i)
-      if self.params.lookup.mask is not None:
-        assert len(mask) == len(self.params.lookup.mask), \
-          "Mask/Image are incorrect size %d %d" % (
-            len(mask),
-            len(self.params.lookup.mask))
-        mask = tuple(m1 & m2 for m1, m2 in zip(self.params.lookup.mask, mask))
-
-      read_time += time() - st
+    reader = ImageReader(imageset, self.params.lookup.mask, depth)
+    for image, mask in reader:
       processor.next(make_image(image, mask), self.executor)
       del image
       del mask
@@ -494,6 +691,10 @@ def __call__(self):
       else:
         output.as_pickle('shoeboxes_%d.pickle' % self.index)
 
+    # Optionally cache the processed shoeboxes for a later processing run
+    if self.params.cache.mode == 'write':
+      self.reflections.as_pickle(self.params.cache.filename(self.index))
+
     # Delete the shoeboxes
     if self.params.debug.separate_files or not self.params.debug.output:
       del self.reflections['shoebox']
@@ -503,13 +704,221 @@ def __call__(self):
 
     # Return the result
     result = Result(self.index, self.reflections, self.executor.data())
-    result.read_time = read_time
+    result.num_images_read = reader.num_read
+    result.read_time = reader.read_time
+    result.read_wait_time = reader.wait_time
     result.extract_time = processor.extract_time()
     result.process_time = processor.process_time()
     result.total_time = time() - start_time
     return result
 
 
+class CachedTask(object):
+  '''
+  A class to perform a processing task using the shoeboxes cached by a
+  previous processing run rather than reading the images.
+
+  '''
+
+  def __init__(self,
+               index,
+               job,
+               reflections,
+               params,
+               executor=None):
+    '''
+    Initialise the task.
+
+    :param index: The index of the processing job
+    :param job: The frames to process
+    :param reflections: The list of reflections
+    :param params: The processing parameters
+    :param executor: The executor class
+
+    '''
+    assert executor is not None, "No executor given"
+    assert len(reflections) > 0, "Zero reflections given"
+    assert params.cache.mode == 'read', "Cache is not readable"
+    self.index = index
+    self.job = job
+    self.reflections = reflections
+    self.params = params
+    self.executor = executor
+
+  def __call__(self):
+    '''
+    Do the processing.
+
+    :return: The processed data
+
+    '''
+    from dials.array_family import flex
+    from time import time
+
+    # Get the start time
+    start_time = time()
+
+    # Set the global process ID
+    job.index = self.index
+
+    # Read the cached reflections and shoeboxes
+    st = time()
+    reflections = flex.reflection_table.from_pickle(
+      self.params.cache.filename(self.index))
+    read_time = time() - st
+    assert len(reflections) == len(self.reflections), \
+      "Cached shoeboxes do not match job %d" % self.index
+    assert "shoebox" in reflections, "Cache contains no shoeboxes"
+
+    # Initialize the executor
+    frame0, frame1 = self.job
+    self.executor.initialize(frame0, frame1, reflections)
+
+    # All the shoeboxes are complete so process them together
+    st = time()
+    self.executor.process(frame1 - 1, reflections)
+    process_time = time() - st
+
+    # Delete the shoeboxes
+    del reflections['shoebox']
+
+    # Finalize the executor
+    self.executor.finalize()
+
+    # Return the result
+    result = Result(self.index, reflections, self.executor.data())
+    result.num_images_read = 0
+    result.read_time = read_time
+    result.read_wait_time = read_time
+    result.extract_time = 0
+    result.process_time = process_time
+    result.total_time = time() - start_time
+    return result
+
+
+class ReflectionSpool(object):
+  '''
+  A class to write processed reflections to disk as each job finishes.
+  Reflections which have been split over job boundaries are kept in memory
+  until all their partials have been processed, so that the partials of a
+  reflection are always written together. Each job's reflections are written
+  as a chunk in the columnar format and the chunks are concatenated into a
+  single file once all the jobs have finished.
+
+  '''
+
+  def __init__(self, directory, reflections):
+    '''
+    Initialise the spool.
+
+    :param directory: The directory to write the chunks to
+    :param reflections: The reflections that will be processed
+
+    '''
+    import numpy as np
+    assert "partial_id" in reflections, "Reflections have no partial_id"
+    self.directory = directory
+    self.filenames = []
+    self.pending = None
+    self.pending_index = None
+
+    # Count the partials of each reflection which has been split. Reflections
+    # which are not integrated are not processed by any job.
+    partial_id = reflections['partial_id'].select(
+      ~reflections.get_flags(reflections.flags.dont_integrate))
+    partial_id, inverse = np.unique(
+      partial_id.as_numpy_array(), return_inverse=True)
+    count = np.bincount(inverse, minlength=len(partial_id))
+    self.split_id = partial_id[count > 1]
+    self.remaining = count[count > 1]
+    self.num_remaining = int(self.remaining.sum())
+
+  def append(self, reflections):
+    '''
+    Add the processed reflections from a job.
+
+    :param reflections: The processed reflections
+
+    '''
+    from dials.array_family import flex
+    import numpy as np
+
+    # Hold back the split reflections until all partials are available
+    if self.num_remaining > 0 and len(reflections) > 0:
+      partial_id = reflections['partial_id'].as_numpy_array()
+      index = np.searchsorted(self.split_id, partial_id)
+      index[index == len(self.split_id)] = 0
+      split = self.split_id[index] == partial_id
+      if split.any():
+        index = index[split]
+        np.subtract.at(self.remaining, index, 1)
+        self.num_remaining -= len(index)
+        held = reflections.select(flex.bool(split))
+        reflections = reflections.select(flex.bool(~split))
+        if self.pending is None:
+          self.pending = held
+          self.pending_index = index
+        else:
+          self.pending.extend(held)
+          self.pending_index = np.concatenate((self.pending_index, index))
+        complete = self.remaining[self.pending_index] == 0
+        if complete.any():
+          reflections.extend(self.pending.select(flex.bool(complete)))
+          self.pending = self.pending.select(flex.bool(~complete))
+          self.pending_index = self.pending_index[~complete]
+
+    # Write the complete reflections
+    if len(reflections) > 0:
+      filename = self.filename(len(self.filenames))
+      reflections.as_file(filename)
+      self.filenames.append(filename)
+
+  def filename(self, index):
+    '''
+    Get the filename for a chunk of reflections
+
+    :param index: The chunk index
+    :return: The filename
+
+    '''
+    from os.path import join
+    return join(self.directory, 'reflections_%d.refl' % index)
+
+  def finished(self):
+    '''
+    :return: True/False all split reflections have been written
+
+    '''
+    return self.num_remaining == 0
+
+  def write(self, filename):
+    '''
+    Concatenate the chunks into a single columnar file, without reading them
+    into memory.
+
+    :param filename: The output filename
+
+    '''
+    from dials.util import columnar
+    from os import remove
+    from os.path import exists
+    assert self.finished(), "Spool is not finished"
+    try:
+      columnar.concatenate(self.filenames, filename)
+    except Exception:
+      if exists(filename):
+        remove(filename)
+      raise
+
+  def cleanup(self):
+    '''
+    Delete the chunks
+
+    '''
+    from shutil import rmtree
+    rmtree(self.directory, ignore_errors=True)
+
+
 class Manager(object):
   '''
   A class to manage processing book-keeping
@@ -551,6 +960,8 @@ def initialize(self):
 
     '''
     from time import time
+    from tempfile import mkdtemp
+    from os import getcwd
 
     # Get the start time
     start_time = time()
@@ -564,8 +975,24 @@ def initialize(self):
     self.split_reflections()
     self.compute_processors()
 
-    # Create the reflection manager
-    self.manager = ReflectionManager(self.jobs, self.reflections)
+    # Optionally spool the processed reflections to disk. The reflections
+    # which are not integrated are not processed by any job so are written
+    # straight away. The rest are split into a table for each job so that the
+    # input reflections are not held for the whole of the processing.
+    if self.params.block.spool:
+      self.spool = ReflectionSpool(
+        mkdtemp(
+          prefix='reflection_spool_',
+          dir=self.params.block.spool_directory or getcwd()),
+        self.reflections)
+      self.spooled = set()
+      self.spool.append(self.reflections.select(
+        self.reflections.get_flags(self.reflections.flags.dont_integrate)))
+      self.split_jobs()
+    else:
+      self.spool = None
+      self.manager = ReflectionManager(self.jobs, self.reflections)
+    self.num_tasks = len(self.manager)
 
     # Parallel reading of HDF5 from the same handle is not allowed. Python
     # multiprocessing is a bit messed up and used fork on linux so need to
@@ -589,12 +1016,24 @@ def task(self, index):
     assert expr_id[0] >= 0, "Invalid experiment id"
     assert expr_id[1] <= len(self.experiments), "Invalid experiment id"
     experiments = self.experiments#[expr_id[0]:expr_id[1]]
-    reflections = self.manager.split(index)
+    if self.spool is not None:
+      reflections = self.job_reflections[index]
+      self.job_reflections[index] = None
+      assert reflections is not None, "Task already built"
+    else:
+      reflections = self.manager.split(index)
     if len(reflections) == 0:
       logger.warn("*** WARNING: no reflections in job %d ***" % index)
       task = NullTask(
         index=index,
         reflections=reflections)
+    elif self.params.cache.mode == 'read':
+      task = CachedTask(
+        index=index,
+        job=frames,
+        reflections=reflections,
+        params=self.params,
+        executor=self.executor)
     else:
       task = Task(
         index=index,
@@ -613,11 +1052,28 @@ def tasks(self):
     for i in range(len(self)):
       yield self.task(i)
 
+  def costs(self):
+    '''
+    Estimate the cost of each task from the shoebox memory it needs.
+
+    :return: The list of costs
+
+    '''
+    return list(self.jobs.shoebox_memory(
+      self.reflections, self.params.shoebox.flatten))
+
   def accumulate(self, result):
     ''' Accumulate the results. '''
     self.data[result.index] = result.data
-    self.manager.accumulate(result.index, result.reflections)
+    if self.spool is not None:
+      assert result.index not in self.spooled, "Job already accumulated"
+      self.spool.append(result.reflections)
+      self.spooled.add(result.index)
+    else:
+      self.manager.accumulate(result.index, result.reflections)
+    self.time.num_images_read += result.num_images_read
     self.time.read += result.read_time
+    self.time.read_wait += result.read_wait_time
     self.time.extract += result.extract_time
     self.time.process += result.process_time
     self.time.total += result.total_time
@@ -633,7 +1089,23 @@ def finalize(self):
     start_time = time()
 
     # Check manager is finished
-    assert self.manager.finished(), "Manager is not finished"
+    assert self.jobs_finished(), "Manager is not finished"
+
+    # Write the spooled reflections to a single file next to the spool
+    # directory, then release the input reflections
+    if self.spool is not None:
+      from os.path import dirname
+      from tempfile import mkstemp
+      from os import close
+      handle, self.spool_filename = mkstemp(
+        prefix='reflection_spool_',
+        suffix='.refl',
+        dir=dirname(self.spool.directory))
+      close(handle)
+      self.spool.write(self.spool_filename)
+      self.reflections = None
+      self.manager = None
+      self.job_reflections = None
 
     # Update the time and finalized flag
     self.time.finalize = time() - start_time
@@ -647,8 +1119,29 @@ def result(self):
 
     '''
     assert self.finalized, "Manager is not finalized"
+    if self.spool is not None:
+      return self.spool_filename, self.data
     return self.manager.data(), self.data
 
+  def cleanup(self):
+    '''
+    Delete the spooled chunks, whether or not processing succeeded.
+
+    '''
+    if getattr(self, 'spool', None) is not None:
+      self.spool.cleanup()
+
+  def jobs_finished(self):
+    '''
+    Return if the results of all the jobs have been accumulated.
+
+    :return: True/False all jobs have been accumulated
+
+    '''
+    if self.spool is not None:
+      return len(self.spooled) == len(self) and self.spool.finished()
+    return self.manager.finished()
+
   def finished(self):
     '''
     Return if all tasks have finished.
@@ -656,7 +1149,7 @@ def finished(self):
     :return: True/False all tasks have finished
 
     '''
-    return self.finalized and self.manager.finished()
+    return self.finalized and self.jobs_finished()
 
   def __len__(self):
     '''
@@ -665,7 +1158,7 @@ def __len__(self):
     :return: the number of tasks
 
     '''
-    return len(self.manager)
+    return self.num_tasks
 
   def compute_blocks(self):
     '''
@@ -754,6 +1247,34 @@ def split_reflections(self):
     # Compute the partiality
     self.reflections.compute_partiality(self.experiments)
 
+  def split_jobs(self):
+    '''
+    Split the reflections into a table for each job. The input reflections
+    are split a column at a time and each column is deleted once it has been
+    copied, so that the input is released as it is split. Only the columns
+    needed to look up the jobs are kept.
+
+    '''
+    from dials.array_family import flex
+
+    # Find the rows of each job
+    lookup = flex.reflection_table()
+    for key in ['id', 'flags', 'bbox']:
+      lookup[key] = self.reflections[key]
+    lookup['row'] = flex.size_t_range(len(lookup))
+    self.manager = ReflectionManager(self.jobs, lookup)
+    rows = [self.manager.split(i)['row'] for i in range(len(self.manager))]
+    del lookup['row']
+
+    # Move the columns into the job tables
+    self.job_reflections = [flex.reflection_table() for r in rows]
+    for key in list(self.reflections.keys()):
+      column = self.reflections[key]
+      del self.reflections[key]
+      for table, r in zip(self.job_reflections, rows):
+        table[key] = column.select(r)
+    self.reflections = lookup
+
   def compute_processors(self):
     '''
     Compute the number of processors
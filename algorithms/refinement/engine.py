@@ -439,6 +439,17 @@ def set_nproc(self, nproc):
     self._nproc = nproc
     return
 
+  def set_persistent_workers(self, persistent):
+    """Keep worker processes alive between steps of refinement. Override in
+    derived classes that support this"""
+    if persistent:
+      raise NotImplementedError()
+    return
+
+  def close_workers(self):
+    """Release any worker processes kept alive between steps of refinement"""
+    return
+
   def run(self):
     """
     To be implemented by derived class. It is expected that each step of
@@ -457,6 +468,11 @@ def set_nproc(self, nproc):
       raise NotImplementedError()
     return
 
+  def set_persistent_workers(self, persistent):
+    if persistent:
+      raise NotImplementedError()
+    return
+
 
 class AdaptLbfgs(Refinery):
   """Adapt Refinery for L-BFGS minimiser"""
@@ -603,6 +619,40 @@ def compute_functional_gradients_diag(self):
     return self._f, self._g, diags
 
 
+# The refinery used by persistent worker processes. This is set before the
+# workers are forked, so each worker holds its own copy
+_worker_refinery = None
+
+def _build_up_normal_equations(args):
+  """Accumulate the normal equations for a share of the blocks of matches in
+  a persistent worker process. The worker first brings its copy of the
+  refinery up to date with the parameter vector, if that has changed. Only
+  the residuals and weights (for the objective), and the normal matrix and
+  right hand side are returned to the parent."""
+
+  x, iworker, nworkers = args
+  refinery = _worker_refinery
+  if refinery._worker_x != x:
+    refinery.x = flex.double(x)
+    refinery.prepare_for_step()
+    refinery._worker_x = x
+
+  eqns = normal_eqns.non_linear_ls(n_parameters = len(refinery.x))
+  residuals = flex.double()
+  weights = flex.double()
+  blocks = refinery._target.split_matches_into_blocks(nproc = nworkers)
+  for block in blocks[iworker::nworkers]:
+    r, j, w = refinery._target.compute_residuals_and_gradients(block)
+    if refinery._constr_manager is not None:
+      j = refinery._constr_manager.constrain_jacobian(j)
+    eqns.add_equations(r, j, w)
+    residuals.extend(r)
+    weights.extend(w)
+  step_equations = eqns.step_equations()
+  return (residuals, weights,
+          step_equations.normal_matrix_packed_u().deep_copy(),
+          step_equations.right_hand_side().deep_copy())
+
 class AdaptLstbx(
     Refinery,
     normal_eqns.non_linear_ls,
@@ -622,8 +672,52 @@ def __init__(self, target, prediction_parameterisation, constraints_manager=None
     # keep attribute for the Cholesky factor required for ESD calculation
     self.cf = None
 
+    # worker processes kept alive between steps, if requested
+    self._persistent_workers = False
+    self._pool = None
+    self._worker_x = None
+
     normal_eqns.non_linear_ls.__init__(self, n_parameters = len(self.x))
 
+  def set_persistent_workers(self, persistent):
+    self._persistent_workers = persistent
+    return
+
+  def close_workers(self):
+    if self._pool is not None:
+      self._pool.close()
+      self._pool.join()
+      self._pool = None
+    return
+
+  def _build_up_with_persistent_workers(self):
+    """Accumulate the normal equations in persistent worker processes. Each
+    step only the parameter vector is sent to the workers, which predict the
+    reflections themselves and return the normal matrix and right hand side
+    for their share of the matches. These are summed here."""
+
+    global _worker_refinery
+    if self._pool is None:
+      import multiprocessing
+      _worker_refinery = self
+      try:
+        self._pool = multiprocessing.Pool(processes = self._nproc)
+      finally:
+        _worker_refinery = None
+
+    x = tuple(self.x)
+    results = self._pool.map(_build_up_normal_equations,
+      [(x, i, self._nproc) for i in range(self._nproc)])
+
+    # The normal matrix and right hand side are updated in place
+    normal_matrix = self.step_equations().normal_matrix_packed_u()
+    right_hand_side = self.step_equations().right_hand_side()
+    for residuals, weights, a, b in results:
+      self.add_residuals(residuals, weights)
+      normal_matrix += a
+      right_hand_side += b
+    return
+
   def restart(self):
     self.x = self.x_0.deep_copy()
     self.old_x = None
@@ -651,12 +745,17 @@ def build_up(self, objective_only=False):
       residuals, weights = self._target.compute_residuals()
       self.add_residuals(residuals, weights)
     else:
-      blocks = self._target.split_matches_into_blocks(nproc = self._nproc)
+      if self._nproc > 1 and self._persistent_workers:
+
+        # ensure the jacobian is not tracked
+        self._jacobian = None
+        self._build_up_with_persistent_workers()
 
-      if self._nproc > 1:
+      elif self._nproc > 1:
 
         # ensure the jacobian is not tracked
         self._jacobian = None
+        blocks = self._target.split_matches_into_blocks(nproc = self._nproc)
 
         # processing functions
         def task_wrapper(block):
@@ -686,6 +785,7 @@ def callback_wrapper(result):
           )
 
       else:
+        blocks = self._target.split_matches_into_blocks(nproc = self._nproc)
         for block in blocks:
           residuals, self._jacobian, weights = \
             self._target.compute_residuals_and_gradients(block)
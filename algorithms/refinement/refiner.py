@@ -61,6 +61,15 @@
               "engine support nproc > 1. Where multiprocessing is possible,"
               "it is helpful only in certain circumstances, so this is not"
               "recommended for typical use."
+
+    persistent_workers = False
+      .type = bool
+      .help = "For the GaussNewton and LevMar engines with nproc > 1, keep"
+              "the worker processes alive between steps of refinement. Each"
+              "step only the parameter vector is sent to the workers, which"
+              "predict the reflections and reduce their share of the"
+              "Jacobian to a normal matrix and right hand side, so the"
+              "Jacobian itself is never transferred."
   }
 
   verbosity = 0
@@ -1436,6 +1445,12 @@ def config_refinery(params, target, pred_param, constraints_manager,
       except NotImplementedError:
         logger.warning("Could not set nproc={0} for refinement engine of type {1}".format(
           nproc, options.engine))
+      if params.refinement.mp.persistent_workers:
+        try:
+          engine.set_persistent_workers(True)
+        except NotImplementedError:
+          logger.warning("Could not use persistent workers for refinement engine of type {0}".format(
+            options.engine))
 
     return engine
 
@@ -1968,7 +1983,10 @@ def run(self):
       for i, crystal in enumerate(self._experiments.crystals()):
         logger.debug(ordinal_number(i) + ' ' + str(crystal))
 
-    self._refinery.run()
+    try:
+      self._refinery.run()
+    finally:
+      self._refinery.close_workers()
 
     # These involve calculation, so skip them when verbosity is zero, even
     # though the logger is disabled
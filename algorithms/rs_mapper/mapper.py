@@ -0,0 +1,375 @@
+#
+# mapper.py
+#
+#  This code is distributed under the BSD license, a copy of which is
+#  included in the root directory of this package.
+
+from __future__ import absolute_import, division
+import math
+import logging
+logger = logging.getLogger(__name__)
+
+
+class DenseVoxelGrid(object):
+  '''
+  Accumulate the sum of the pixel values and the number of pixels in each
+  voxel of a dense grid.
+
+  '''
+
+  def __init__(self, grid_size):
+    '''
+    Initialise the grid
+
+    :param grid_size: The number of voxels along each axis
+
+    '''
+    from scitbx.array_family import flex
+    self.grid_size = grid_size
+    self.grid = flex.double(flex.grid(grid_size, grid_size, grid_size), 0)
+    self.cnts = flex.int(flex.grid(grid_size, grid_size, grid_size), 0)
+
+  def add_frame(self, image, rotated_S, xy, rec_range):
+    '''
+    Add the pixels of a panel on a frame to the grid
+
+    :param image: The panel image
+    :param rotated_S: The reciprocal space coordinate of each pixel
+    :param xy: The pixel coordinates
+    :param rec_range: The reciprocal space extent of the grid
+
+    '''
+    import dials.algorithms.rs_mapper as recviewer
+    recviewer.fill_voxels(image, self.grid, self.cnts, rotated_S, xy, rec_range)
+
+  def merge(self, other):
+    '''
+    Add the sums and counts from another grid
+
+    :param other: The other grid
+
+    '''
+    self.grid += other.grid
+    self.cnts += other.cnts
+
+  def as_map(self):
+    '''
+    Get the average pixel value in each voxel
+
+    :return: The map as a flex.double grid
+
+    '''
+    import dials.algorithms.rs_mapper as recviewer
+    recviewer.normalize_voxels(self.grid, self.cnts)
+    return self.grid
+
+  def write_ccp4_map(self, filename, unit_cell, labels):
+    '''
+    Write the average pixel value in each voxel to a CCP4 map file
+
+    :param filename: The map filename
+    :param unit_cell: The unit cell of the map
+    :param labels: The labels for the map header
+
+    '''
+    from cctbx import sgtbx
+    from iotbx import ccp4_map
+    from scitbx.array_family import flex
+    grid = self.as_map()
+    ccp4_map.write_ccp4_map(filename, unit_cell, sgtbx.space_group("P1"),
+                            (0, 0, 0), grid.all(), grid,
+                            flex.std_string(labels))
+
+
+class TiledVoxelGrid(object):
+  '''
+  Accumulate the sum of the pixel values and the number of pixels in each
+  voxel of a grid which is split into cubic tiles. A tile is only allocated
+  when a pixel first falls into it, so only the tiles near the Ewald spheres
+  swept out by the frames use any memory, and only those tiles are passed
+  between processes.
+
+  '''
+
+  def __init__(self, grid_size, tile_size=32):
+    '''
+    Initialise the grid
+
+    :param grid_size: The number of voxels along each axis
+    :param tile_size: The number of voxels along each axis of a tile
+
+    '''
+    self.grid_size = grid_size
+    self.tile_size = tile_size
+    self.tiles_per_axis = int(math.ceil(grid_size / tile_size))
+    self.tiles = {}
+
+  def add_frame(self, image, rotated_S, xy, rec_range):
+    '''
+    Add the pixels of a panel on a frame to the grid
+
+    :param image: The panel image
+    :param rotated_S: The reciprocal space coordinate of each pixel
+    :param xy: The pixel coordinates
+    :param rec_range: The reciprocal space extent of the grid
+
+    '''
+    import numpy as np
+    npoints = self.grid_size
+    step = 2 * rec_range / npoints
+
+    # The voxel index of each pixel, computed as in fill_voxels
+    S = rotated_S.as_double().as_numpy_array().reshape(-1, 3)
+    index = np.trunc(S / step + npoints // 2 + 0.5).astype(np.int64)
+    valid = ((index >= 0) & (index < npoints)).all(axis=1)
+    xy = xy.as_double().as_numpy_array().reshape(-1, 2).astype(np.int64)
+    image = image.as_numpy_array()
+    values = image.ravel()[xy[valid,1] * image.shape[1] + xy[valid,0]]
+    self.add(index[valid], values.astype(np.float64))
+
+  def add(self, index, values):
+    '''
+    Add values to the voxels
+
+    :param index: The (n, 3) array of voxel indices
+    :param values: The values to add
+
+    '''
+    import numpy as np
+    T = self.tile_size
+    nt = self.tiles_per_axis
+    tile_index = index // T
+    tile = (tile_index[:,0] * nt + tile_index[:,1]) * nt + tile_index[:,2]
+    local = index - tile_index * T
+    offset = (local[:,0] * T + local[:,1]) * T + local[:,2]
+
+    # Sort by tile so that each tile is a contiguous segment
+    order = np.argsort(tile)
+    tile = tile[order]
+    offset = offset[order]
+    values = values[order]
+    starts = np.flatnonzero(np.concatenate(([True], tile[1:] != tile[:-1])))
+    stops = np.append(starts[1:], len(tile))
+    for start, stop in zip(starts, stops):
+      sums, counts = self.tile(int(tile[start]))
+      sums += np.bincount(
+        offset[start:stop], weights=values[start:stop], minlength=T**3)
+      counts += np.bincount(offset[start:stop], minlength=T**3)
+
+  def tile(self, key):
+    '''
+    Get the sums and counts of a tile, allocating it if necessary
+
+    :param key: The tile index
+    :return: The sums and counts
+
+    '''
+    import numpy as np
+    if key not in self.tiles:
+      self.tiles[key] = (
+        np.zeros(self.tile_size**3, dtype=np.float64),
+        np.zeros(self.tile_size**3, dtype=np.int32))
+    return self.tiles[key]
+
+  def merge(self, other):
+    '''
+    Add the sums and counts from another grid
+
+    :param other: The other grid
+
+    '''
+    assert other.grid_size == self.grid_size
+    assert other.tile_size == self.tile_size
+    for key, (other_sums, other_counts) in other.tiles.iteritems():
+      if key in self.tiles:
+        sums, counts = self.tiles[key]
+        sums += other_sums
+        counts += other_counts
+      else:
+        self.tiles[key] = (other_sums, other_counts)
+
+  def write_ccp4_map(self, filename, unit_cell, labels):
+    '''
+    Write the average pixel value in each voxel to a CCP4 map file. The map is
+    written a slab of tiles at a time straight from the tiles, so the whole
+    map is never held in memory, and the tiles are released as they are
+    written, so the grid is empty afterwards. As with iotbx.ccp4_map, the
+    sections are along x and the map covers the grid points 0 to grid_size
+    inclusive along each axis, the last point repeating the first.
+
+    :param filename: The map filename
+    :param unit_cell: The unit cell of the map
+    :param labels: The labels for the map header
+
+    '''
+    import numpy as np
+    import struct
+    n = self.grid_size
+    T = self.tile_size
+    nt = self.tiles_per_axis
+    m = n + 1
+    stats = [None, None, 0.0, 0.0]
+    with open(filename, 'wb') as outfile:
+
+      def write(data):
+        for section in data:
+          values = section.astype(np.float64)
+          amin, amax = values.min(), values.max()
+          if stats[0] is None or amin < stats[0]:
+            stats[0] = amin
+          if stats[1] is None or amax > stats[1]:
+            stats[1] = amax
+          stats[2] += values.sum()
+          stats[3] += np.square(values).sum()
+          outfile.write(section.astype('<f4').tostring())
+
+      # Write the sections after the header and symmetry record
+      outfile.seek(1024 + 80)
+      keys = sorted(self.tiles.keys())
+      k = 0
+      first = None
+      for tx in range(nt):
+        x0, x1 = tx * T, min((tx + 1) * T, n)
+        slab = np.zeros((x1 - x0, m, m), dtype=np.float32)
+        while k < len(keys) and keys[k] // (nt * nt) == tx:
+          sums, counts = self.tiles.pop(keys[k])
+          average = np.where(
+            counts > 0, sums / np.maximum(counts, 1), sums).reshape(T, T, T)
+          del sums, counts
+          ty, tz = (keys[k] // nt) % nt, keys[k] % nt
+          y0, y1 = ty * T, min((ty + 1) * T, n)
+          z0, z1 = tz * T, min((tz + 1) * T, n)
+          slab[:,y0:y1,z0:z1] = average[:x1-x0,:y1-y0,:z1-z0]
+          k += 1
+        slab[:,n,:] = slab[:,0,:]
+        slab[:,:,n] = slab[:,:,0]
+        if first is None:
+          first = slab[0:1].copy()
+        write(slab)
+        del slab
+      write(first)
+
+      # Write the header and the P1 symmetry record
+      labels = labels[:10]
+      count = m ** 3
+      mean = stats[2] / count
+      rms = math.sqrt(max(stats[3] / count - mean ** 2, 0))
+      header = struct.pack(
+        '<10i6f3i3f3i12f15i4s4Bfi',
+        *([m, m, m, 2, 0, 0, 0, n, n, n] +
+          list(unit_cell.parameters()) +
+          [3, 2, 1, stats[0], stats[1], mean, 1, 80, 0] +
+          [0] * 12 + [0] * 15 +
+          ['MAP ', 0x44, 0x41, 0, 0, rms, len(labels)]))
+      header += ''.join(label[:80].ljust(80) for label in labels)
+      outfile.seek(0)
+      outfile.write(header.ljust(1024, ' '))
+      outfile.write('X,Y,Z'.ljust(80))
+
+
+class MappedFrames(object):
+  '''
+  The grid from mapping a range of frames.
+
+  '''
+
+  def __init__(self, frames, grid):
+    '''
+    Initialise the result
+
+    :param frames: The (first, last) frames which were mapped
+    :param grid: The grid
+
+    '''
+    self.frames = frames
+    self.grid = grid
+
+
+class ImagesetMapper(object):
+  '''
+  Map a range of frames of an imageset onto a reciprocal space grid, using
+  all the panels of the detector. The mapper can be pickled so that ranges
+  of frames can be mapped in different processes and the grids merged.
+
+  '''
+
+  def __init__(self, imageset, max_resolution, grid_size, reverse_phi=False,
+               tiled=False, tile_size=32):
+    '''
+    Initialise the mapper
+
+    :param imageset: The imageset
+    :param max_resolution: The resolution limit
+    :param grid_size: The number of voxels along each axis
+    :param reverse_phi: Reverse the direction of rotation
+    :param tiled: Use a tiled rather than a dense grid
+    :param tile_size: The number of voxels along each axis of a tile
+
+    '''
+    self.imageset = imageset
+    self.max_resolution = max_resolution
+    self.grid_size = grid_size
+    self.reverse_phi = reverse_phi
+    self.tiled = tiled
+    self.tile_size = tile_size
+
+  def make_grid(self):
+    '''
+    Create an empty grid
+
+    :return: The grid
+
+    '''
+    if self.tiled:
+      return TiledVoxelGrid(self.grid_size, self.tile_size)
+    return DenseVoxelGrid(self.grid_size)
+
+  def target_pixels(self):
+    '''
+    Get the pixels within the resolution limit and their reciprocal space
+    coordinates before rotation for each panel
+
+    :return: A list of (xy, S) for each panel
+
+    '''
+    import dials.algorithms.rs_mapper as recviewer
+    beam = self.imageset.get_beam()
+    s0 = beam.get_s0()
+    result = []
+    for panel, data in zip(self.imageset.get_detector(),
+                           self.imageset.get_raw_data(0)):
+      pixel_size = panel.get_pixel_size()
+      xlim, ylim = data.all()
+
+      # cache transformation
+      xy = recviewer.get_target_pixels(
+        panel, s0, xlim, ylim, self.max_resolution)
+
+      s1 = panel.get_lab_coord(xy * pixel_size[0]) # FIXME: assumed square pixel
+      s1 = s1 / s1.norms() * (1 / beam.get_wavelength())
+      result.append((xy, s1 - s0))
+    return result
+
+  def __call__(self, frames):
+    '''
+    Map a range of frames
+
+    :param frames: The (first, last) frames to map
+    :return: The frames and the grid
+
+    '''
+    rec_range = 1 / self.max_resolution
+    grid = self.make_grid()
+    pixels = self.target_pixels()
+    axis = self.imageset.get_goniometer().get_rotation_axis()
+    for i in range(*frames):
+      osc_range = self.imageset.get_scan(i).get_oscillation_range()
+      logger.debug(
+        "Oscillation range: %.1f - %.1f" % (osc_range[0], osc_range[1]))
+      angle = (osc_range[0] + osc_range[1]) / 2 / 180 * math.pi
+      if not self.reverse_phi: # FIXME: ???
+        angle *= -1
+      for image, (xy, S) in zip(self.imageset.get_raw_data(i), pixels):
+        rotated_S = S.rotate_around_origin(axis, angle)
+        grid.add_frame(image, rotated_S, xy, rec_range)
+    return MappedFrames(frames, grid)
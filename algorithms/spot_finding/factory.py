@@ -86,6 +86,15 @@ def generate_phil_scope():
                 "greater than this value, throw an exception"
         .type = float(value_min=0, value_max=1)
 
+      max_strong_pixel_fraction_action = *error exclude
+        .help = "What to do with an image where the fraction of strong pixels"
+                "is greater than max_strong_pixel_fraction. If error, throw"
+                "an exception. If exclude, find no spots on the image, report"
+                "it in a table of excluded images and continue with the"
+                "remaining images."
+        .type = choice
+        .expert_level = 1
+
       background_gradient
         .expert_level=2
       {
@@ -107,6 +116,26 @@ def generate_phil_scope():
       include scope dials.util.masking.phil_scope
     }
 
+    streaming
+      .expert_level = 1
+    {
+      enable = False
+        .type = bool
+        .help = "Label the spots in a sweep as the images are processed,"
+                "rather than once all the images have been processed. The"
+                "memory used then depends on the depth of the spots rather"
+                "than on the number of strong pixels in the sweep. Spot"
+                "filters which use all the spots, such as spot_density, are"
+                "applied to each chunk of spots separately."
+
+      chunk_frames = 50
+        .type = int(value_min=1)
+        .help = "When streaming, the number of images between converting the"
+                "finished spots to reflections."
+    }
+
+    include scope dials.util.image_cache.phil_scope
+
     mp {
       method = *none drmaa sge lsf pbs
         .type = choice
@@ -140,6 +169,42 @@ def generate_phil_scope():
 
 phil_scope = generate_phil_scope()
 
+class FilterColumns(object):
+  '''
+  The columns of spot data used by the filters. Each column is computed once,
+  when it is first used, and shared between all the filters.
+
+  '''
+
+  def __init__(self, observations=None, shoeboxes=None):
+    '''
+    Initialise with the spot data
+
+    :param observations: The observations
+    :param shoeboxes: The shoeboxes
+
+    '''
+    self.observations = observations
+    self.shoeboxes = shoeboxes
+    self._columns = {}
+
+  def _get(self, name, compute):
+    if name not in self._columns:
+      self._columns[name] = compute()
+    return self._columns[name]
+
+  @property
+  def xyzobs_px(self):
+    ''' The centroids in pixels '''
+    return self._get('xyzobs_px',
+      lambda: self.observations.centroids().px_position())
+
+  @property
+  def peak(self):
+    ''' The coordinates of the peak pixel of each shoebox '''
+    return self._get('peak', lambda: self.shoeboxes.peak_coordinates())
+
+
 class FilterRunner(object):
   '''
   A class to run multiple filters in succession.
@@ -166,11 +231,39 @@ def __call__(self, flags, **kwargs):
     :returns: The filtered flags
 
     '''
+    from time import time
     flags = self.check_flags(flags, **kwargs)
+    if 'columns' not in kwargs:
+      kwargs['columns'] = FilterColumns(
+        observations=kwargs.get('observations'),
+        shoeboxes=kwargs.get('shoeboxes'))
+    timing = []
     for f in self.filters:
+      num_before = flags.count(True)
+      st = time()
       flags = f(flags, **kwargs)
+      timing.append((f.__class__.__name__, num_before, flags.count(True),
+                     time() - st))
+    if len(timing) > 0:
+      logger.info(self.timing_table(timing))
     return flags
 
+  @staticmethod
+  def timing_table(timing):
+    '''
+    Make a table of the number of spots accepted by, and the time taken by,
+    each filter.
+
+    :param timing: A list of (name, num_before, num_after, time)
+    :return: The table as a string
+
+    '''
+    from libtbx.table_utils import format as table
+    rows = [["Filter", "# before", "# after", "Time (s)"]]
+    for name, num_before, num_after, t in timing:
+      rows.append([name, "%d" % num_before, "%d" % num_after, "%.3f" % t])
+    return table(rows, has_header=True, justify='right', prefix=' ')
+
   def check_flags(self, flags, predictions=None, observations=None,
                   shoeboxes=None, **kwargs):
     '''
@@ -220,17 +313,18 @@ def __init__(self, maxd):
     '''
     self.maxd = maxd
 
-  def run(self, flags, observations=None, shoeboxes=None, **kwargs):
+  def run(self, flags, observations=None, shoeboxes=None, columns=None,
+          **kwargs):
     '''
     Run the filtering.
 
     '''
+    if columns is None:
+      columns = FilterColumns(observations=observations, shoeboxes=shoeboxes)
 
     # Get the peak locations and the centroids and return the flags of
     # those closer than the min distance
-    peak = shoeboxes.peak_coordinates()
-    cent = observations.centroids().px_position()
-    return flags.__and__((peak - cent).norms() <= self.maxd)
+    return flags & ((columns.peak - columns.xyzobs_px).norms() <= self.maxd)
 
   def __call__(self, flags, **kwargs):
     ''' Call the filter and print information. '''
@@ -250,111 +344,119 @@ def __init__(self, background_size=2, gradient_cutoff=4):
     self.background_size = background_size
     self.gradient_cutoff = gradient_cutoff
 
+  @staticmethod
+  def fit_gradients(shoeboxes, detector, buffer_size=1):
+    '''
+    Fit a plane to the background of each flattened shoebox, in the same way
+    as the Linear2dModeller. The background is the pixels within the trusted
+    range outside of the inner region, which is the shoebox less a border of
+    buffer_size pixels. The normal equations for all shoeboxes are summed
+    together and solved in one batch.
+
+    :param shoeboxes: The flattened shoeboxes
+    :param detector: The detector model
+    :param buffer_size: The width of the border around the foreground
+    :return: The gradients in x and y and whether the fit was possible
+
+    '''
+    import numpy
+    n = len(shoeboxes)
+    if n == 0:
+      return numpy.zeros(0), numpy.zeros(0), numpy.zeros(0, dtype=bool)
+    x0, x1, y0, y1, z0, z1 = [
+      p.as_numpy_array() for p in shoeboxes.bounding_boxes().parts()]
+    nx = x1 - x0
+    ny = y1 - y0
+    size = nx * ny
+    data = numpy.concatenate([
+      sbox.data.as_numpy_array().ravel() for sbox in shoeboxes])
+    assert len(data) == size.sum(), "Shoeboxes must be flattened"
+
+    # The shoebox index and the x and y index within the shoebox of each pixel
+    index = numpy.repeat(numpy.arange(n), size)
+    k = numpy.arange(len(data)) - (numpy.cumsum(size) - size)[index]
+    i = k % nx[index]
+    j = k // nx[index]
+
+    # The background mask
+    trusted_range = numpy.array([p.get_trusted_range() for p in detector])
+    panel = shoeboxes.panels().as_numpy_array().astype(numpy.int64)[index]
+    foreground = ((i >= buffer_size) & (i < nx[index] - buffer_size) &
+                  (j >= buffer_size) & (j < ny[index] - buffer_size))
+    background = (~foreground &
+                  (data > trusted_range[panel, 0]) &
+                  (data < trusted_range[panel, 1]))
+    index = index[background]
+    x = i[background] + 0.5
+    y = j[background] + 0.5
+    p = data[background].astype(numpy.float64)
+
+    # Build the normal equations for each shoebox
+    def total(weights=None):
+      return numpy.bincount(index, weights=weights, minlength=n)
+    A = numpy.empty((n, 3, 3))
+    A[:,0,0] = total()
+    A[:,0,1] = A[:,1,0] = total(x)
+    A[:,0,2] = A[:,2,0] = total(y)
+    A[:,1,1] = total(x * x)
+    A[:,1,2] = A[:,2,1] = total(x * y)
+    A[:,2,2] = total(y * y)
+    B = numpy.column_stack((total(p), total(x * p), total(y * p)))
+
+    # The fit needs more than three background pixels which are not all in a
+    # line. For pixels on a grid the determinant is otherwise at least one.
+    valid = A[:,0,0] > 3
+    valid[valid] = numpy.abs(numpy.linalg.det(A[valid])) > 0.5
+    solution = numpy.zeros((n, 3))
+    if valid.any():
+      solution[valid] = numpy.linalg.solve(A[valid], B[valid])
+    return solution[:,1], solution[:,2], valid
+
   def run(self, flags, sweep=None, shoeboxes=None, **kwargs):
     from dials.array_family import flex
-    from dials.algorithms.shoebox import MaskCode
-    from dials.algorithms.background.simple import Linear2dModeller
-    bg_code = MaskCode.Valid | MaskCode.BackgroundUsed
-    fg_code = MaskCode.Valid | MaskCode.Foreground
-    strong_code = MaskCode.Valid | MaskCode.Strong
-
-    modeller = Linear2dModeller()
-    expanded_shoeboxes = flex.shoebox()
-    detector = sweep.get_detector()
-
-    zoffset = 0
-    if sweep.get_scan() is not None:
-      zoffset = sweep.get_scan().get_array_range()[0]
-
-    from libtbx.containers import OrderedDict
-    class image_data_cache(object):
-      def __init__(self, imageset, size=10):
-        self.imageset = imageset
-        self.size = size
-        self._image_data = OrderedDict()
-
-      def __getitem__(self, i):
-        image_data = self._image_data.get(i)
-        if image_data is None:
-          image_data = self.imageset.get_raw_data(i)
-          if len(self._image_data) >= self.size:
-            # remove the oldest entry in the cache
-            del self._image_data[self._image_data.keys()[0]]
-          self._image_data[i] = image_data
-        return image_data
-
-    cache = image_data_cache(sweep)
-    #cache = sweep
-
-    # sort shoeboxes by centroid z
-    frame = shoeboxes.centroid_all().position_frame()
-    perm = flex.sort_permutation(frame)
-    shoeboxes = shoeboxes.select(perm)
+    import numpy
     buffer_size = 1
     bg_plus_buffer = self.background_size + buffer_size
+    detector = sweep.get_detector()
 
-    import time
-    t0 = time.time()
-    for i, shoebox in enumerate(shoeboxes):
-      if not flags[perm[i]]:
-        continue
-      panel = detector[shoebox.panel]
-      trusted_range = panel.get_trusted_range()
-      max_x, max_y = panel.get_image_size()
-      bbox = shoebox.bbox
-      x1, x2, y1, y2, z1, z2 = bbox
-      # expand the bbox with a background region around the spotfinder shoebox
-      # perhaps also should use a buffer zone between the shoebox and the
-      # background region
-      expanded_bbox = (max(0, x1-bg_plus_buffer),
-                       min(max_x, x2+bg_plus_buffer),
-                       max(0, y1-bg_plus_buffer),
-                       min(max_y, y2+bg_plus_buffer),
-                       z1, z2)
-      shoebox.bbox = expanded_bbox
-    t1 = time.time()
-    logger.info("Time expand_shoebox: %s" %(t1-t0))
-
+    # Only test the spots which have not already been filtered
+    selection = flags.iselection()
+    if len(selection) == 0:
+      return flags
+    shoeboxes = shoeboxes.select(selection)
+
+    # Expand the bbox with a background region around the spotfinder shoebox
+    # with a buffer zone between the shoebox and the background region
+    panel = shoeboxes.panels()
+    x1, x2, y1, y2, z1, z2 = [
+      p.as_numpy_array() for p in shoeboxes.bounding_boxes().parts()]
+    image_size = numpy.array([p.get_image_size() for p in detector])
+    max_x, max_y = image_size[panel.as_numpy_array().astype(numpy.int64)].T
+    expanded_bbox = numpy.column_stack((
+      numpy.maximum(0, x1 - bg_plus_buffer),
+      numpy.minimum(max_x, x2 + bg_plus_buffer),
+      numpy.maximum(0, y1 - bg_plus_buffer),
+      numpy.minimum(max_y, y2 + bg_plus_buffer),
+      z1, z2)).astype(numpy.int32)
+    expanded_bbox = flex.int6(flex.int(expanded_bbox.reshape(-1)))
+
+    # Read the expanded shoeboxes from the images in a single pass
     rlist = flex.reflection_table()
-    rlist['shoebox'] = shoeboxes
-    rlist['shoebox'].allocate()
-    rlist['panel'] = shoeboxes.panels()
-    rlist['bbox'] = shoeboxes.bounding_boxes()
-
-    t0 = time.time()
+    rlist['panel'] = panel
+    rlist['bbox'] = expanded_bbox
+    rlist['shoebox'] = flex.shoebox(panel, expanded_bbox, allocate=True)
     rlist.extract_shoeboxes(sweep)
-    t1 = time.time()
-
-    shoeboxes = rlist['shoebox']
-    shoeboxes.flatten()
-
-    t0 = time.time()
-    for i, shoebox in enumerate(shoeboxes):
-      if not flags[perm[i]]: continue
-      panel = detector[shoebox.panel]
-      trusted_range = panel.get_trusted_range()
-      max_x, max_y = panel.get_image_size()
-      ex1, ex2, ey1, ey2, ez1, ez2 = shoebox.bbox
-      data = shoebox.data
-      mask = flex.bool(data.accessor(), False)
-      for i_y, y in enumerate(range(ey1, ey2)):
-        for i_x, x in enumerate(range(ex1, ex2)):
-          value = data[0, i_y, i_x]
-          if (y >= (ey1+buffer_size) and y < (ey2-buffer_size) and
-              x >= (ex1+buffer_size) and x < (ex2-buffer_size)):
-            mask[0, i_y, i_x] = False # foreground
-          elif value > trusted_range[0] and value < trusted_range[1]:
-            mask[0, i_y, i_x] = True # background
-
-      model = modeller.create(data.as_double(), mask)
-      d, a, b = model.params()[:3]
-      c = -1
-
-      if abs(a) > self.gradient_cutoff or abs(b) > self.gradient_cutoff:
-        flags[perm[i]] = False
-
-    t1 = time.time()
-
+    expanded_shoeboxes = rlist['shoebox']
+    expanded_shoeboxes.flatten()
+
+    # Reject the spots with a large background gradient
+    a, b, valid = self.fit_gradients(
+      expanded_shoeboxes, detector, buffer_size=buffer_size)
+    reject = valid & ((numpy.abs(a) > self.gradient_cutoff) |
+                      (numpy.abs(b) > self.gradient_cutoff))
+    flags.set_selected(
+      selection.select(flex.size_t(numpy.nonzero(reject)[0].tolist())),
+      False)
     return flags
 
   def __call__(self, flags, **kwargs):
@@ -374,80 +476,48 @@ def __init__(self, nbins=50, gradient_cutoff=0.002):
     self.nbins = nbins
     self.gradient_cutoff = gradient_cutoff
 
-  def run(self, flags, sweep=None, observations=None, **kwargs):
-    obs_x, obs_y = observations.centroids().px_position_xy().parts()
-
+  def run(self, flags, sweep=None, observations=None, columns=None,
+          **kwargs):
     import numpy as np
-    H, xedges, yedges = np.histogram2d(
-      obs_x.as_numpy_array(), obs_y.as_numpy_array(),bins=self.nbins)
-
     from scitbx.array_family import flex
+    if columns is None:
+      columns = FilterColumns(observations=observations)
+    if len(flags) == 0:
+      return flags
+    obs_x, obs_y, obs_z = columns.xyzobs_px.parts()
+    obs_x = obs_x.as_numpy_array()
+    obs_y = obs_y.as_numpy_array()
+
+    H, xedges, yedges = np.histogram2d(obs_x, obs_y, bins=self.nbins)
+
+    # Find the number of spots per bin where the cumulative histogram of the
+    # number of spots per bin flattens out
     H_flex = flex.double(H.flatten().astype(np.float64))
     n_slots = min(int(flex.max(H_flex)), 30)
+    if n_slots < 2:
+      return flags
     hist = flex.histogram(H_flex, n_slots=n_slots)
-
-    slots = hist.slots()
-    cumulative_hist = flex.long(len(slots))
-    for i in range(len(slots)):
-      cumulative_hist[i] = slots[i]
-      if i > 0:
-        cumulative_hist[i] += cumulative_hist[i-1]
-
-    cumulative_hist = cumulative_hist.as_double()/flex.max(
-      cumulative_hist.as_double())
-
-    cutoff = None
-    gradients = flex.double()
-    for i in range(len(slots)-1):
-      x1 = cumulative_hist[i]
-      x2 = cumulative_hist[i+1]
-      g = (x2 - x1)/hist.slot_width()
-      gradients.append(g)
-      if (cutoff is None and  i > 0 and
-          g < self.gradient_cutoff and gradients[i-1] < self.gradient_cutoff):
-        cutoff = hist.slot_centers()[i-1]-0.5*hist.slot_width()
-
-    H_flex = flex.double(np.ascontiguousarray(H))
-    isel = (H_flex > cutoff).iselection()
-    sel = np.column_stack(np.where(H > cutoff))
-    for (ix, iy) in sel:
-      flags.set_selected(
-        ((obs_x > xedges[ix]) & (obs_x < xedges[ix+1]) &
-         (obs_y > yedges[iy]) & (obs_y < yedges[iy+1])), False)
-
-    if 0:
-      from matplotlib import pyplot
-      fig, ax1 = pyplot.subplots()
-      extent = [yedges[0], yedges[-1], xedges[0], xedges[-1]]
-      plot1 = ax1.imshow(H, extent=extent, interpolation="nearest")
-      pyplot.xlim((0, pyplot.xlim()[1]))
-      pyplot.ylim((0, pyplot.ylim()[1]))
-      pyplot.gca().invert_yaxis()
-      cbar1 = pyplot.colorbar(plot1)
-      pyplot.axes().set_aspect('equal')
-      pyplot.show()
-
-      fig, ax1 = pyplot.subplots()
-      ax2 = ax1.twinx()
-      ax1.scatter(hist.slot_centers()-0.5*hist.slot_width(), cumulative_hist)
-      ax1.set_ylim(0, 1)
-      ax2.plot(hist.slot_centers()[:-1]-0.5*hist.slot_width(), gradients)
-      ymin, ymax = pyplot.ylim()
-      pyplot.vlines(cutoff, ymin, ymax, color='r')
-      pyplot.show()
-
-      H2 = H.copy()
-      if cutoff is not None:
-        H2[np.where(H2 >= cutoff)] = 0
-      fig, ax1 = pyplot.subplots()
-      plot1 = ax1.pcolormesh(xedges, yedges, H2)
-      pyplot.xlim((0, pyplot.xlim()[1]))
-      pyplot.ylim((0, pyplot.ylim()[1]))
-      pyplot.gca().invert_yaxis()
-      cbar1 = pyplot.colorbar(plot1)
-      pyplot.axes().set_aspect('equal')
-      pyplot.show()
-
+    cumulative_hist = np.cumsum(hist.slots().as_numpy_array()).astype(np.float64)
+    cumulative_hist /= cumulative_hist.max()
+    gradients = np.diff(cumulative_hist) / hist.slot_width()
+    flat = ((gradients[1:] < self.gradient_cutoff) &
+            (gradients[:-1] < self.gradient_cutoff))
+    if not flat.any():
+      return flags
+    i = np.argmax(flat) + 1
+    cutoff = hist.slot_centers()[i-1]-0.5*hist.slot_width()
+
+    # Reject the spots strictly inside the bins with more spots than the cutoff
+    def bin_index(values, edges):
+      index = np.searchsorted(edges, values, side='left') - 1
+      inside = (index >= 0) & (index < len(edges) - 1)
+      index = np.clip(index, 0, len(edges) - 2)
+      inside &= (values > edges[index]) & (values < edges[index+1])
+      return index, inside
+    ix, inside_x = bin_index(obs_x, xedges)
+    iy, inside_y = bin_index(obs_y, yedges)
+    reject = inside_x & inside_y & (H[ix, iy] > cutoff)
+    flags.set_selected(flex.size_t(np.nonzero(reject)[0].tolist()), False)
     return flags
 
   def __call__(self, flags, **kwargs):
@@ -477,6 +547,7 @@ def from_parameters(params=None, datablock=None):
 
     '''
     from dials.util.masking import MaskGenerator
+    from dials.util.image_cache import SharedImageCache
     from dials.algorithms.spot_finding.finder import SpotFinder
     from libtbx.phil import parse
     from dxtbx.imageset import ImageSweep
@@ -529,13 +600,40 @@ def from_parameters(params=None, datablock=None):
       mp_njobs                  = params.spotfinder.mp.njobs,
       mp_chunksize              = params.spotfinder.mp.chunksize,
       max_strong_pixel_fraction = params.spotfinder.filter.max_strong_pixel_fraction,
+      exclude_failed_images     = (params.spotfinder.filter.max_strong_pixel_fraction_action
+                                   == 'exclude'),
       compute_mean_background   = params.spotfinder.compute_mean_background,
       region_of_interest        = params.spotfinder.region_of_interest,
       mask_generator            = mask_generator,
       min_spot_size             = params.spotfinder.filter.min_spot_size,
       max_spot_size             = params.spotfinder.filter.max_spot_size,
       no_shoeboxes_2d           = no_shoeboxes_2d,
-      min_chunksize             = params.spotfinder.mp.min_chunksize)
+      min_chunksize             = params.spotfinder.mp.min_chunksize,
+      streaming                 = params.spotfinder.streaming.enable,
+      streaming_chunk_frames    = params.spotfinder.streaming.chunk_frames,
+      image_cache               = SharedImageCache.from_parameters(
+                                    params.spotfinder.image_cache))
+
+  @staticmethod
+  def configure_min_spot_size(params, datablock):
+    '''
+    Set the minimum spot size from the detector type if it is Auto
+
+    :param params: The input parameters
+    :param datablock: The datablock
+
+    '''
+    from libtbx import Auto
+
+    if params.spotfinder.filter.min_spot_size is Auto:
+      detector = datablock.extract_imagesets()[0].get_detector()
+      if detector[0].get_type() == 'SENSOR_PAD':
+        # smaller default value for pixel array detectors
+        params.spotfinder.filter.min_spot_size = 3
+      else:
+        params.spotfinder.filter.min_spot_size = 6
+      logger.info('Setting spotfinder.filter.min_spot_size=%i' %(
+        params.spotfinder.filter.min_spot_size))
 
   @staticmethod
   def configure_threshold(params, datablock):
@@ -24,12 +24,16 @@ class Result(object):
 
   '''
 
-  def __init__(self, pixel_list):
+  def __init__(self, pixel_list, excluded=None):
     '''
     Set the pixel list
 
+    :param pixel_list: The list of pixel lists
+    :param excluded: (frame, num_strong, max_strong) if the image was excluded
+
     '''
     self.pixel_list = pixel_list
+    self.excluded = excluded
 
 
 class ExtractPixelsFromImage(object):
@@ -44,7 +48,9 @@ def __init__(self,
                mask,
                region_of_interest,
                max_strong_pixel_fraction,
-               compute_mean_background):
+               compute_mean_background,
+               exclude_failed_images=False,
+               image_cache=None):
     '''
     Initialise the class
 
@@ -53,6 +59,9 @@ def __init__(self,
     :param mask: The image mask
     :param region_of_interest: A region of interest to process
     :param max_strong_pixel_fraction: The maximum fraction of pixels allowed
+    :param exclude_failed_images: Exclude images with too many strong pixels
+                                  rather than raising an exception
+    :param image_cache: A shared cache of decoded images
 
     '''
     self.threshold_function = threshold_function
@@ -61,6 +70,8 @@ def __init__(self,
     self.region_of_interest = region_of_interest
     self.max_strong_pixel_fraction = max_strong_pixel_fraction
     self.compute_mean_background = compute_mean_background
+    self.exclude_failed_images = exclude_failed_images
+    self.image_cache = image_cache
     if self.mask is not None:
       detector = self.imageset.get_detector()
       assert(len(self.mask) == len(detector))
@@ -99,7 +110,10 @@ def __call__(self, index):
     pixel_list = []
 
     # Get the image and mask
-    image = self.imageset.get_corrected_data(index)
+    if self.image_cache is not None:
+      image = self.image_cache.get_corrected_data(self.imageset, index)
+    else:
+      image = self.imageset.get_corrected_data(index)
     mask = self.imageset.get_mask(index)
 
     # Set the mask
@@ -153,11 +167,21 @@ def __call__(self, index):
         num_image += len(im)
       max_strong = int(ceil(self.max_strong_pixel_fraction * num_image))
       if num_strong > max_strong:
-        raise RuntimeError(
-          '''
-          The number of strong pixels found (%d) is greater than the
-          maximum allowed (%d). Try changing spot finding parameters
-        ''' % (num_strong, max_strong))
+        if not self.exclude_failed_images:
+          raise RuntimeError(
+            '''
+            The number of strong pixels found (%d) is greater than the
+            maximum allowed (%d). Try changing spot finding parameters
+          ''' % (num_strong, max_strong))
+
+        # Exclude the image by giving empty pixel lists to the labeller
+        logger.warn(
+          "Excluding image %d: %d strong pixels found, maximum allowed %d" %
+          (frame+1, num_strong, max_strong))
+        pixel_list = [
+          PixelList(frame, im, flex.bool(im.accessor(), False))
+          for im in image]
+        return Result(pixel_list, excluded=(frame, num_strong, max_strong))
 
     # Print some info
     if self.compute_mean_background:
@@ -187,7 +211,9 @@ def __init__(self,
                compute_mean_background,
                min_spot_size,
                max_spot_size,
-               filter_spots):
+               filter_spots,
+               exclude_failed_images=False,
+               image_cache=None):
     '''
     Initialise the class
 
@@ -196,6 +222,9 @@ def __init__(self,
     :param mask: The image mask
     :param region_of_interest: A region of interest to process
     :param max_strong_pixel_fraction: The maximum fraction of pixels allowed
+    :param exclude_failed_images: Exclude images with too many strong pixels
+                                  rather than raising an exception
+    :param image_cache: A shared cache of decoded images
 
     '''
     super(ExtractPixelsFromImage2DNoShoeboxes, self).__init__(
@@ -204,7 +233,9 @@ def __init__(self,
       mask,
       region_of_interest,
       max_strong_pixel_fraction,
-      compute_mean_background)
+      compute_mean_background,
+      exclude_failed_images,
+      image_cache)
 
     # Save some stuff
     self.min_spot_size = min_spot_size
@@ -244,7 +275,7 @@ def __call__(self, index):
     del reflections["shoeboxes"]
 
     # Return the reflections
-    return [reflections]
+    return [reflections, result.excluded]
 
 
 class ExtractSpotsParallelTask(object):
@@ -414,6 +445,253 @@ def __call__(self, imageset, pixel_labeller):
     return self.shoeboxes_to_reflection_table(imageset, shoeboxes), hot_pixels
 
 
+class StreamingPanelLabeller(object):
+  '''
+  A class to label the strong pixels on a single panel in 3D, one image at a
+  time. The pixels on each image are labelled in 2D and the 2D components are
+  joined to the components on the previous image which they touch. A 3D
+  component is finished once an image is added which it does not touch, so
+  only the pixels of the unfinished components need to be kept.
+
+  '''
+
+  def __init__(self):
+    '''
+    Initialise the labeller
+
+    '''
+    self.size = None
+    self.parent = {}
+    self.members = {}
+    self.chunks = {}
+    self.active = set()
+    self.prev_index = None
+    self.prev_ids = None
+    self.next_id = 0
+    self.finished = []
+    self.always_strong = None
+
+  def _find(self, i):
+    '''
+    Find the root of a component
+
+    '''
+    root = i
+    while self.parent[root] != root:
+      root = self.parent[root]
+    while self.parent[i] != root:
+      self.parent[i], i = root, self.parent[i]
+    return root
+
+  def _union(self, a, b):
+    '''
+    Join two components
+
+    '''
+    a = self._find(a)
+    b = self._find(b)
+    if a == b:
+      return
+    if len(self.members[a]) < len(self.members[b]):
+      a, b = b, a
+    self.parent[b] = a
+    self.members[a].extend(self.members.pop(b))
+    self.chunks[a].extend(self.chunks.pop(b))
+
+  def _finish(self, root):
+    '''
+    Move a component to the list of finished pixels
+
+    '''
+    for i in self.members.pop(root):
+      del self.parent[i]
+    self.finished.extend(self.chunks.pop(root))
+
+  def add(self, pixel_list):
+    '''
+    Add the pixel list for the next image
+
+    :param pixel_list: The pixel list
+
+    '''
+    import numpy
+    from dials.model.data import PixelListLabeller
+    frame = pixel_list.frame()
+    if self.size is None:
+      self.size = pixel_list.size()
+    index = pixel_list.index().as_numpy_array()
+    value = pixel_list.value().as_numpy_array()
+
+    # Keep track of the pixels which are strong on every image
+    if self.always_strong is None:
+      self.always_strong = index
+    else:
+      self.always_strong = numpy.intersect1d(
+        self.always_strong, index, assume_unique=True)
+
+    # Label the pixels in 2D and give each component a new id
+    active = set()
+    ids = numpy.zeros(0, dtype=numpy.int64)
+    if len(index) > 0:
+      labeller = PixelListLabeller()
+      labeller.add(pixel_list)
+      labels = labeller.labels_2d().as_numpy_array()
+      first_id = self.next_id
+      self.next_id += int(labels.max()) + 1
+      ids = labels.astype(numpy.int64) + first_id
+      order = numpy.argsort(labels, kind='mergesort')
+      bounds = numpy.flatnonzero(numpy.diff(labels[order])) + 1
+      for selection in numpy.split(order, bounds):
+        i = int(ids[selection[0]])
+        self.parent[i] = i
+        self.members[i] = [i]
+        self.chunks[i] = [(frame, index[selection], value[selection])]
+
+      # Join the components which touch those on the previous image
+      if self.prev_index is not None and len(self.prev_index) > 0:
+        common, i_prev, i_this = numpy.intersect1d(
+          self.prev_index, index, assume_unique=True, return_indices=True)
+        pairs = set(zip(
+          self.prev_ids[i_prev].tolist(),
+          ids[i_this].tolist()))
+        for a, b in pairs:
+          self._union(a, b)
+      active = set(self._find(i) for i in range(first_id, self.next_id))
+
+    # Finish the components which do not touch this image
+    for root in set(self._find(i) for i in self.active) - active:
+      self._finish(root)
+    self.active = active
+    self.prev_index = index
+    self.prev_ids = ids
+
+  def pop_finished(self, finish_all=False):
+    '''
+    Get the pixels of the finished components
+
+    :param finish_all: Finish all the components
+    :return: A pixel list labeller with the finished pixels
+
+    '''
+    import numpy
+    from collections import defaultdict
+    from dials.array_family import flex
+    from dials.model.data import PixelList, PixelListLabeller
+    if finish_all:
+      for root in set(self._find(i) for i in self.active):
+        self._finish(root)
+      self.active = set()
+    labeller = PixelListLabeller()
+    if len(self.finished) == 0:
+      return labeller
+    chunks = defaultdict(list)
+    for frame, index, value in self.finished:
+      chunks[frame].append((index, value))
+    self.finished = []
+    for frame in range(min(chunks), max(chunks) + 1):
+      if frame in chunks:
+        index = numpy.concatenate([c[0] for c in chunks[frame]])
+        value = numpy.concatenate([c[1] for c in chunks[frame]])
+        order = numpy.argsort(index)
+        index = flex.size_t(index[order].astype(int))
+        value = flex.double(numpy.ascontiguousarray(value[order]))
+      else:
+        index = flex.size_t()
+        value = flex.double()
+      labeller.add(PixelList(frame, self.size, value, index))
+    return labeller
+
+  def hot_pixels(self):
+    '''
+    :return: The pixels which are strong on every image
+
+    '''
+    from dials.array_family import flex
+    if self.always_strong is None:
+      return flex.size_t()
+    return flex.size_t(self.always_strong.astype(int))
+
+
+class StreamingPixelListLabeller(object):
+  '''
+  A class to label strong pixels in 3D as the images are processed. Every
+  chunk_frames images, the spots which are finished are converted to a
+  reflection table. The memory used therefore depends on the depth of the spots
+  rather than on the number of strong pixels in the sweep.
+
+  '''
+
+  def __init__(self,
+               num_panels,
+               min_spot_size,
+               max_spot_size,
+               filter_spots,
+               chunk_frames=50):
+    '''
+    Initialise the labeller
+
+    :param num_panels: The number of panels
+    :param min_spot_size: The minimum spot size
+    :param max_spot_size: The maximum spot size
+    :param filter_spots: The spot filter
+    :param chunk_frames: The number of images between converting spots
+
+    '''
+    self.panels = [StreamingPanelLabeller() for i in range(num_panels)]
+    self.converter = PixelListToReflectionTable(
+      min_spot_size,
+      max_spot_size,
+      filter_spots,
+      False)
+    self.chunk_frames = chunk_frames
+    self.num_frames = 0
+
+  def add(self, imageset, pixel_list):
+    '''
+    Add the pixel lists for the next image
+
+    :param imageset: The imageset
+    :param pixel_list: The list of pixel lists for each panel
+    :return: A reflection table of finished spots or None
+
+    '''
+    assert len(self.panels) == len(pixel_list), "Inconsistent size"
+    for panel, plist in zip(self.panels, pixel_list):
+      panel.add(plist)
+    self.num_frames += 1
+    if self.num_frames % self.chunk_frames == 0:
+      return self._convert(imageset)
+    return None
+
+  def finish(self, imageset):
+    '''
+    Finish all the remaining spots
+
+    :param imageset: The imageset
+    :return: A reflection table of the remaining spots or None
+
+    '''
+    return self._convert(imageset, finish_all=True)
+
+  def hot_pixels(self):
+    '''
+    :return: The pixels on each panel which are strong on every image
+
+    '''
+    return tuple(panel.hot_pixels() for panel in self.panels)
+
+  def _convert(self, imageset, finish_all=False):
+    '''
+    Convert the finished spots to a reflection table
+
+    '''
+    labellers = [panel.pop_finished(finish_all) for panel in self.panels]
+    if sum(labeller.num_pixels() for labeller in labellers) == 0:
+      return None
+    reflections, _ = self.converter(imageset, labellers)
+    return reflections
+
+
 class ExtractSpots(object):
   '''
   Class to find spots in an image and extract them into shoeboxes.
@@ -435,7 +713,11 @@ def __init__(self,
                filter_spots=None,
                no_shoeboxes_2d=False,
                min_chunksize=50,
-               write_hot_pixel_mask=False):
+               write_hot_pixel_mask=False,
+               exclude_failed_images=False,
+               streaming=False,
+               streaming_chunk_frames=50,
+               image_cache=None):
     '''
     Initialise the class with the strategy
 
@@ -444,6 +726,12 @@ def __init__(self,
     :param mp_method: The multi processing method
     :param nproc: The number of processors
     :param max_strong_pixel_fraction: The maximum number of strong pixels
+    :param exclude_failed_images: Exclude images with too many strong pixels
+                                  rather than raising an exception
+    :param streaming: Label spots in 3D as the images are processed
+    :param streaming_chunk_frames: The number of images between converting
+                                   finished spots when streaming
+    :param image_cache: A shared cache of decoded images
 
     '''
     # Set the required strategies
@@ -462,6 +750,10 @@ def __init__(self,
     self.no_shoeboxes_2d = no_shoeboxes_2d
     self.min_chunksize = min_chunksize
     self.write_hot_pixel_mask = write_hot_pixel_mask
+    self.exclude_failed_images = exclude_failed_images
+    self.streaming = streaming
+    self.streaming_chunk_frames = streaming_chunk_frames
+    self.image_cache = image_cache
 
   def __call__(self, imageset):
     '''
@@ -493,6 +785,22 @@ def _compute_chunksize(self, nimg, nproc, min_chunksize):
       test_chunksize -= 1
     return chunksize
 
+  def _report_excluded_images(self, excluded):
+    '''
+    Print a table of the images excluded from spot finding
+
+    '''
+    from libtbx.table_utils import format as table
+    if len(excluded) == 0:
+      return
+    rows = [["Image", "# strong pixels", "Max # strong pixels"]]
+    for frame, num_strong, max_strong in sorted(excluded):
+      rows.append(["%d" % (frame+1), "%d" % num_strong, "%d" % max_strong])
+    logger.warn('')
+    logger.warn('Excluded %d image(s) with too many strong pixels' %
+                len(excluded))
+    logger.warn(table(rows, has_header=True, justify='right', prefix=' '))
+
   def _find_spots(self, imageset):
     '''
     Find the spots in the imageset
@@ -551,7 +859,9 @@ def _find_spots(self, imageset):
         mask                      = self.mask,
         max_strong_pixel_fraction = self.max_strong_pixel_fraction,
         compute_mean_background   = self.compute_mean_background,
-        region_of_interest        = self.region_of_interest)
+        region_of_interest        = self.region_of_interest,
+        exclude_failed_images     = self.exclude_failed_images,
+        image_cache               = self.image_cache)
 
     # The indices to iterate over
     indices = list(range(len(imageset)))
@@ -560,6 +870,32 @@ def _find_spots(self, imageset):
     num_panels = len(imageset.get_detector())
     pixel_labeller = [PixelListLabeller() for p in range(num_panels)]
 
+    # When streaming, label the spots as the images are processed and convert
+    # them to reflections once they are finished
+    if self.streaming and isinstance(imageset, ImageSweep):
+      streaming_labeller = StreamingPixelListLabeller(
+        num_panels,
+        self.min_spot_size,
+        self.max_spot_size,
+        self.filter_spots,
+        chunk_frames=self.streaming_chunk_frames)
+    else:
+      streaming_labeller = None
+    reflections = flex.reflection_table()
+
+    def add_pixel_list(pixel_list):
+      assert len(pixel_labeller) == len(pixel_list), "Inconsistent size"
+      if streaming_labeller is not None:
+        table = streaming_labeller.add(imageset, pixel_list)
+        if table is not None:
+          reflections.extend(table)
+      else:
+        for plabeller, plist in zip(pixel_labeller, pixel_list):
+          plabeller.add(plist)
+
+    # The images excluded from spot finding
+    excluded = []
+
     # Do the processing
     logger.info('Extracting strong pixels from images')
     if mp_njobs > 1:
@@ -570,10 +906,10 @@ def _find_spots(self, imageset):
       def process_output(result):
         for message in result[1]:
           logger.log(message.levelno, message.msg)
-        assert len(pixel_labeller) == len(result[0].pixel_list), "Inconsistent size"
-        for plabeller, plist in zip(pixel_labeller, result[0].pixel_list):
-          plabeller.add(plist)
+        add_pixel_list(result[0].pixel_list)
         result[0].pixel_list = None
+        if result[0].excluded is not None:
+          excluded.append(result[0].excluded)
       batch_multi_node_parallel_map(
         func           = ExtractSpotsParallelTask(function),
         iterable       = indices,
@@ -585,10 +921,24 @@ def process_output(result):
     else:
       for task in indices:
         result = function(task)
-        assert len(pixel_labeller) == len(result.pixel_list), "Inconsistent size"
-        for plabeller, plist in zip(pixel_labeller, result.pixel_list):
-          plabeller.add(plist)
-          result.pixel_list = None
+        add_pixel_list(result.pixel_list)
+        result.pixel_list = None
+        if result.excluded is not None:
+          excluded.append(result.excluded)
+    self._report_excluded_images(excluded)
+
+    # Convert the remaining spots when streaming
+    if streaming_labeller is not None:
+      table = streaming_labeller.finish(imageset)
+      if table is not None:
+        reflections.extend(table)
+      logger.info('')
+      logger.info('Found {0} spots'.format(len(reflections)))
+      if self.write_hot_pixel_mask:
+        hot_pixels = streaming_labeller.hot_pixels()
+      else:
+        hot_pixels = tuple(flex.size_t() for i in range(num_panels))
+      return reflections, hot_pixels
 
     # Create shoeboxes from pixel list
     converter = PixelListToReflectionTable(
@@ -657,13 +1007,16 @@ def _find_spots_2d_no_shoeboxes(self, imageset):
         region_of_interest        = self.region_of_interest,
         min_spot_size             = self.min_spot_size,
         max_spot_size             = self.max_spot_size,
-        filter_spots              = self.filter_spots)
+        filter_spots              = self.filter_spots,
+        exclude_failed_images     = self.exclude_failed_images,
+        image_cache               = self.image_cache)
 
     # The indices to iterate over
     indices = list(range(len(imageset)))
 
-    # The resulting reflections
+    # The resulting reflections and the images excluded from spot finding
     reflections = flex.reflection_table()
+    excluded = []
 
     # Do the processing
     logger.info('Extracting strong spots from images')
@@ -677,6 +1030,8 @@ def process_output(result):
           logger.log(message.levelno, message.msg)
         reflections.extend(result[0][0])
         result[0][0] = None
+        if result[0][1] is not None:
+          excluded.append(result[0][1])
       batch_multi_node_parallel_map(
         func           = ExtractSpotsParallelTask(function),
         iterable       = indices,
@@ -687,7 +1042,11 @@ def process_output(result):
         callback       = process_output)
     else:
       for task in indices:
-        reflections.extend(function(task)[0])
+        result = function(task)
+        reflections.extend(result[0])
+        if result[1] is not None:
+          excluded.append(result[1])
+    self._report_excluded_images(excluded)
 
     # Return the reflections
     return reflections, None
@@ -717,7 +1076,11 @@ def __init__(self,
                min_spot_size=1,
                max_spot_size=20,
                no_shoeboxes_2d=False,
-               min_chunksize=50):
+               min_chunksize=50,
+               exclude_failed_images=False,
+               streaming=False,
+               streaming_chunk_frames=50,
+               image_cache=None):
     '''
     Initialise the class.
 
@@ -746,6 +1109,10 @@ def __init__(self,
     self.mp_njobs = mp_njobs
     self.no_shoeboxes_2d = no_shoeboxes_2d
     self.min_chunksize = min_chunksize
+    self.exclude_failed_images = exclude_failed_images
+    self.streaming = streaming
+    self.streaming_chunk_frames = streaming_chunk_frames
+    self.image_cache = image_cache
 
   def __call__(self, datablock):
     '''
@@ -830,7 +1197,11 @@ def _find_spots_in_imageset(self, imageset):
       filter_spots              = self.filter_spots,
       no_shoeboxes_2d           = self.no_shoeboxes_2d,
       min_chunksize             = self.min_chunksize,
-      write_hot_pixel_mask      = self.write_hot_mask)
+      write_hot_pixel_mask      = self.write_hot_mask,
+      exclude_failed_images     = self.exclude_failed_images,
+      streaming                 = self.streaming,
+      streaming_chunk_frames    = self.streaming_chunk_frames,
+      image_cache               = self.image_cache)
 
     # Get the max scan range
     if isinstance(imageset, ImageSweep):
@@ -536,7 +536,9 @@ def points_inside_envelope(d_star_sq, log_i_over_sigi,
 def ice_rings_selection(reflections, width=0.004):
   d_star_sq = flex.pow2(reflections['rlp'].norms())
   d_spacings = uctbx.d_star_sq_as_d(d_star_sq)
+  return ice_rings_selection_d_spacings(d_spacings, width=width)
 
+def ice_rings_selection_d_spacings(d_spacings, width=0.004):
   from dials.algorithms.integration import filtering
 
   unit_cell = uctbx.unit_cell((4.498,4.498,7.338,90,90,120))
@@ -640,6 +642,14 @@ def plot_ordered_d_star_sq(reflections, imageset):
 def stats_single_image(imageset, reflections, i=None, resolution_analysis=True,
                        plot=False, filter_ice=True):
   reflections = map_to_reciprocal_space(reflections, imageset)
+  return stats_mapped_reflections(
+    reflections, imageset=imageset, i=i,
+    resolution_analysis=resolution_analysis, plot=plot, filter_ice=filter_ice)
+
+def stats_mapped_reflections(reflections, imageset=None, i=None,
+                             resolution_analysis=True, plot=False,
+                             filter_ice=True):
+  # As stats_single_image for reflections already mapped to reciprocal space
   if plot and i is not None:
     filename = "i_over_sigi_vs_resolution_%d.png" %(i+1)
     hist_filename = "spot_count_vs_resolution_%d.png" %(i+1)
@@ -702,7 +712,233 @@ def stats_single_image(imageset, reflections, i=None, resolution_analysis=True,
                     d_min_distl_method_2=d_min_distl_method_2,
                     noisiness_method_2=noisiness_method_2)
 
-def stats_imageset(imageset, reflections, resolution_analysis=True, plot=False):
+def _local_maxima(image):
+  '''
+  Find the pixels which are not smaller than any of their 8 neighbours. Ties
+  are broken in raster order so a plateau only gives a single maximum.
+
+  '''
+  import numpy as np
+  ny, nx = image.shape
+  padded = np.pad(image, 1, mode='constant', constant_values=-np.inf)
+  result = np.ones(image.shape, dtype=bool)
+  for dy in (-1, 0, 1):
+    for dx in (-1, 0, 1):
+      if dy == 0 and dx == 0:
+        continue
+      neighbour = padded[1+dy:1+dy+ny, 1+dx:1+dx+nx]
+      if (dy, dx) < (0, 0):
+        result &= image > neighbour
+      else:
+        result &= image >= neighbour
+  return result
+
+def quick_look_single_image(imageset, i=0, bin_size=2, region=None,
+                            sigma_strong=6, n_bins=20, filter_ice=True):
+  '''
+  Estimate the number of spots and the resolution limit of an image from the
+  pixel statistics alone, without any spot finding or centroiding.
+
+  The image is summed in bin_size x bin_size blocks, optionally restricted to
+  a region of each panel, and the background and noise are estimated from the
+  median and median absolute deviation of the binned pixels in shells of
+  resolution. Binned pixels above the background by more than sigma_strong
+  times the noise are strong, and each local maximum of the strong pixels is
+  counted as a spot. The resolution of the pixels is computed from the panel
+  geometry ignoring any parallax correction.
+
+  :param imageset: The imageset
+  :param i: The index of the image in the imageset
+  :param bin_size: The size of the blocks to sum the pixels in
+  :param region: The region of each panel to use (x0, x1, y0, y1)
+  :param sigma_strong: The number of sigma above background for strong pixels
+  :param n_bins: The number of resolution shells
+  :param filter_ice: Exclude spots on the ice rings
+  :return: The statistics, with the same fields as stats_single_image
+
+  '''
+  import numpy as np
+
+  detector = imageset.get_detector()
+  beam = imageset.get_beam()
+  s0 = np.array(beam.get_s0())
+  wavelength = beam.get_wavelength()
+
+  # Bin the pixels and compute the resolution of each binned pixel
+  panels = []
+  for panel, data, mask in zip(detector, imageset.get_raw_data(i),
+                               imageset.get_mask(i)):
+    image = data.as_numpy_array()
+    ny, nx = image.shape
+    x0, x1, y0, y1 = 0, nx, 0, ny
+    if region is not None:
+      x0, x1 = max(region[0], 0), min(region[1], nx)
+      y0, y1 = max(region[2], 0), min(region[3], ny)
+    nx_bin = (x1 - x0) // bin_size
+    ny_bin = (y1 - y0) // bin_size
+    if nx_bin <= 0 or ny_bin <= 0:
+      continue
+    x1 = x0 + nx_bin * bin_size
+    y1 = y0 + ny_bin * bin_size
+    shape = (ny_bin, bin_size, nx_bin, bin_size)
+    binned = image[y0:y1,x0:x1].astype(np.float64).reshape(shape).sum(axis=(1,3))
+    valid = mask.as_numpy_array()[y0:y1,x0:x1].reshape(shape).all(axis=(1,3))
+    px, py = panel.get_pixel_size()
+    x = (x0 + (np.arange(nx_bin) + 0.5) * bin_size) * px
+    y = (y0 + (np.arange(ny_bin) + 0.5) * bin_size) * py
+    lab = (np.array(panel.get_origin())
+           + x[np.newaxis,:,np.newaxis] * np.array(panel.get_fast_axis())
+           + y[:,np.newaxis,np.newaxis] * np.array(panel.get_slow_axis()))
+    s1 = lab / (wavelength * np.sqrt((lab**2).sum(axis=2))[:,:,np.newaxis])
+    d_star_sq = ((s1 - s0)**2).sum(axis=2)
+    panels.append((binned, valid, d_star_sq))
+
+  all_d_star_sq = np.concatenate(
+    [d_star_sq[valid] for binned, valid, d_star_sq in panels] or [[]])
+  if all_d_star_sq.size == 0:
+    return group_args(n_spots_total=0,
+                      n_spots_no_ice=0,
+                      n_spots_4A=0,
+                      total_intensity=0.0,
+                      estimated_d_min=-1.0,
+                      d_min_distl_method_1=-1.0,
+                      noisiness_method_1=-1.0,
+                      d_min_distl_method_2=-1.0,
+                      noisiness_method_2=-1.0)
+
+  # Estimate the background and noise in shells of resolution
+  edges = np.linspace(all_d_star_sq.min(), all_d_star_sq.max(), n_bins+1)
+  def shell_index(d_star_sq):
+    return np.clip(np.searchsorted(edges, d_star_sq, side='right') - 1,
+                   0, n_bins - 1)
+  all_shells = shell_index(all_d_star_sq)
+  all_values = np.concatenate(
+    [binned[valid] for binned, valid, d_star_sq in panels])
+  background = np.zeros(n_bins)
+  noise = np.ones(n_bins)
+  for j in range(n_bins):
+    values = all_values[all_shells == j]
+    if values.size == 0:
+      continue
+    median = np.median(values)
+    mad = np.median(np.abs(values - median))
+    background[j] = median
+    noise[j] = max(1.4826 * mad, math.sqrt(max(median, 1)))
+
+  # Find the strong pixels and the local maxima
+  peak_d_star_sq = []
+  strong_d_star_sq = []
+  strong_signal = []
+  for binned, valid, d_star_sq in panels:
+    shells = shell_index(d_star_sq)
+    signal = binned - background[shells]
+    strong = valid & (signal > sigma_strong * noise[shells])
+    peaks = strong & _local_maxima(np.where(valid, binned, -np.inf))
+    peak_d_star_sq.append(d_star_sq[peaks])
+    strong_d_star_sq.append(d_star_sq[strong])
+    strong_signal.append(signal[strong])
+  peak_d_star_sq = np.concatenate(peak_d_star_sq)
+  strong_d_star_sq = np.concatenate(strong_d_star_sq)
+  strong_signal = np.concatenate(strong_signal)
+
+  peak_ice = np.zeros(peak_d_star_sq.size, dtype=bool)
+  strong_ice = np.zeros(strong_d_star_sq.size, dtype=bool)
+  if filter_ice:
+    for d_star_sq, ice in ((peak_d_star_sq, peak_ice),
+                           (strong_d_star_sq, strong_ice)):
+      sel = ice_rings_selection_d_spacings(
+        uctbx.d_star_sq_as_d(flex.double(d_star_sq.tolist())))
+      if sel is not None:
+        ice[:] = sel.as_numpy_array()
+
+  n_spots_total = int(peak_d_star_sq.size)
+  n_spots_no_ice = int((~peak_ice).sum())
+  n_spots_4A = int((peak_d_star_sq < 1/4**2).sum())
+  total_intensity = float(strong_signal[~strong_ice].sum())
+
+  # The resolution estimate is the outermost shell which has a reasonable
+  # fraction of the spots in the most populated shell
+  estimated_d_min = -1.0
+  if n_spots_no_ice > 10:
+    counts = np.histogram(peak_d_star_sq[~peak_ice], bins=edges)[0]
+    threshold = min(counts.max(), max(2, 0.1 * counts.max()))
+    outer = np.nonzero(counts >= threshold)[0][-1]
+    estimated_d_min = 1 / math.sqrt(edges[outer+1])
+
+  return group_args(n_spots_total=n_spots_total,
+                    n_spots_no_ice=n_spots_no_ice,
+                    n_spots_4A=n_spots_4A,
+                    total_intensity=total_intensity,
+                    estimated_d_min=estimated_d_min,
+                    d_min_distl_method_1=-1.0,
+                    noisiness_method_1=-1.0,
+                    d_min_distl_method_2=-1.0,
+                    noisiness_method_2=-1.0)
+
+def _stats_image_block(block, resolution_analysis=True, plot=False):
+  # Compute the statistics for a block of images. The reflections are sorted
+  # by image and the reflections on image j are rows offsets[j]:offsets[j+1]
+  first, reflections, offsets = block
+  return [
+    stats_mapped_reflections(
+      reflections[offsets[j]:offsets[j+1]], i=first+j,
+      resolution_analysis=resolution_analysis, plot=plot)
+    for j in range(len(offsets)-1)]
+
+def stats_imageset(imageset, reflections, resolution_analysis=True, plot=False,
+                   nproc=1):
+  import functools
+  import numpy as np
+
+  try:
+    start, end = imageset.get_array_range()
+  except AttributeError:
+    start = 0
+  n_images = len(imageset)
+
+  # Map all the reflections to reciprocal space at once, then sort them by
+  # image so that the reflections on each image are a contiguous block
+  reflections = map_to_reciprocal_space(reflections, imageset)
+  image_number = flex.floor(
+    reflections['xyzobs.px.value'].parts()[2]).iround() - start
+  sel = (image_number >= 0) & (image_number < n_images)
+  reflections = reflections.select(sel)
+  image_number = image_number.select(sel)
+  reflections = reflections.select(
+    flex.sort_permutation(image_number, stable=True))
+  counts = np.bincount(image_number.as_numpy_array(), minlength=n_images)
+  offsets = [0] + np.cumsum(counts).tolist()
+
+  # Split the images into blocks of contiguous images, with several blocks
+  # for each process to balance the load
+  if nproc > 1:
+    block_size = int(math.ceil(n_images / (4 * nproc)))
+  else:
+    block_size = n_images
+  block_size = max(block_size, 1)
+  blocks = []
+  for first in range(0, n_images, block_size):
+    last = min(first + block_size, n_images)
+    blocks.append((
+      first + start,
+      reflections[offsets[first]:offsets[last]],
+      [offset - offsets[first] for offset in offsets[first:last+1]]))
+
+  func = functools.partial(
+    _stats_image_block, resolution_analysis=resolution_analysis, plot=plot)
+  if nproc > 1 and len(blocks) > 1:
+    from libtbx import easy_mp
+    results = easy_mp.parallel_map(
+      func=func,
+      iterable=blocks,
+      processes=nproc,
+      method="multiprocessing",
+      preserve_order=True,
+      asynchronous=True,
+      preserve_exception_message=True)
+  else:
+    results = [func(block) for block in blocks]
+
   n_spots_total = []
   n_spots_no_ice = []
   n_spots_4A = []
@@ -712,28 +948,17 @@ def stats_imageset(imageset, reflections, resolution_analysis=True, plot=False):
   d_min_distl_method_2 = []
   noisiness_method_1 = []
   noisiness_method_2 = []
-
-  image_number = reflections['xyzobs.px.value'].parts()[2]
-  image_number = flex.floor(image_number)
-
-  try:
-    start, end = imageset.get_array_range()
-  except AttributeError:
-    start = 0
-  for i in range(len(imageset)):
-    stats = stats_single_image(
-      imageset[i:i+1],
-      reflections.select(image_number==i+start), i=i+start,
-      resolution_analysis=resolution_analysis, plot=plot)
-    n_spots_total.append(stats.n_spots_total)
-    n_spots_no_ice.append(stats.n_spots_no_ice)
-    n_spots_4A.append(stats.n_spots_4A)
-    total_intensity.append(stats.total_intensity)
-    estimated_d_min.append(stats.estimated_d_min)
-    d_min_distl_method_1.append(stats.d_min_distl_method_1)
-    noisiness_method_1.append(stats.noisiness_method_1)
-    d_min_distl_method_2.append(stats.d_min_distl_method_2)
-    noisiness_method_2.append(stats.noisiness_method_2)
+  for block_stats in results:
+    for stats in block_stats:
+      n_spots_total.append(stats.n_spots_total)
+      n_spots_no_ice.append(stats.n_spots_no_ice)
+      n_spots_4A.append(stats.n_spots_4A)
+      total_intensity.append(stats.total_intensity)
+      estimated_d_min.append(stats.estimated_d_min)
+      d_min_distl_method_1.append(stats.d_min_distl_method_1)
+      noisiness_method_1.append(stats.noisiness_method_1)
+      d_min_distl_method_2.append(stats.d_min_distl_method_2)
+      noisiness_method_2.append(stats.noisiness_method_2)
 
   return group_args(n_spots_total=n_spots_total,
                     n_spots_no_ice=n_spots_no_ice,
@@ -61,6 +61,223 @@ def default_centroid_algorithm():
   from dials.extensions import SimpleCentroidExt
   return strategy(SimpleCentroidExt)
 
+def _pack_match_keys(table1, table2):
+  '''
+  Pack the miller index, entering flag, experiment id and panel of two
+  reflection tables into a single exactly representable key per reflection.
+
+  :param table1: The first reflection table
+  :param table2: The second reflection table
+  :return: The keys for each table or None if the keys cannot be packed
+
+  '''
+  def components(table):
+    h, k, l = table['miller_index'].as_vec3_double().parts()
+    return [
+      h, k, l,
+      table['entering'].as_int().as_double(),
+      table['id'].as_double(),
+      table['panel'].as_int().as_double()]
+  if len(table1) == 0 or len(table2) == 0:
+    return None
+  key1 = flex.double(len(table1), 0)
+  key2 = flex.double(len(table2), 0)
+  size = 1
+  for c1, c2 in zip(components(table1), components(table2)):
+    cmin = min(flex.min(c1), flex.min(c2))
+    span = max(flex.max(c1), flex.max(c2)) - cmin + 1
+    size *= span
+    if size > 2**52:
+      return None
+    key1 = key1 * span + (c1 - cmin)
+    key2 = key2 * span + (c2 - cmin)
+  return key1, key2
+
+
+def _duplicated(keys):
+  '''
+  :param keys: The keys
+  :return: A mask of the keys which appear more than once
+
+  '''
+  perm = flex.sort_permutation(keys)
+  keys = keys.select(perm)
+  same = keys[1:] == keys[:-1]
+  prev = flex.bool(1, False)
+  prev.extend(same)
+  next = same.deep_copy()
+  next.append(False)
+  result = flex.bool(len(keys), False)
+  if len(keys) > 0:
+    result.set_selected(perm, prev | next)
+  return result
+
+
+def _unique(keys):
+  '''
+  :param keys: The keys
+  :return: The unique keys
+
+  '''
+  keys = keys.select(flex.sort_permutation(keys))
+  if len(keys) == 0:
+    return keys
+  return keys[:1].concatenate(keys[1:].select(keys[1:] != keys[:-1]))
+
+
+def _join_unique(keys1, keys2):
+  '''
+  Join two arrays of keys where each key appears at most once in each array.
+
+  :param keys1: The first array of keys
+  :param keys2: The second array of keys
+  :return: The indices into each array of the matching keys
+
+  '''
+  keys = keys1.concatenate(keys2)
+  perm = flex.sort_permutation(keys, stable=True)
+  keys = keys.select(perm)
+  same = keys[1:] == keys[:-1]
+
+  # The sort is stable so the first of each pair is from the first array
+  index1 = perm[:-1].select(same)
+  index2 = perm[1:].select(same) - len(keys1)
+  return index1, index2
+
+
+def _match_nearest(table1, index1, table2, index2):
+  '''
+  Match the selected reflections in two tables with the same miller index,
+  entering flag, experiment id and panel. Where there is more than one
+  possible match, each reflection in the second table is matched to the
+  closest reflection in the first table which has it as its closest match.
+
+  :param table1: The first reflection table
+  :param index1: The indices of the reflections to match in the first table
+  :param table2: The second reflection table
+  :param index2: The indices of the reflections to match in the second table
+  :return: The indices of the matches in each table
+
+  '''
+  from collections import defaultdict
+  import __builtin__
+
+  # Get the miller index, entering flag and turn number for
+  # Both sets of reflections
+  i1 = table1['id']
+  h1 = table1['miller_index']
+  e1 = table1['entering'].as_int()
+  x1, y1, z1 = table1['xyzcal.px'].parts()
+  p1 = table1['panel']
+
+  i2 = table2['id']
+  h2 = table2['miller_index']
+  e2 = table2['entering'].as_int()
+  x2, y2, z2 = table2['xyzcal.px'].parts()
+  p2 = table2['panel']
+
+  class Match(object):
+    def __init__(self):
+      self.a = []
+      self.b = []
+
+  # Create the match lookup
+  lookup = defaultdict(Match)
+  for i in index1:
+    item = h1[i] + (e1[i], i1[i], p1[i])
+    lookup[item].a.append(i)
+
+  # Add matches from input reflections
+  for i in index2:
+    item = h2[i] + (e2[i], i2[i], p2[i])
+    if item in lookup:
+      lookup[item].b.append(i)
+
+  # Create the list of matches
+  match1 = []
+  match2 = []
+  for item, value in lookup.iteritems():
+    if len(value.b) == 0:
+      continue
+    elif len(value.a) == 1 and len(value.b) == 1:
+      match1.append(value.a[0])
+      match2.append(value.b[0])
+    else:
+      matched = {}
+      for i in value.a:
+        d = []
+        for j in value.b:
+          dx = x1[i]-x2[j]
+          dy = y1[i]-y2[j]
+          dz = z1[i]-z2[j]
+          d.append((i,j,dx**2 + dy**2 + dz**2))
+        i, j, d = __builtin__.min(d, key=lambda x: x[2])
+        if j not in matched:
+          matched[j] = (i, d)
+        elif d < matched[j][1]:
+          matched[j] = (i, d)
+      for key1, value1 in matched.iteritems():
+        match1.append(value1[0])
+        match2.append(key1)
+  return flex.size_t(match1), flex.size_t(match2)
+
+
+def _shoebox_overlap_fraction(bbox, overlaps):
+  '''
+  Compute the fraction of each shoebox overlapped by its neighbours. Where a
+  shoebox has a single neighbour the overlap is computed analytically,
+  otherwise the union of the neighbours is painted into a scratch buffer
+  which is reused for every shoebox.
+
+  :param bbox: The bounding boxes
+  :param overlaps: The list of overlaps
+  :return: The fraction of shoebox overlapped with other reflections
+
+  '''
+  import numpy
+  result = flex.double(len(bbox), 0)
+  if len(bbox) == 0:
+    return result
+  x0, x1, y0, y1, z0, z1 = [p.as_numpy_array() for p in bbox.parts()]
+  xsize = x1 - x0
+  ysize = y1 - y0
+  zsize = z1 - z0
+  assert (xsize > 0).all()
+  assert (ysize > 0).all()
+  assert (zsize > 0).all()
+  scratch = numpy.zeros(
+    (zsize.max(), ysize.max(), xsize.max()),
+    dtype=numpy.bool_)
+  for i in range(len(bbox)):
+    edges = list(overlaps.adjacent_vertices(i))
+    if len(edges) == 0:
+      continue
+    xs, ys, zs = int(xsize[i]), int(ysize[i]), int(zsize[i])
+    boxes = []
+    for j in edges:
+      bx0 = max(x0[j] - x0[i], 0)
+      bx1 = min(x1[j] - x0[i], xs)
+      by0 = max(y0[j] - y0[i], 0)
+      by1 = min(y1[j] - y0[i], ys)
+      bz0 = max(z0[j] - z0[i], 0)
+      bz1 = min(z1[j] - z0[i], zs)
+      assert bx1 > bx0
+      assert by1 > by0
+      assert bz1 > bz0
+      boxes.append((bx0, bx1, by0, by1, bz0, bz1))
+    if len(boxes) == 1:
+      bx0, bx1, by0, by1, bz0, bz1 = boxes[0]
+      count = (bx1 - bx0) * (by1 - by0) * (bz1 - bz0)
+    else:
+      mask = scratch[:zs,:ys,:xs]
+      mask[...] = False
+      for bx0, bx1, by0, by1, bz0, bz1 in boxes:
+        mask[bz0:bz1,by0:by1,bx0:bx1] = True
+      count = numpy.count_nonzero(mask)
+    result[i] = (1.0*count) / (xs * ys * zs)
+  return result
+
+
 class reflection_table_aux(boost.python.injector, reflection_table):
   '''
   An injector class to add additional methods to the reflection table.
@@ -170,17 +387,8 @@ def from_observations(datablock, params=None):
     '''
     from dials.algorithms.spot_finding.factory \
       import SpotFinderFactory
-    from libtbx import Auto
 
-    if params.spotfinder.filter.min_spot_size is Auto:
-      detector = datablock.extract_imagesets()[0].get_detector()
-      if detector[0].get_type() == 'SENSOR_PAD':
-        # smaller default value for pixel array detectors
-        params.spotfinder.filter.min_spot_size = 3
-      else:
-        params.spotfinder.filter.min_spot_size = 6
-      logger.info('Setting spotfinder.filter.min_spot_size=%i' %(
-        params.spotfinder.filter.min_spot_size))
+    SpotFinderFactory.configure_min_spot_size(params, datablock)
 
     # Get the integrator from the input parameters
     logger.info('Configuring spot finder from input parameters')
@@ -208,6 +416,33 @@ def from_pickle(filename):
       assert(isinstance(result, reflection_table))
       return result
 
+  @staticmethod
+  def from_file(filename, columns=None, rows=None, nproc=None):
+    '''
+    Read the reflection table from file. Files in the columnar format are
+    memory mapped so that only the requested columns and rows are read from
+    disk, and the columns are decoded in parallel; any other file is read as
+    a pickle file and the columns and rows are then selected.
+
+    :param filename: The reflection filename
+    :param columns: The list of columns to read (default all)
+    :param rows: The (start, stop) range of rows to read (default all)
+    :param nproc: The number of threads to read the columns with (default
+                  the number of processors)
+    :return: The reflection table
+
+    '''
+    from dials.util import columnar
+    if columnar.is_columnar_file(filename):
+      if nproc is None:
+        from libtbx.introspection import number_of_processors
+        nproc = number_of_processors(return_value_if_unknown=1)
+      return columnar.read(filename, columns, rows=rows, nproc=nproc)
+    table = reflection_table.from_pickle(filename)
+    if columns is None and rows is None:
+      return table
+    return columnar.select(table, columns, rows)
+
   @staticmethod
   def from_h5(filename):
     '''
@@ -323,6 +558,16 @@ def as_pickle(self, filename):
     with smart_open.for_writing(filename, 'wb') as outfile:
       pickle.dump(self, outfile, protocol=pickle.HIGHEST_PROTOCOL)
 
+  def as_file(self, filename):
+    '''
+    Write the reflection table in the columnar file format.
+
+    :param filename: The output filename
+
+    '''
+    from dials.util import columnar
+    columnar.write(self, filename)
+
   def as_h5(self, filename):
     '''
     Write the reflection table as a HDF5 file.
@@ -354,35 +599,45 @@ def sort(self, name, reverse=False, order=None):
     :param order: For multi element items specify order
 
     '''
-    import __builtin__
-    if type(self[name]) in [
-        vec2_double,
-        vec3_double,
-        mat3_double,
-        int6,
-        miller_index ]:
-      data = self[name]
-      if order is None:
-        perm = flex.size_t(
-          __builtin__.sorted(
-            range(len(self)),
-            key=lambda x: data[x],
-            reverse=reverse))
-      else:
-        assert len(order) == len(data[0])
-        def compare(x, y):
-          a = tuple(x[i] for i in order)
-          b = tuple(y[i] for i in order)
-          return cmp(a, b)
-        perm = flex.size_t(
-          __builtin__.sorted(
-            range(len(self)),
-            key=lambda x: data[x],
-            cmp=compare,
-            reverse=reverse))
+    self.reorder(self.sort_permutation(name, reverse=reverse, order=order))
+
+  def sort_permutation(self, name, reverse=False, order=None):
+    '''
+    Get the permutation which sorts the reflection table by a key. Columns
+    with multi element items are sorted lexicographically by their elements.
+    The sort is stable so rows with equal keys keep their relative order.
+
+    :param name: The name of the column
+    :param reverse: Reverse the sort order
+    :param order: For multi element items specify order
+    :return: The sort permutation
+
+    '''
+    data = self[name]
+    if type(data) == mat3_double:
+      flat = data.as_double()
+      index = flex.size_t_range(len(data)) * 9
+      parts = [flat.select(index + i) for i in range(9)]
+    elif type(data) == miller_index:
+      parts = data.as_vec3_double().parts()
+    elif type(data) in [vec2_double, vec3_double, int6]:
+      parts = data.parts()
+    else:
+      return flex.sort_permutation(data, reverse=reverse)
+    if order is None:
+      order = range(len(parts))
     else:
-      perm = flex.sort_permutation(self[name], reverse=reverse)
-    self.reorder(perm)
+      assert len(order) == len(parts)
+
+    # Sort by each element in turn starting with the least significant. As
+    # each sort is stable, the result is sorted lexicographically.
+    perm = flex.size_t_range(len(data))
+    for i in reversed(order):
+      perm = perm.select(flex.sort_permutation(
+        parts[i].select(perm),
+        reverse=reverse,
+        stable=True))
+    return perm
 
   def match(self, other):
     '''
@@ -406,69 +661,48 @@ def match_with_reference(self, other):
     :return: The matches
 
     '''
-    from collections import defaultdict
-    import __builtin__
     logger.info("Matching reference spots with predicted reflections")
     logger.info(' %d observed reflections input' % len(other))
     logger.info(' %d reflections predicted' % len(self))
 
-    # Get the miller index, entering flag and turn number for
-    # Both sets of reflections
-    i1 = self['id']
-    h1 = self['miller_index']
-    e1 = self['entering'].as_int()
-    x1, y1, z1 = self['xyzcal.px'].parts()
-    p1 = self['panel']
-
-    i2 = other['id']
-    h2 = other['miller_index']
-    e2 = other['entering'].as_int()
-    x2, y2, z2 = other['xyzcal.px'].parts()
-    p2 = other['panel']
-
-    class Match(object):
-      def __init__(self):
-        self.a = []
-        self.b = []
-
-    # Create the match lookup
-    lookup = defaultdict(Match)
-    for i in range(len(self)):
-      item = h1[i] + (e1[i], i1[i], p1[i])
-      lookup[item].a.append(i)
-
-    # Add matches from input reflections
-    for i in range(len(other)):
-      item = h2[i] + (e2[i], i2[i], p2[i])
-      if item in lookup:
-        lookup[item].b.append(i)
-
-    # Create the list of matches
-    match1 = []
-    match2 = []
-    for item, value in lookup.iteritems():
-      if len(value.b) == 0:
-        continue
-      elif len(value.a) == 1 and len(value.b) == 1:
-        match1.append(value.a[0])
-        match2.append(value.b[0])
-      else:
-        matched = {}
-        for i in value.a:
-          d = []
-          for j in value.b:
-            dx = x1[i]-x2[j]
-            dy = y1[i]-y2[j]
-            dz = z1[i]-z2[j]
-            d.append((i,j,dx**2 + dy**2 + dz**2))
-          i, j, d = __builtin__.min(d, key=lambda x: x[2])
-          if j not in matched:
-            matched[j] = (i, d)
-          elif d < matched[j][1]:
-            matched[j] = (i, d)
-        for key1, value1 in matched.iteritems():
-          match1.append(value1[0])
-          match2.append(key1)
+    # Pack the miller index, entering flag, experiment id and panel for both
+    # sets of reflections into a single key
+    keys = _pack_match_keys(self, other)
+    if keys is None:
+      match1, match2 = _match_nearest(
+        self, flex.size_t_range(len(self)),
+        other, flex.size_t_range(len(other)))
+    else:
+      k1, k2 = keys
+      dup1 = _duplicated(k1)
+      dup2 = _duplicated(k2)
+
+      # Reflections whose key is unique in both tables match directly
+      u1 = flex.size_t_range(len(k1)).select(~dup1)
+      u2 = flex.size_t_range(len(k2)).select(~dup2)
+      i1, i2 = _join_unique(k1.select(u1), k2.select(u2))
+      match1 = u1.select(i1)
+      match2 = u2.select(i2)
+
+      # Otherwise find the candidate reflections whose key is duplicated in
+      # either table and match them by their nearest predicted position
+      if dup1.count(True) > 0 or dup2.count(True) > 0:
+        d1 = flex.size_t_range(len(k1)).select(dup1)
+        d2 = flex.size_t_range(len(k2)).select(dup2)
+        c1 = u1.select(_join_unique(
+          k1.select(u1), _unique(k2.select(d2)))[0])
+        c2 = u2.select(_join_unique(
+          k2.select(u2), _unique(k1.select(d1)))[0])
+        d1.extend(c1)
+        d2.extend(c2)
+        a1, a2 = _match_nearest(self, d1, other, d2)
+        match1.extend(a1)
+        match2.extend(a2)
+
+      # Order the matches by reflection
+      perm = flex.sort_permutation(match1)
+      match1 = match1.select(perm)
+      match2 = match2.select(perm)
 
     # Select everything which matches
     sind = flex.size_t(match1)
@@ -905,39 +1139,7 @@ def compute_shoebox_overlap_fraction(self, overlaps):
     :return: The fraction of shoebox overlapped with other reflections
 
     '''
-    from dials.array_family import flex
-    result = flex.double(len(self))
-    bbox = self['bbox']
-    for i in range(len(self)):
-      b1 = bbox[i]
-      xs = b1[1] - b1[0]
-      ys = b1[3] - b1[2]
-      zs = b1[5] - b1[4]
-      assert(xs > 0)
-      assert(ys > 0)
-      assert(zs > 0)
-      mask = flex.bool(flex.grid(zs,ys,xs),False)
-      for edge in overlaps.adjacent_vertices(i):
-        b2 = bbox[edge]
-        x0 = b2[0]-b1[0]
-        x1 = b2[1]-b1[0]
-        y0 = b2[2]-b1[2]
-        y1 = b2[3]-b1[2]
-        z0 = b2[4]-b1[4]
-        z1 = b2[5]-b1[4]
-        if x0 < 0: x0 = 0
-        if y0 < 0: y0 = 0
-        if z0 < 0: z0 = 0
-        if x1 > xs: x1 = xs
-        if y1 > ys: y1 = ys
-        if z1 > zs: z1 = zs
-        assert(x1 > x0)
-        assert(y1 > y0)
-        assert(z1 > z0)
-        m2 = flex.bool(flex.grid(z1-z0,y1-y0,x1-x0),True)
-        mask[z0:z1,y0:y1,x0:x1] = m2
-      result[i] = (1.0*mask.count(True)) / mask.size()
-    return result
+    return _shoebox_overlap_fraction(self['bbox'], overlaps)
 
 
 class reflection_table_selector(object):
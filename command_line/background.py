@@ -23,6 +23,7 @@
   .multiple = True
 plot = False
   .type = bool
+include scope dials.util.image_cache.phil_scope
 """, process_includes=True)
 
 def main():
@@ -65,13 +66,17 @@ def run(args):
   if params.frames:
     images = params.frames
 
+  from dials.util.image_cache import SharedImageCache
+  image_cache = SharedImageCache.from_parameters(params.image_cache)
+
   d_spacings = []
   intensities = []
   sigmas = []
 
   for indx in images:
     print 'For frame %d:' % indx
-    d, I, sig = background(imageset, indx, n_bins=params.n_bins)
+    d, I, sig = background(imageset, indx, n_bins=params.n_bins,
+                           image_cache=image_cache)
 
     print '%8s %8s %8s' % ('d', 'I', 'sig')
     for j in range(len(I)):
@@ -90,7 +95,7 @@ def run(args):
 
     pyplot.show()
 
-def background(imageset, indx, n_bins):
+def background(imageset, indx, n_bins, image_cache=None):
   from dials.array_family import flex
   from libtbx.phil import parse
   from scitbx import matrix
@@ -110,7 +115,10 @@ def background(imageset, indx, n_bins):
     from libtbx.utils import Sorry
     raise Sorry('Detector not perpendicular to beam')
 
-  data = imageset.get_raw_data(indx)
+  if image_cache is not None:
+    data = image_cache.get_raw_data(imageset, indx)
+  else:
+    data = imageset.get_raw_data(indx)
   assert(len(data) == 1)
   data = data[0]
   negative = (data < 0)
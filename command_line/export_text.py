@@ -4,10 +4,15 @@
 
 if __name__ == '__main__':
   import sys
-  if len(sys.argv) != 2:
-    raise RuntimeError('%s integrated.pickle')
+  if len(sys.argv) not in (2, 3):
+    raise RuntimeError('%s integrated.pickle [output.txt[.gz]]')
 
   import cPickle as pickle
 
   integrated_data = pickle.load(open(sys.argv[1], 'rb'))
-  export_text(integrated_data)
+  if len(sys.argv) == 3:
+    from dials.util.export_records import open_output
+    with open_output(sys.argv[2]) as out:
+      export_text(integrated_data, out=out)
+  else:
+    export_text(integrated_data)
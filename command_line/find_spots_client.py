@@ -31,6 +31,9 @@ def response_to_xml(d):
     assert 'error' in d
     return '<response>\n%s\n</response>' %d['error']
 
+  if 'mode' in d:
+    response = '\n'.join([response, '<mode>%s</mode>' %d['mode']])
+
   if 'lattices' in d:
     from dxtbx.model.crystal import CrystalFactory
     for lattice in d['lattices']:
@@ -37,6 +37,7 @@
   <d_min_method_1>1.92</d_min_method_1>
   <d_min_method_2>1.68</d_min_method_2>
   <total_intensity>56215</total_intensity>
+  <mode>full</mode>
   </response>
 
 
@@ -47,6 +48,17 @@
 * ``d_min_method_2`` is equivalent to distl's resolution estimate method 2
 * ``total_intensity`` is the total intensity of all strong spots excluding those
   at resolutions where ice rings may be found
+* ``mode`` is ``full`` if the spots were found by full spot finding, or
+  ``quick_look`` if the numbers were estimated by the quick look
+
+For a fast answer during grid scans the spot count and resolution may instead
+be estimated from the pixel statistics of a binned image, e.g.::
+
+  dials.find_spots_client /path/to/image.cbf quick_look.mode=always
+
+With ``quick_look.mode=screen`` the full analysis is only run for images where
+the quick look finds at least ``quick_look.escalate_min_spots`` spots. The quick
+look does not give the distl resolution estimates, which are reported as -1.
 
 Any valid ``dials.find_spots`` parameter may be passed to
 ``dials.find_spots_client``, e.g.::
@@ -74,6 +86,32 @@ def work(filename, cl=None):
   .type = bool
 indexing_min_spots = 10
   .type = int(value_min=1)
+quick_look {
+  mode = *off screen always
+    .type = choice
+    .help = "Estimate the spot count and resolution from the pixel statistics"
+            "of a binned image rather than by full spot finding. With 'screen'"
+            "the full analysis is only run if the quick look finds at least"
+            "escalate_min_spots spots, with 'always' the quick look estimate"
+            "is always returned."
+  escalate_min_spots = 20
+    .type = int(value_min=0)
+    .help = "The number of spots (excluding ice rings) the quick look must"
+            "find for the full analysis to be run in 'screen' mode"
+  bin_size = 2
+    .type = int(value_min=1)
+    .help = "Sum the pixels in blocks of this size"
+  region = None
+    .type = ints(size=4)
+    .help = "Only look at this region of each panel (x0, x1, y0, y1)"
+  sigma_strong = 6
+    .type = float(value_min=0)
+    .help = "The number of standard deviations above the background for a"
+            "binned pixel to be strong"
+  n_resolution_bins = 20
+    .type = int(value_min=1)
+    .help = "The number of resolution shells used to estimate the background"
+}
 ''')
   if not os.access(filename, os.R_OK):
     raise RuntimeError("Server does not have read access to file %s" %filename)
@@ -84,6 +122,7 @@ def work(filename, cl=None):
   index = params.extract().index
   integrate = params.extract().integrate
   indexing_min_spots = params.extract().indexing_min_spots
+  quick_look = params.extract().quick_look
 
   from dials.command_line.find_spots import phil_scope as find_spots_phil_scope
   from dxtbx.datablock import DataBlockFactory
@@ -97,12 +136,29 @@ def work(filename, cl=None):
   # no need to write the hot mask in the server/client
   params.spotfinder.write_hot_mask = False
   datablock = DataBlockFactory.from_filenames([filename])[0]
+  from dials.algorithms.spot_finding import per_image_analysis
+  imageset = datablock.extract_imagesets()[0]
+
+  if quick_look.mode != 'off':
+    t0 = time.time()
+    stats = per_image_analysis.quick_look_single_image(
+      imageset,
+      bin_size=quick_look.bin_size,
+      region=quick_look.region,
+      sigma_strong=quick_look.sigma_strong,
+      n_bins=quick_look.n_resolution_bins,
+      filter_ice=filter_ice)
+    stats = stats.__dict__
+    stats['mode'] = 'quick_look'
+    logger.info('Quick look took %.2f seconds' %(time.time()-t0))
+    if (quick_look.mode == 'always' or
+        stats['n_spots_no_ice'] < quick_look.escalate_min_spots):
+      return stats
+
   t0 = time.time()
   reflections = flex.reflection_table.from_observations(datablock, params)
   t1 = time.time()
   logger.info('Spotfinding took %.2f seconds' %(t1-t0))
-  from dials.algorithms.spot_finding import per_image_analysis
-  imageset = datablock.extract_imagesets()[0]
   scan = imageset.get_scan()
   if scan is not None:
     i = scan.get_array_range()[0]
@@ -111,6 +167,7 @@ def work(filename, cl=None):
   stats = per_image_analysis.stats_single_image(
     imageset, reflections, i=i, plot=False, filter_ice=filter_ice)
   stats = stats.__dict__
+  stats['mode'] = 'full'
   t2 = time.time()
   logger.info('Resolution analysis took %.2f seconds' %(t2-t1))
 
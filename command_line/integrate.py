@@ -277,6 +277,7 @@ def run(self):
         logger.info('*' * 80)
         logger.info('')
       rubbish.extend(unmatched)
+      del matched, unmatched
 
       if len(experiments) > 1:
         # filter out any experiments without matched reference reflections
@@ -306,6 +307,7 @@ def refl_extend(src, dest, eid):
         predicted = f_predicted
         experiments = f_experiments
         rubbish = f_rubbish
+        del f_reference, f_predicted, f_rubbish
 
     # Select a random sample of the predicted reflections
     if not params.sampling.integrate_all_reflections:
@@ -330,6 +332,10 @@ def refl_extend(src, dest, eid):
     logger.info("")
     integrator = IntegratorFactory.create(params, experiments, predicted)
 
+    # The integrator now owns the predictions; drop this reference so that they
+    # can be released while integrating
+    del predicted
+
     # Integrate the reflections
     reflections = integrator.integrate()
 
@@ -9,11 +9,8 @@
 
 from __future__ import absolute_import, division
 
-from scitbx.array_family import flex
-from cctbx import uctbx, sgtbx
-from iotbx import ccp4_map, phil
-import dials.algorithms.rs_mapper as recviewer
-import math
+from cctbx import uctbx
+from iotbx import phil
 
 help_message = '''
 This program reconstructs reciprocal space from diffraction images. The orientation matrix is not necessary; only diffraction geometry is required.
@@ -50,6 +47,20 @@
   reverse_phi = False
     .type = bool
     .optional = True
+  nproc = 1
+    .type = int(value_min=1)
+    .help = "The number of processes to split the frames between. With a"
+            "dense grid each process holds a grid of 12*grid_size^3 bytes."
+  grid_type = *auto dense tiled
+    .type = choice
+    .help = "Accumulate the map in a dense grid, or in a grid of tiles which"
+            "are only allocated when used and which is written to the map"
+            "file a slab at a time. By default the tiled grid is used when"
+            "the frames are split between processes, so that each process"
+            "only holds the tiles its frames touch."
+  tile_size = 32
+    .type = int(value_min=1)
+    .help = "The number of voxels along each axis of a tile"
 }
 """, process_includes=True)
 
@@ -101,51 +112,70 @@ def run(self):
         self.grid_size = params.rs_mapper.grid_size
         self.max_resolution = params.rs_mapper.max_resolution
 
-        self.grid = flex.double(flex.grid(self.grid_size, self.grid_size, self.grid_size), 0)
-        self.cnts = flex.int(flex.grid(self.grid_size, self.grid_size, self.grid_size), 0)
+        self.nproc = params.rs_mapper.nproc
+        if params.rs_mapper.grid_type == 'auto':
+            self.tiled = self.nproc > 1
+        else:
+            self.tiled = params.rs_mapper.grid_type == 'tiled'
+        self.tile_size = params.rs_mapper.tile_size
 
+        self.voxels = None
         for datablock in self.datablocks:
             for imageset in datablock.extract_imagesets():
                 self.process_imageset(imageset)
 
-        recviewer.normalize_voxels(self.grid, self.cnts)
         # Let's use 1/(100A) as the unit so that the absolute numbers in the
         # "cell dimensions" field of the ccp4 map are typical for normal
         # MX maps. The values in 1/A would give the "cell dimensions" around
         # or below 1 and some MX programs would not handle it well.
         box_size = 100 * 2.0 / self.max_resolution
         uc = uctbx.unit_cell((box_size, box_size, box_size, 90, 90, 90))
-        ccp4_map.write_ccp4_map(self.map_file, uc, sgtbx.space_group("P1"),
-                                (0, 0, 0), self.grid.all(), self.grid,
-                                flex.std_string(["cctbx.miller.fft_map"]))
+        self.voxels.write_ccp4_map(
+            self.map_file, uc, ["cctbx.miller.fft_map"])
+        self.voxels = None
 
     def process_imageset(self, imageset):
-        rec_range = 1 / self.max_resolution
-
-        panel = imageset.get_detector()[0]
-        beam = imageset.get_beam()
-        s0 = beam.get_s0()
-        pixel_size = panel.get_pixel_size()
-        xlim, ylim = imageset.get_raw_data(0)[0].all()
-
-        # cache transformation
-        xy = recviewer.get_target_pixels(panel, s0, xlim, ylim, self.max_resolution)
-
-        s1 = panel.get_lab_coord(xy * pixel_size[0]) # FIXME: assumed square pixel
-        s1 = s1 / s1.norms() * (1 / beam.get_wavelength())
-        S = s1 - s0
-        npoints = self.grid.all()[0]
-
-        for i in xrange(len(imageset)):
-            step = 2 * rec_range / npoints
-            axis = imageset.get_goniometer().get_rotation_axis()
-            osc_range = imageset.get_scan(i).get_oscillation_range()
-            print "Oscillation range: %.1f - %.1f" % (osc_range[0], osc_range[1])
-            angle = (osc_range[0] + osc_range[1]) / 2 / 180 * math.pi
-            if not self.reverse_phi: # FIXME: ???
-                angle *= -1
-            rotated_S = S.rotate_around_origin(axis, angle)
-            recviewer.fill_voxels(imageset.get_raw_data(i)[0], self.grid, self.cnts, rotated_S, xy, rec_range)
+        '''Map the frames of an imageset, split between processes, and
+        merge the grid from each process as it arrives.'''
+        from dials.algorithms.rs_mapper.mapper import ImagesetMapper
+
+        mapper = ImagesetMapper(
+            imageset, self.max_resolution, self.grid_size,
+            reverse_phi=self.reverse_phi, tiled=self.tiled,
+            tile_size=self.tile_size)
+
+        # Split the frames into one contiguous range for each process
+        nframes = len(imageset)
+        nproc = max(min(self.nproc, nframes), 1)
+        bounds = [nframes * j // nproc for j in range(nproc + 1)]
+        frames = zip(bounds[:-1], bounds[1:])
+
+        def merge(result):
+            first, last = result.frames
+            start = imageset.get_scan(first).get_oscillation_range()[0]
+            end = imageset.get_scan(last - 1).get_oscillation_range()[1]
+            print "Oscillation range: %.1f - %.1f" % (start, end)
+            if self.voxels is None:
+                self.voxels = result.grid
+            else:
+                self.voxels.merge(result.grid)
+            # Release the grid so that easy_mp only keeps the empty result
+            result.grid = None
+
+        if nproc > 1:
+            from libtbx import easy_mp
+            easy_mp.parallel_map(
+                func=mapper,
+                iterable=frames,
+                processes=nproc,
+                method="multiprocessing",
+                preserve_order=False,
+                asynchronous=True,
+                callback=merge,
+                preserve_exception_message=True)
+        else:
+            for f in frames:
+                merge(mapper(f))
 
 if __name__ == '__main__':
   from dials.util import halraiser
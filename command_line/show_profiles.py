@@ -16,7 +16,7 @@ def show_profiles(integrated_pickle, isig_limit = None):
   from dials.array_family import flex
   import math
 
-  integrated_data = flex.reflection_table.from_pickle(integrated_pickle)
+  integrated_data = flex.reflection_table.from_file(integrated_pickle)
 
   for j, r in enumerate(integrated_data):
     if isig_limit is not None:
@@ -63,12 +63,6 @@ def __init__(self):
       read_reflections=True,
       epilog=help_message)
 
-  @staticmethod
-  def sort_permutation(column, reverse=False):
-    indices = flex.size_t_range(len(column))
-    perm = sorted(indices, key=lambda k: column[k], reverse=reverse)
-    return flex.size_t(perm)
-
   def run(self):
     '''Execute the script.'''
     from dials.array_family import flex # import dependency
@@ -90,8 +84,7 @@ def run(self):
 
     # Sort the reflections
     print "Sorting by %s with reverse=%r" % (params.key, params.reverse)
-    perm = self.sort_permutation(reflections[params.key], params.reverse)
-    reflections = reflections.select(perm)
+    reflections.sort(params.key, reverse=params.reverse)
 
     if options.verbose > 0:
       print "Head of sorted list " + attr + ":"
@@ -33,6 +33,9 @@
   .type = bool
 id = None
   .type = int(value_min=0)
+nproc = Auto
+  .type = int(value_min=1)
+  .help = "The number of processes to compute the per-image statistics with"
 """)
 
 def run(args):
@@ -75,9 +78,13 @@ def run(args):
   if params.id is not None:
     reflections = reflections.select(reflections['id'] == params.id)
 
+  if params.nproc is libtbx.Auto:
+    from libtbx.introspection import number_of_processors
+    params.nproc = number_of_processors(return_value_if_unknown=-1)
+
   stats = per_image_analysis.stats_imageset(
     imageset, reflections, resolution_analysis=params.resolution_analysis,
-    plot=params.individual_plots)
+    plot=params.individual_plots, nproc=params.nproc)
   per_image_analysis.print_table(stats)
 
   from libtbx import table_utils
@@ -37,6 +37,13 @@
       .type = bool
       .help = If True, if an image fails to process, continue to the next image. \
               otherwise, halt processing and show the error.
+    warm_workers = False
+      .expert_level = 2
+      .type = bool
+      .help = If True, configure the spot finder and integration parameters once per \
+              process and reuse them for every image, and only copy the indexing and \
+              refinement parameters per image. Assumes all images share the same \
+              detector type and gain.
   }
 
   output {
@@ -85,6 +92,18 @@
     nproc = 1
       .type = int(value_min=1)
       .help = "The number of processes to use."
+    mpi {
+      method = *striping work_queue
+        .type = choice
+        .help = "How images are divided between MPI ranks. striping: each"
+                "rank processes a fixed interleaved subset of the images."
+                "work_queue: rank 0 hands out batches of images to the other"
+                "ranks as they finish their previous batch."
+      batch_size = 1
+        .type = int(value_min=1)
+        .help = "The number of images handed out per request in work_queue"
+                "mode."
+    }
   }
 '''
 
@@ -182,6 +201,81 @@ def do_import(filename):
 
   return DataBlockFactory.from_imageset(reset_sets)[0]
 
+class ItemCounter(object):
+  '''Iterate through a set of items, counting how many were taken.'''
+
+  def __init__(self, items):
+    self.items = items
+    self.count = 0
+
+  def __iter__(self):
+    for item in self.items:
+      self.count += 1
+      yield item
+
+def dispatch_work_queue(comm, num_items, batch_size):
+  '''
+  Hand out batches of item indices to the other MPI ranks as they request
+  them. When there are no items left, each rank is sent None on its next
+  request.
+
+  :param comm: The MPI communicator
+  :param num_items: The number of items to process
+  :param batch_size: The number of items per batch
+
+  '''
+  from mpi4py import MPI
+  status = MPI.Status()
+  next_item = 0
+  num_finished = 0
+  while num_finished < comm.Get_size() - 1:
+    comm.recv(source=MPI.ANY_SOURCE, status=status)
+    source = status.Get_source()
+    if next_item < num_items:
+      batch = range(next_item, min(next_item + batch_size, num_items))
+      next_item += len(batch)
+      logger.debug("Sending items %d-%d of %d to rank %d" % (
+        batch[0], batch[-1], num_items, source))
+    else:
+      batch = None
+      num_finished += 1
+    comm.send(batch, dest=source)
+
+def request_work_queue(comm):
+  '''
+  Request batches of item indices from rank 0 until none are left.
+
+  :param comm: The MPI communicator
+  :return: A generator of item indices
+
+  '''
+  while True:
+    comm.send(comm.Get_rank(), dest=0)
+    batch = comm.recv(source=0)
+    if batch is None:
+      break
+    for index in batch:
+      yield index
+
+def log_mpi_statistics(stats):
+  '''
+  Log the number of items processed by each rank and the throughput.
+
+  :param stats: A list of (rank, number of items, time taken) tuples
+
+  '''
+  from libtbx.table_utils import format as table
+  rows = [["Rank", "# images", "Time (s)", "Images / s"]]
+  for rank, count, elapsed in stats:
+    rows.append([
+      "%d" % rank,
+      "%d" % count,
+      "%.2f" % elapsed,
+      "%.2f" % (count / elapsed if elapsed > 0 else 0)])
+  logger.info("")
+  logger.info("Per-rank throughput:")
+  logger.info(table(rows, has_header=True, justify='right', prefix=' '))
+
 class Script(object):
   '''A class for running the script.'''
 
@@ -343,7 +437,7 @@ def do_work(item_set):
           imagesets = datablock.extract_imagesets()
           if len(imagesets) == 0 or len(imagesets[0]) == 0:
             logger.info("Zero length imageset in file: %s"%filename)
-            return
+            continue
           if len(imagesets) > 1:
             raise Abort("Found more than one imageset in file: %s"%filename)
           if len(imagesets[0]) > 1:
@@ -367,8 +461,25 @@ def do_work(item_set):
       rank = comm.Get_rank() # each process in MPI has a unique id, 0-indexed
       size = comm.Get_size() # size: number of processes running in this job
 
-      subset = [item for i, item in enumerate(iterable) if (i+rank)%size == 0]
-      do_work((rank, subset))
+      # In work queue mode rank 0 only hands out images to the other ranks
+      start_time = time()
+      if params.mp.mpi.method == 'work_queue' and size > 1:
+        if rank == 0:
+          dispatch_work_queue(comm, len(iterable), params.mp.mpi.batch_size)
+          counter = ItemCounter([])
+        else:
+          counter = ItemCounter(
+            iterable[i] for i in request_work_queue(comm))
+          do_work((rank, counter))
+      else:
+        counter = ItemCounter(
+          [item for i, item in enumerate(iterable) if (i+rank)%size == 0])
+        do_work((rank, counter))
+
+      # Report the throughput of each rank
+      stats = comm.gather((rank, counter.count, time() - start_time), root=0)
+      if rank == 0:
+        log_mpi_statistics(stats)
     else:
       from dxtbx.command_line.image_average import splitit
       easy_mp.parallel_map(
@@ -383,10 +494,54 @@ def do_work(item_set):
     logger.info("")
     logger.info("Total Time Taken = %f seconds" % (time() - st))
 
+class StageTiming(object):
+  '''Accumulate the setup and total time spent in each processing stage.'''
+
+  def __init__(self):
+    self.stages = []
+    self.count = {}
+    self.setup = {}
+    self.total = {}
+
+  def add(self, stage, setup, total):
+    '''
+    Add the timing for one image
+
+    :param stage: The name of the stage
+    :param setup: The time spent configuring the stage
+    :param total: The total time spent in the stage
+
+    '''
+    if stage not in self.count:
+      self.stages.append(stage)
+      self.count[stage] = 0
+      self.setup[stage] = 0
+      self.total[stage] = 0
+    self.count[stage] += 1
+    self.setup[stage] += setup
+    self.total[stage] += total
+
+  def __str__(self):
+    from libtbx.table_utils import format as table
+    rows = [["Stage", "# images", "Setup (s)", "Total (s)", "Setup / image (s)"]]
+    for stage in self.stages:
+      rows.append([
+        stage,
+        "%d" % self.count[stage],
+        "%.2f" % self.setup[stage],
+        "%.2f" % self.total[stage],
+        "%.4f" % (self.setup[stage] / self.count[stage])])
+    return table(rows, has_header=True, justify='right', prefix=' ')
+
 class Processor(object):
   def __init__(self, params, composite_tag = None):
     self.params = params
     self.composite_tag = composite_tag
+    self.timing = StageTiming()
+
+    # Algorithm objects reused between images with dispatch.warm_workers
+    self.spot_finder = None
+    self.integration_parameters = None
 
     # The convention is to put %s in the phil parameter to add a tag to
     # each output datafile. Save the initial templates here.
@@ -466,15 +621,27 @@ def process_datablock(self, tag, datablock):
 
   def find_spots(self, datablock):
     from time import time
-    from dials.array_family import flex
+    from dials.algorithms.spot_finding.factory import SpotFinderFactory
     st = time()
 
     logger.info('*' * 80)
     logger.info('Finding Strong Spots')
     logger.info('*' * 80)
 
+    # Configure the spot finder
+    spot_finder = self.spot_finder
+    if spot_finder is None:
+      logger.info('Configuring spot finder from input parameters')
+      SpotFinderFactory.configure_min_spot_size(self.params, datablock)
+      spot_finder = SpotFinderFactory.from_parameters(
+        datablock=datablock,
+        params=self.params)
+      if self.params.dispatch.warm_workers:
+        self.spot_finder = spot_finder
+    setup_time = time() - st
+
     # Find the strong spots
-    observed = flex.reflection_table.from_observations(datablock, self.params)
+    observed = spot_finder(datablock)
 
     # Reset z coordinates for dials.image_viewer; see Issues #226 for details
     xyzobs = observed['xyzobs.px.value']
@@ -494,6 +661,7 @@ def find_spots(self, datablock):
 
     logger.info('')
     logger.info('Time Taken = %f seconds' % (time() - st))
+    self.timing.add('spotfinding', setup_time, time() - st)
     return observed
 
   def index(self, datablock, reflections):
@@ -508,7 +676,16 @@ def index(self, datablock, reflections):
 
     imagesets = datablock.extract_imagesets()
 
-    params = copy.deepcopy(self.params)
+    # The indexer only modifies the indexing and refinement parameters, so
+    # with warm workers only copy those
+    if self.params.dispatch.warm_workers:
+      params = copy.copy(self.params)
+      params.indexing = copy.deepcopy(self.params.indexing)
+      params.refinement = copy.deepcopy(self.params.refinement)
+    else:
+      params = copy.deepcopy(self.params)
+    setup_time = time() - st
+
     # don't do scan-varying refinement during indexing
     params.refinement.parameterisation.scan_varying = False
 
@@ -559,6 +736,7 @@ def index(self, datablock, reflections):
 
     logger.info('')
     logger.info('Time Taken = %f seconds' % (time() - st))
+    self.timing.add('indexing', setup_time, time() - st)
     return experiments, indexed
 
   def refine(self, experiments, centroids):
@@ -573,6 +751,7 @@ def refine(self, experiments, centroids):
 
       refiner = RefinerFactory.from_parameters_data_experiments(
         self.params, centroids, experiments)
+      setup_time = time() - st
 
       refiner.run()
       experiments = refiner.get_experiments()
@@ -612,6 +791,7 @@ def refine(self, experiments, centroids):
     if self.params.dispatch.refine:
       logger.info('')
       logger.info('Time Taken = %f seconds' % (time() - st))
+      self.timing.add('refinement', setup_time, time() - st)
 
     return experiments, centroids
 
@@ -652,7 +832,13 @@ def integrate(self, experiments, indexed):
       force_scan_varying=self.params.prediction.force_scan_varying)
     predicted.match_with_reference(indexed)
     logger.info("")
-    integrator = IntegratorFactory.create(self.params, experiments, predicted)
+    setup_start = time()
+    integrator = IntegratorFactory.create(
+      self.params, experiments, predicted,
+      parameters=self.integration_parameters)
+    if self.params.dispatch.warm_workers:
+      self.integration_parameters = integrator.params
+    setup_time = time() - setup_start
 
     # Integrate the reflections
     integrated = integrator.integrate()
@@ -720,6 +906,7 @@ def integrate(self, experiments, indexed):
 
     logger.info('')
     logger.info('Time Taken = %f seconds' % (time() - st))
+    self.timing.add('integration', setup_time, time() - st)
     return integrated
 
   def write_integration_pickles(self, integrated, experiments, callback = None):
@@ -827,6 +1014,11 @@ def save_reflections(self, reflections, filename):
 
   def finalize(self):
     ''' Perform any final operations '''
+    if len(self.timing.stages) > 0:
+      logger.info('')
+      logger.info('Time spent in each stage:')
+      logger.info(str(self.timing))
+
     if self.params.output.composite_output:
       # Dump composite files to disk
       if len(self.all_indexed_experiments) > 0 and self.params.output.refined_experiments_filename:
@@ -16,24 +16,36 @@
 from dxtbx.serialize.load import datablock # implicit import
 
 
-def reflections(infile):
+def reflections(infile, columns=None, rows=None, nproc=None):
   '''
-  Load the given reflection file.
+  Load the given reflection file. Files in the columnar format are read
+  directly so that only the requested columns and rows are decoded.
 
   :params infile: The input filename or file object
+  :params columns: The list of columns to read (default all)
+  :params rows: The (start, stop) range of rows to read (default all)
+  :params nproc: The number of threads to read the columns with
   :returns: The reflection list
 
   '''
   import cPickle as pickle
+  from dials.util import columnar
 
   # If the input is a string then open and read from that file
   if isinstance(infile, str):
+    if columnar.is_columnar_file(infile):
+      from dials.array_family import flex
+      return flex.reflection_table.from_file(
+        infile, columns=columns, rows=rows, nproc=nproc)
     with open(infile, 'rb') as infile:
-      return pickle.load(infile)
+      result = pickle.load(infile)
 
   # Otherwise assume the input is a file and read from it
   else:
-    return pickle.load(infile)
+    result = pickle.load(infile)
+  if columns is None and rows is None:
+    return result
+  return columnar.select(result, columns, rows)
 
 def reference(infile):
   '''
@@ -0,0 +1,22 @@
+from __future__ import absolute_import, division
+
+import pytest
+
+from scitbx import fftpack
+from scitbx.array_family import flex
+from dials.algorithms.indexing.fft3d import real_fft3d_power
+
+@pytest.mark.parametrize("gridding", [(8, 10, 9), (6, 6, 6), (5, 4, 2)])
+@pytest.mark.parametrize("nproc", [1, 3])
+def test_real_fft3d_power(gridding, nproc):
+  flex.set_random_seed(0)
+  grid = flex.random_double(gridding[0] * gridding[1] * gridding[2])
+  grid.reshape(flex.grid(gridding))
+
+  fft = fftpack.complex_to_complex_3d(gridding)
+  expected = flex.pow2(flex.real(fft.forward(flex.complex_double(
+    reals=grid, imags=flex.double(grid.size(), 0)))))
+
+  result = real_fft3d_power(grid, nproc=nproc)
+  assert result.all() == gridding
+  assert result.as_1d().all_approx_equal(expected.as_1d(), 1e-6)
@@ -0,0 +1,72 @@
+from __future__ import absolute_import, division
+
+import math
+
+import pytest
+
+from scitbx.array_family import flex
+from dials.algorithms.indexing.real_space_grid_search import \
+  compute_functional_batch
+
+@pytest.mark.parametrize("nproc,max_block_elements", [
+  (1, 2**22), (1, 50), (4, 50)])
+def test_compute_functional_batch(nproc, max_block_elements):
+  flex.set_random_seed(0)
+  rlp = flex.vec3_double(flex.random_double(3 * 20) - 0.5)
+  vectors = flex.vec3_double(100 * flex.random_double(3 * 37))
+  result = compute_functional_batch(
+    rlp, vectors, nproc=nproc, max_block_elements=max_block_elements)
+  assert len(result) == len(vectors)
+  for v, f in zip(vectors, result):
+    expected = flex.sum(flex.cos(2 * math.pi * rlp.dot(v)))
+    assert f == pytest.approx(expected)
+
+@pytest.mark.parametrize("optimise", [False, True])
+@pytest.mark.parametrize("coarse_grid", [None, 0.1])
+def test_real_space_grid_search(optimise, coarse_grid):
+  import iotbx.phil
+  from cctbx import uctbx
+  from scitbx import matrix
+  from scitbx.math import euler_angles_as_matrix
+  from dials.array_family import flex as dials_flex
+  from dials.algorithms.indexing.indexer import master_phil_scope
+  from dials.algorithms.indexing.real_space_grid_search import \
+    indexer_real_space_grid_search
+
+  # The reciprocal lattice points of a rotated orthorhombic cell
+  unit_cell = uctbx.unit_cell((20, 30, 40, 90, 90, 90))
+  U = euler_angles_as_matrix((10, 20, 30))
+  B = matrix.sqr(unit_cell.fractionalization_matrix()).transpose()
+  rlp = flex.vec3_double([
+    (U * B * matrix.col((h, k, l))).elems
+    for h in range(-3, 4) for k in range(-3, 4) for l in range(-3, 4)
+    if (h, k, l) != (0, 0, 0)])
+  reflections = dials_flex.reflection_table()
+  reflections['rlp'] = rlp
+  reflections['id'] = dials_flex.int(len(rlp), -1)
+
+  params = master_phil_scope.fetch(iotbx.phil.parse('''
+    indexing {
+      known_symmetry.unit_cell = 20,30,40,90,90,90
+      optimise_initial_basis_vectors = %s
+      real_space_grid_search.coarse_grid = %s
+    }''' % (optimise, coarse_grid))).extract()
+
+  # Only the grid search is tested, so skip the set up of the imagesets and
+  # choose the first candidate rather than refining each of them
+  indexer = indexer_real_space_grid_search.__new__(
+    indexer_real_space_grid_search)
+  indexer.reflections = reflections
+  indexer.all_params = params
+  indexer.params = params.indexing
+  indexer._setup_symmetry()
+  candidates = []
+  def choose_best_orientation_matrix(candidate_orientation_matrices):
+    candidates.extend(candidate_orientation_matrices)
+    return candidates[0], len(rlp)
+  indexer.choose_best_orientation_matrix = choose_best_orientation_matrix
+
+  indexer.real_space_grid_search()
+  assert len(indexer.candidate_crystal_models) == 1
+  assert indexer.candidate_crystal_models[0].get_unit_cell().is_similar_to(
+    unit_cell)
@@ -0,0 +1,48 @@
+from __future__ import absolute_import, division
+
+from cctbx import uctbx
+from dials.algorithms.indexing.indexer import \
+  Solution, SolutionTrackerFilter, SolutionTrackerWeighted
+
+class FakeCrystal(object):
+
+  def __init__(self, a):
+    self.unit_cell = uctbx.unit_cell((a, a, a, 90, 90, 90))
+
+  def get_unit_cell(self):
+    return self.unit_cell
+
+def make_solution(a, n_indexed, rmsd, n_total=1000):
+  return Solution(
+    model_likelihood=1.0 - rmsd,
+    crystal=FakeCrystal(a),
+    rmsds=(rmsd, rmsd, 0.001),
+    n_indexed=n_indexed,
+    fraction_indexed=n_indexed / n_total,
+    hkl_offset=(0, 0, 0))
+
+def test_filter_is_dominant():
+  solutions = SolutionTrackerFilter(check_doubled_cell=False)
+  assert not solutions.is_dominant(100)
+  solutions.append(make_solution(50, 900, 0.1))
+  assert solutions.is_dominant(44)
+  assert not solutions.is_dominant(45)
+
+  # A solution that passes the first filter can change the best solution,
+  # here by having a higher likelihood and a cell 1.25 times smaller
+  assert not solutions.is_dominant(800)
+  best = solutions.best_solution()
+  solutions.append(make_solution(40, 850, 0.05))
+  assert solutions.best_solution() is not best
+
+def test_weighted_is_dominant():
+  solutions = SolutionTrackerWeighted(power=1)
+  assert not solutions.is_dominant(100)
+  solutions.append(make_solution(50, 800, 0.1))
+  solutions.append(make_solution(100, 400, 0.2))
+  best = solutions.best_solution()
+
+  # A candidate indexing fewer reflections with a smaller cell still wins
+  assert not solutions.is_dominant(300)
+  solutions.append(make_solution(30, 300, 0.1))
+  assert solutions.best_solution() is not best
@@ -0,0 +1,49 @@
+from __future__ import absolute_import, division
+
+import pytest
+
+from dials.algorithms.integration.processor import ImageReader
+
+class FakeImageset(object):
+
+  def __init__(self, num_images, fail_at=None):
+    self.num_images = num_images
+    self.fail_at = fail_at
+
+  def __len__(self):
+    return self.num_images
+
+  def get_corrected_data(self, index):
+    if index == self.fail_at:
+      raise RuntimeError("Bad image %d" % index)
+    return (index,)
+
+  def get_mask(self, index):
+    return (index % 2 == 0,)
+
+@pytest.mark.parametrize("depth", [0, 1, 3, 20])
+def test_images_are_read_in_order(depth):
+  reader = ImageReader(FakeImageset(10), depth=depth)
+  items = list(reader)
+  assert items == [((i,), (i % 2 == 0,)) for i in range(10)]
+  assert reader.read_time >= 0
+  assert reader.wait_time >= 0
+
+def test_lookup_mask_is_combined_with_image_mask():
+  reader = ImageReader(FakeImageset(4), lookup_mask=(False,), depth=2)
+  assert [mask for image, mask in reader] == [(False,)] * 4
+
+def test_read_errors_are_raised_in_caller():
+  reader = ImageReader(FakeImageset(10, fail_at=5), depth=3)
+  items = []
+  with pytest.raises(RuntimeError):
+    for item in reader:
+      items.append(item)
+  assert len(items) == 5
+
+def test_stopping_early_finishes_reader():
+  reader = ImageReader(FakeImageset(100), depth=2)
+  for i, item in enumerate(reader):
+    if i == 3:
+      break
+  assert item == ((3,), (False,))
@@ -0,0 +1,112 @@
+from __future__ import absolute_import, division
+
+from dials.array_family import flex
+from dials.algorithms.integration.processor import ReflectionSpool
+
+def make_table(partial_id, value):
+  table = flex.reflection_table()
+  table['partial_id'] = flex.size_t(partial_id)
+  table['value'] = flex.double(value)
+  table.set_flags(flex.bool(len(table), False), table.flags.dont_integrate)
+  return table
+
+def test_split_reflections_are_held_until_complete(tmpdir):
+  reflections = make_table([0, 1, 1, 2, 3, 3, 3, 4], [0] * 8)
+  reflections.set_flags(
+    flex.bool([False] * 7 + [True]), reflections.flags.dont_integrate)
+  spool = ReflectionSpool(tmpdir.mkdir('spool').strpath, reflections)
+  assert not spool.finished()
+
+  # Reflection 4 is not integrated and has no output columns
+  not_integrated = flex.reflection_table()
+  not_integrated['partial_id'] = flex.size_t([4])
+  spool.append(not_integrated)
+  assert len(spool.filenames) == 1
+
+  # The partials of reflections 1 and 3 are spread over three jobs
+  spool.append(make_table([0, 1, 3], [10, 11, 13]))
+  assert len(spool.filenames) == 2
+  assert len(spool.pending) == 2
+  spool.append(make_table([1, 2, 3], [21, 22, 23]))
+  assert len(spool.filenames) == 3
+  assert len(spool.pending) == 2
+  spool.append(make_table([3], [33]))
+  assert len(spool.filenames) == 4
+  assert len(spool.pending) == 0
+  assert spool.finished()
+
+  filename = tmpdir.join('result.refl').strpath
+  spool.write(filename)
+  spool.cleanup()
+  assert not tmpdir.join('spool').check()
+
+  result = flex.reflection_table.from_file(filename)
+  assert list(result['partial_id']) == [4, 0, 2, 1, 1, 3, 3, 3]
+  assert list(result['value']) == [0, 10, 22, 11, 21, 13, 23, 33]
+
+class FakeReader(object):
+  def is_single_file_reader(self):
+    return False
+
+class FakeImageset(object):
+  def __len__(self):
+    return 20
+  def reader(self):
+    return FakeReader()
+
+class FakeScan(object):
+  def __len__(self):
+    return 20
+  def get_array_range(self):
+    return (0, 20)
+
+class FakeExperiment(object):
+  def __init__(self):
+    self.imageset = FakeImageset()
+    self.scan = FakeScan()
+
+def test_manager_releases_the_input_reflections(tmpdir, monkeypatch):
+  import weakref
+  from dials.algorithms.integration.processor import Manager
+  from dials.algorithms.integration.processor import NullTask
+  from dials.algorithms.integration.processor import Parameters
+
+  # Don't compute the partiality, which needs real experiments
+  monkeypatch.setattr(
+    Manager, 'split_reflections', lambda self: self.jobs.split(self.reflections))
+
+  # Reflections spread over the frames, some crossing the job boundaries
+  reflections = flex.reflection_table()
+  reflections['id'] = flex.int(10, 0)
+  reflections['panel'] = flex.size_t(10, 0)
+  reflections['flags'] = flex.size_t(10, 0)
+  reflections['bbox'] = flex.int6(
+    [(0, 2, 0, 2, 2 * i, 2 * i + 3) for i in range(9)] + [(0, 2, 0, 2, 0, 1)])
+  reflections['value'] = flex.double(range(10))
+  reflections.set_flags(
+    flex.bool([False] * 9 + [True]), reflections.flags.dont_integrate)
+  reference = weakref.ref(reflections)
+
+  params = Parameters()
+  params.block.size = 5
+  params.block.units = 'frames'
+  params.block.spool = True
+  params.block.spool_directory = tmpdir.strpath
+  manager = Manager([FakeExperiment()], reflections, params)
+  manager.executor = object()
+  del reflections
+  manager.initialize()
+  try:
+    assert reference() is None
+    assert 'value' not in manager.reflections
+    for task in manager.tasks():
+      assert manager.job_reflections[task.index] is None
+      manager.accumulate(NullTask(task.index, task.reflections)())
+    manager.finalize()
+    filename, _ = manager.result()
+  finally:
+    manager.cleanup()
+
+  result = flex.reflection_table.from_file(filename)
+  assert set(result['partial_id']) == set(range(10))
+  assert list(result['value']) == list(result['partial_id'].as_double())
@@ -288,3 +288,40 @@
                                        0.0333446685335,
                                        0.000347402754278))
 print "OK"
+
+###############################
+# Undo known parameter shifts #
+###############################
+
+s0_param.set_param_vals(s0_p_vals)
+det_param.set_param_vals(det_p_vals)
+xlo_param.set_param_vals(xlo_p_vals)
+xluc_param.set_param_vals(xluc_p_vals)
+
+##################################################################
+# Set up the LSTBX refinement engine with persistent MP workers  #
+##################################################################
+
+overrides="""minimiser.parameters.engine=GaussNewton
+minimiser.parameters.verbosity=0
+minimiser.parameters.logfile=None"""
+refiner = setup_minimiser.Extract(master_phil,
+                                  mytarget,
+                                  pred_param,
+                                  local_overrides = overrides).refiner
+refiner.set_nproc(2)
+refiner.set_persistent_workers(True)
+
+try:
+  refiner.run()
+finally:
+  refiner.close_workers()
+
+# The normal equations summed from the workers give the same result as
+# accumulating them in a single process
+assert mytarget.achieved()
+assert refiner.get_num_steps() == 1
+assert approx_equal(mytarget.rmsds(), (0.00508252354876,
+                                       0.00420954552156,
+                                       8.97303428289e-05))
+print "OK"
@@ -0,0 +1,58 @@
+from __future__ import absolute_import, division
+
+import random
+
+import pytest
+
+from dials.array_family import flex
+from dials.model.data import Shoebox
+from dials.algorithms.spot_finding.factory import BackgroundGradientFilter
+
+class FakePanel(object):
+
+  def get_trusted_range(self):
+    return (-1, 1000)
+
+def make_shoebox(nx, ny, a, b):
+  sbox = Shoebox(0, (10, 10 + nx, 20, 20 + ny, 0, 1))
+  sbox.allocate()
+  data = flex.float(flex.grid(1, ny, nx))
+  for j in range(ny):
+    for i in range(nx):
+      data[0, j, i] = 10 + a * i + b * j + random.uniform(-1, 1)
+  # a saturated pixel which should not be used in the background
+  data[0, 0, 0] = 5000
+  sbox.data = data
+  return sbox
+
+def expected_gradients(sbox, buffer_size):
+  from dials.algorithms.background.simple import Linear2dModeller
+  trusted_range = FakePanel().get_trusted_range()
+  data = sbox.data
+  nz, ny, nx = data.all()
+  mask = flex.bool(data.accessor(), False)
+  for j in range(ny):
+    for i in range(nx):
+      foreground = (j >= buffer_size and j < ny - buffer_size and
+                    i >= buffer_size and i < nx - buffer_size)
+      value = data[0, j, i]
+      if not foreground and trusted_range[0] < value < trusted_range[1]:
+        mask[0, j, i] = True
+  model = Linear2dModeller().create(data.as_double(), mask)
+  return model.params()[1:3]
+
+def test_fit_gradients():
+  random.seed(0)
+  shoeboxes = flex.shoebox()
+  for nx, ny, a, b in [(7, 5, 1, 2), (5, 9, -3, 0.5), (6, 6, 0, 0)]:
+    shoeboxes.append(make_shoebox(nx, ny, a, b))
+  # too few background pixels to fit
+  shoeboxes.append(make_shoebox(1, 3, 0, 0))
+
+  a, b, valid = BackgroundGradientFilter.fit_gradients(
+    shoeboxes, [FakePanel()], buffer_size=1)
+  assert list(valid) == [True, True, True, False]
+  for i in range(3):
+    ea, eb = expected_gradients(shoeboxes[i], 1)
+    assert a[i] == pytest.approx(ea)
+    assert b[i] == pytest.approx(eb)
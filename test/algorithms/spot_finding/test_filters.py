@@ -0,0 +1,68 @@
+from __future__ import absolute_import, division
+
+import random
+
+from scitbx.array_family import flex
+from dials.algorithms.spot_finding.factory import \
+  FilterRunner, SpotDensityFilter
+
+class FakeColumns(object):
+
+  def __init__(self, xyzobs_px):
+    self.xyzobs_px = xyzobs_px
+
+def spot_density_reference(flags, xyzobs_px, nbins=50, gradient_cutoff=0.002):
+  # The filter as it was implemented with per-bin loops
+  import numpy as np
+  obs_x, obs_y, obs_z = xyzobs_px.parts()
+  H, xedges, yedges = np.histogram2d(
+    obs_x.as_numpy_array(), obs_y.as_numpy_array(), bins=nbins)
+  H_flex = flex.double(H.flatten().astype(np.float64))
+  hist = flex.histogram(H_flex, n_slots=min(int(flex.max(H_flex)), 30))
+  slots = hist.slots()
+  cumulative_hist = flex.double(len(slots))
+  for i in range(len(slots)):
+    cumulative_hist[i] = slots[i]
+    if i > 0:
+      cumulative_hist[i] += cumulative_hist[i-1]
+  cumulative_hist /= flex.max(cumulative_hist)
+  cutoff = None
+  gradients = flex.double()
+  for i in range(len(slots)-1):
+    g = (cumulative_hist[i+1] - cumulative_hist[i])/hist.slot_width()
+    gradients.append(g)
+    if (cutoff is None and i > 0 and
+        g < gradient_cutoff and gradients[i-1] < gradient_cutoff):
+      cutoff = hist.slot_centers()[i-1]-0.5*hist.slot_width()
+  for (ix, iy) in np.column_stack(np.where(H > cutoff)):
+    flags.set_selected(
+      ((obs_x > xedges[ix]) & (obs_x < xedges[ix+1]) &
+       (obs_y > yedges[iy]) & (obs_y < yedges[iy+1])), False)
+  return flags
+
+def test_spot_density_filter():
+  random.seed(0)
+  xyz = flex.vec3_double()
+  for i in range(5000):
+    xyz.append((random.uniform(0, 1000), random.uniform(0, 1000), 0))
+  # a dense cluster of spots, e.g. from an ice ring
+  for i in range(2000):
+    xyz.append((random.uniform(500, 540), random.uniform(200, 240), 0))
+  expected = spot_density_reference(flex.bool(len(xyz), True), xyz)
+  assert expected.count(False) > 0
+
+  flags = SpotDensityFilter().run(
+    flex.bool(len(xyz), True), columns=FakeColumns(xyz))
+  assert list(flags) == list(expected)
+
+def test_filter_runner_timing():
+  class EvenFilter(object):
+    def __call__(self, flags, **kwargs):
+      return flags & flex.bool([i % 2 == 0 for i in range(len(flags))])
+
+  runner = FilterRunner([EvenFilter()])
+  flags = runner(flex.bool(10, True), columns=FakeColumns(None))
+  assert flags.count(True) == 5
+
+  table = FilterRunner.timing_table([("EvenFilter", 10, 5, 0.1)])
+  assert "EvenFilter" in table
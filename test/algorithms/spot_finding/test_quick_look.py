@@ -0,0 +1,83 @@
+from __future__ import absolute_import, division
+
+import numpy as np
+
+from dials.array_family import flex
+from dials.algorithms.spot_finding.per_image_analysis import \
+  quick_look_single_image
+
+class FakePanel(object):
+
+  def get_pixel_size(self):
+    return (0.172, 0.172)
+
+  def get_origin(self):
+    return (-17.2, 17.2, -100.0)
+
+  def get_fast_axis(self):
+    return (1.0, 0.0, 0.0)
+
+  def get_slow_axis(self):
+    return (0.0, -1.0, 0.0)
+
+class FakeBeam(object):
+
+  def get_s0(self):
+    return (0.0, 0.0, -1.0)
+
+  def get_wavelength(self):
+    return 1.0
+
+class FakeImageset(object):
+
+  def __init__(self, image):
+    ny, nx = image.shape
+    self.data = flex.int(image.astype(int).ravel().tolist())
+    self.data.reshape(flex.grid(ny, nx))
+    self.mask = flex.bool(flex.grid(ny, nx), True)
+
+  def get_detector(self):
+    return [FakePanel()]
+
+  def get_beam(self):
+    return FakeBeam()
+
+  def get_raw_data(self, index):
+    return (self.data,)
+
+  def get_mask(self, index):
+    return (self.mask,)
+
+def make_image(spots, size=200, background=10):
+  np.random.seed(0)
+  image = np.random.poisson(background, (size, size)).astype(np.float64)
+  y, x = np.mgrid[0:size,0:size]
+  for xc, yc in spots:
+    image += 500 * np.exp(-((x - xc)**2 + (y - yc)**2) / 2.0)
+  return image
+
+spots = [(x, y) for x in range(15, 200, 30) for y in range(15, 200, 30)]
+
+def test_spots_are_counted():
+  stats = quick_look_single_image(
+    FakeImageset(make_image(spots)), filter_ice=False)
+  assert abs(stats.n_spots_total - len(spots)) <= 2
+  assert stats.n_spots_no_ice == stats.n_spots_total
+  assert stats.n_spots_4A == stats.n_spots_total
+  assert stats.total_intensity > 0
+  assert stats.estimated_d_min > 0
+  assert stats.d_min_distl_method_1 == -1
+
+def test_region_is_used():
+  region = (0, 100, 0, 200)
+  stats = quick_look_single_image(
+    FakeImageset(make_image(spots)), region=region, filter_ice=False)
+  expected = len([x for x, y in spots if x < 100])
+  assert abs(stats.n_spots_total - expected) <= 2
+
+def test_blank_image():
+  image = np.full((200, 200), 10.0)
+  stats = quick_look_single_image(FakeImageset(image), filter_ice=False)
+  assert stats.n_spots_total == 0
+  assert stats.total_intensity == 0
+  assert stats.estimated_d_min == -1
@@ -0,0 +1,48 @@
+from __future__ import absolute_import, division
+
+import random
+
+from dials.array_family import flex
+from dials.model.data import PixelList, PixelListLabeller
+from dials.algorithms.spot_finding.finder import StreamingPanelLabeller
+
+def components(labeller):
+  # The set of 3D connected components as sets of (z, y, x) coordinates
+  result = {}
+  for label, coord in zip(labeller.labels_3d(), labeller.coords()):
+    result.setdefault(label, set()).add(coord)
+  return set(frozenset(c) for c in result.values())
+
+def make_pixel_lists(num_frames, size):
+  random.seed(0)
+  pixel_lists = []
+  for frame in range(num_frames):
+    image = flex.double(flex.grid(size), 0)
+    mask = flex.bool(flex.grid(size), False)
+    for i in range(len(mask)):
+      if random.random() < 0.3:
+        image[i] = random.uniform(1, 100)
+        mask[i] = True
+    # a hot pixel which is strong on every image
+    mask[0] = True
+    pixel_lists.append(PixelList(frame, image, mask))
+  return pixel_lists
+
+def test_streaming_labeller_finds_same_components():
+  pixel_lists = make_pixel_lists(20, (12, 15))
+
+  labeller = PixelListLabeller()
+  for plist in pixel_lists:
+    labeller.add(plist)
+  expected = components(labeller)
+
+  streaming = StreamingPanelLabeller()
+  result = set()
+  for i, plist in enumerate(pixel_lists):
+    streaming.add(plist)
+    if i % 3 == 0:
+      result |= components(streaming.pop_finished())
+  result |= components(streaming.pop_finished(finish_all=True))
+  assert result == expected
+
+  assert 0 in streaming.hot_pixels()
@@ -0,0 +1,150 @@
+from __future__ import absolute_import, division
+
+import pytest
+
+from dials.array_family import flex
+from dials.util import columnar
+
+def make_table():
+  table = flex.reflection_table()
+  table['id'] = flex.int([0, 1, 2])
+  table['flags'] = flex.size_t([1, 2, 4])
+  table['entering'] = flex.bool([True, False, True])
+  table['intensity.sum.value'] = flex.double([1.5, 2.5, 3.5])
+  table['xyzcal.px'] = flex.vec3_double([(1, 2, 3), (4, 5, 6), (7, 8, 9)])
+  table['miller_index'] = flex.miller_index([(1, 0, 0), (0, -1, 2), (3, 4, -5)])
+  table['bbox'] = flex.int6([(0, 2, 0, 3, 0, 1), (1, 3, 1, 4, 2, 4), (0, 1, 0, 1, 0, 1)])
+  table['label'] = flex.std_string(['a', '', 'xyz'])
+  return table
+
+def test_round_trip(tmpdir):
+  filename = tmpdir.join('table.refl').strpath
+  table = make_table()
+  table.as_file(filename)
+  assert columnar.is_columnar_file(filename)
+
+  result = flex.reflection_table.from_file(filename)
+  assert len(result) == len(table)
+  assert sorted(result.keys()) == sorted(table.keys())
+  for key in table.keys():
+    assert list(result[key]) == list(table[key])
+
+def test_read_selected_columns(tmpdir):
+  filename = tmpdir.join('table.refl').strpath
+  make_table().as_file(filename)
+  result = flex.reflection_table.from_file(
+    filename, columns=['miller_index', 'intensity.sum.value'])
+  assert sorted(result.keys()) == ['intensity.sum.value', 'miller_index']
+  assert list(result['intensity.sum.value']) == [1.5, 2.5, 3.5]
+  with pytest.raises(KeyError):
+    flex.reflection_table.from_file(filename, columns=['missing'])
+
+def test_pickle_fallback(tmpdir):
+  filename = tmpdir.join('table.pickle').strpath
+  make_table().as_pickle(filename)
+  assert not columnar.is_columnar_file(filename)
+  result = flex.reflection_table.from_file(filename, columns=['id'])
+  assert result.keys() == ['id']
+  assert list(result['id']) == [0, 1, 2]
+
+def test_non_ascii_strings(tmpdir):
+  filename = tmpdir.join('table.refl').strpath
+  table = flex.reflection_table()
+  table['label'] = flex.std_string(['\xc3\xa5', '\xff\x00b', 'plain'])
+  table.as_file(filename)
+  for rows in [None, (1, 3)]:
+    result = flex.reflection_table.from_file(filename, rows=rows)
+    expected = list(table['label'])[slice(*rows) if rows else slice(None)]
+    assert list(result['label']) == expected
+    assert all(isinstance(s, str) for s in result['label'])
+
+def test_shoeboxes(tmpdir):
+  filename = tmpdir.join('table.refl').strpath
+  table = make_table()
+  table['panel'] = flex.size_t(3, 0)
+  table['shoebox'] = flex.shoebox(table['panel'], table['bbox'], allocate=True)
+  table.as_file(filename)
+
+  result = flex.reflection_table.from_file(filename, columns=['shoebox'])
+  for a, b in zip(table['shoebox'], result['shoebox']):
+    assert a.bbox == b.bbox
+    assert a.panel == b.panel
+    assert a.data.all() == b.data.all()
+    assert list(a.data) == list(b.data)
+    assert list(a.mask) == list(b.mask)
+    assert list(a.background) == list(b.background)
+
+def test_read_selected_rows(tmpdir):
+  filename = tmpdir.join('table.refl').strpath
+  table = make_table()
+  table['panel'] = flex.size_t(3, 0)
+  table['shoebox'] = flex.shoebox(table['panel'], table['bbox'], allocate=True)
+  table.as_file(filename)
+
+  result = flex.reflection_table.from_file(filename, rows=(1, 3))
+  expected = table[1:3]
+  assert len(result) == 2
+  for key in table.keys():
+    if key == 'shoebox':
+      for a, b in zip(expected[key], result[key]):
+        assert a.bbox == b.bbox
+        assert list(a.data) == list(b.data)
+    else:
+      assert list(result[key]) == list(expected[key])
+
+  result = flex.reflection_table.from_file(
+    filename, columns=['label'], rows=(2, 10))
+  assert list(result['label']) == ['xyz']
+  assert len(flex.reflection_table.from_file(filename, rows=(5, 10))) == 0
+  with pytest.raises(ValueError):
+    flex.reflection_table.from_file(filename, rows=(2, 1))
+
+def test_parallel_read(tmpdir):
+  filename = tmpdir.join('table.refl').strpath
+  table = make_table()
+  table.as_file(filename)
+
+  reader = columnar.ColumnarReader(filename)
+  result = reader.read(nproc=4)
+  assert reader.timing.keys() == table.keys()
+  assert all(t >= 0 for t in reader.timing.values())
+  for key in table.keys():
+    assert list(result[key]) == list(table[key])
+
+def test_pickle_fallback_rows(tmpdir):
+  from dials.model.serialize import load
+  filename = tmpdir.join('table.pickle').strpath
+  make_table().as_pickle(filename)
+  result = load.reflections(filename, columns=['id', 'label'], rows=(1, 3))
+  assert sorted(result.keys()) == ['id', 'label']
+  assert list(result['id']) == [1, 2]
+  assert list(result['label']) == ['', 'xyz']
+
+def test_concatenate(tmpdir):
+  table = make_table()
+  table['panel'] = flex.size_t(3, 0)
+  table['shoebox'] = flex.shoebox(table['panel'], table['bbox'], allocate=True)
+  other = flex.reflection_table()
+  other['id'] = flex.int([5, 6])
+  filenames = [tmpdir.join('%d.refl' % i).strpath for i in range(3)]
+  table.as_file(filenames[0])
+  other.as_file(filenames[1])
+  table[1:].as_file(filenames[2])
+
+  filename = tmpdir.join('table.refl').strpath
+  columnar.concatenate(filenames, filename)
+  result = flex.reflection_table.from_file(filename)
+  assert len(result) == 7
+  assert list(result['id']) == [0, 1, 2, 5, 6, 1, 2]
+  assert list(result['label']) == ['a', '', 'xyz', '', '', '', 'xyz']
+  assert list(result['intensity.sum.value']) == [
+    1.5, 2.5, 3.5, 0, 0, 2.5, 3.5]
+  assert list(result['bbox'][3]) == [0] * 6
+  expected = list(table['shoebox']) + [None, None] + list(table['shoebox'][1:])
+  for a, b in zip(expected, result['shoebox']):
+    if a is None:
+      assert not b.is_allocated()
+    else:
+      assert a.bbox == b.bbox
+      assert list(a.data) == list(b.data)
+      assert list(a.mask) == list(b.mask)
@@ -33,6 +33,8 @@ def run(self):
     self.tst_split_partials()
     self.tst_split_partials_with_shoebox()
     self.tst_find_overlapping()
+    self.tst_match_with_reference()
+    self.tst_compute_shoebox_overlap_fraction()
 
   def tst_init(self):
     from dials.array_family import flex
@@ -682,6 +684,22 @@ def tst_sort(self):
     table.sort("c", order=(1,2,0))
     assert list(table['c']) == [(1, 1, 1), (2, 1, 1), (3, 1, 1), (3, 2, 1), (2, 4, 2)]
 
+    # Check the sort is stable
+    table['d'] = flex.int([0, 1, 2, 3, 4])
+    table['e'] = flex.vec3_double([(1, 0, 0), (0, 1, 0), (1, 0, 0), (0, 1, 0), (0, 0, 1)])
+    table.sort("e")
+    assert list(table['d']) == [4, 1, 3, 0, 2]
+    table.sort("e", reverse=True)
+    assert list(table['d']) == [0, 2, 1, 3, 4]
+
+    # Check other multi element types
+    table['f'] = flex.int6([(1,0,0,0,0,2), (1,0,0,0,0,1), (0,5,0,0,0,0), (1,0,0,0,0,1), (0,4,0,0,0,0)])
+    table.sort("f")
+    assert list(table['f']) == [(0,4,0,0,0,0), (0,5,0,0,0,0), (1,0,0,0,0,1), (1,0,0,0,0,1), (1,0,0,0,0,2)]
+    table['g'] = flex.mat3_double([(i % 2, 0, 0, 0, 0, 0, 0, 0, -i) for i in range(5)])
+    table.sort("g")
+    assert [m[8] for m in table['g']] == [-4, -2, 0, -3, -1]
+
     print "OK"
 
   def tst_flags(self):
@@ -1125,6 +1143,102 @@ def is_overlap(b0, b1, border):
 
     print 'OK'
 
+  def tst_match_with_reference(self):
+    from dials.array_family import flex
+    from random import randint, uniform, seed
+    seed(0)
+
+    def generate(N):
+      r = flex.reflection_table()
+      r['miller_index'] = flex.miller_index(
+        [(randint(-3,3), randint(-3,3), randint(-3,3)) for i in range(N)])
+      r['entering'] = flex.bool([randint(0,1) == 1 for i in range(N)])
+      r['id'] = flex.int([randint(0,1) for i in range(N)])
+      r['panel'] = flex.size_t([randint(0,1) for i in range(N)])
+      r['xyzcal.px'] = flex.vec3_double(
+        [(uniform(0,3), uniform(0,3), uniform(0,3)) for i in range(N)])
+      r['flags'] = flex.size_t(N, 0)
+      return r
+
+    def expected(r1, r2):
+      lookup = {}
+      for i in range(len(r1)):
+        key = r1['miller_index'][i] + (
+          r1['entering'][i], r1['id'][i], r1['panel'][i])
+        lookup.setdefault(key, ([], []))[0].append(i)
+      for j in range(len(r2)):
+        key = r2['miller_index'][j] + (
+          r2['entering'][j], r2['id'][j], r2['panel'][j])
+        if key in lookup:
+          lookup[key][1].append(j)
+      matches = set()
+      for a, b in lookup.itervalues():
+        if len(b) == 0:
+          continue
+        matched = {}
+        for i in a:
+          dist = lambda j: sum(
+            (u-v)**2 for u, v in zip(r1['xyzcal.px'][i], r2['xyzcal.px'][j]))
+          j = min(b, key=dist)
+          if j not in matched or dist(j) < matched[j][1]:
+            matched[j] = (i, dist(j))
+        for j, (i, d) in matched.iteritems():
+          if d < 4:
+            matches.add((i, j))
+      return matches
+
+    r1 = generate(2000)
+    r2 = generate(1000)
+    mask, matched, unmatched = r1.match_with_reference(r2)
+    assert len(matched) + len(unmatched) == len(r2)
+    indices = flex.size_t_range(len(r1)).select(mask)
+    assert len(indices) == len(matched)
+    exp = expected(r1, r2)
+    assert set(indices) == set(i for i, j in exp)
+    assert len(matched) == len(exp)
+    assert r1.get_flags(r1.flags.reference_spot).count(True) == len(exp)
+
+    print 'OK'
+
+  def tst_compute_shoebox_overlap_fraction(self):
+    from dials.array_family import flex
+    from random import randint, seed
+    seed(0)
+    N = 500
+    r = flex.reflection_table(N)
+    r['bbox'] = flex.int6(N)
+    r['panel'] = flex.size_t(N)
+    r['id'] = flex.int(N)
+    r['imageset_id'] = flex.int(N)
+    for i in range(N):
+      x0 = randint(0, 50)
+      y0 = randint(0, 50)
+      z0 = randint(0, 50)
+      r['bbox'][i] = (
+        x0, x0 + randint(1, 10),
+        y0, y0 + randint(1, 10),
+        z0, z0 + randint(1, 10))
+      r['panel'][i] = randint(0, 1)
+
+    overlaps = r.find_overlaps()
+    fraction = r.compute_shoebox_overlap_fraction(overlaps)
+    assert len(fraction) == N
+    bbox = r['bbox']
+    for i in range(N):
+      b1 = bbox[i]
+      xs, ys, zs = b1[1]-b1[0], b1[3]-b1[2], b1[5]-b1[4]
+      mask = flex.bool(flex.grid(zs,ys,xs), False)
+      for j in overlaps.adjacent_vertices(i):
+        b2 = bbox[j]
+        x0, x1 = max(b2[0]-b1[0], 0), min(b2[1]-b1[0], xs)
+        y0, y1 = max(b2[2]-b1[2], 0), min(b2[3]-b1[2], ys)
+        z0, z1 = max(b2[4]-b1[4], 0), min(b2[5]-b1[4], zs)
+        mask[z0:z1,y0:y1,x0:x1] = flex.bool(flex.grid(z1-z0,y1-y0,x1-x0), True)
+      expected = (1.0*mask.count(True)) / mask.size()
+      assert abs(fraction[i] - expected) < 1e-7
+
+    print 'OK'
+
 
 if __name__ == '__main__':
   from dials.test import cd_auto
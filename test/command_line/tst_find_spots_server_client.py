@@ -130,6 +130,19 @@ def exercise_client(port):
                   for node in xmldoc.getElementsByTagName('d_min')])
   assert d_min == sorted([1.45, 1.47, 1.55, 1.55, 1.56, 1.59, 1.61, 1.61, 1.64]), d_min
 
+  # now with the quick look
+  quick_look_command = " ".join([client_command, "quick_look.mode=always"])
+  result = easy_run.fully_buffered(command=quick_look_command).raise_if_errors()
+  out = "<document>%s</document>" %"\n".join(result.stdout_lines)
+  xmldoc = minidom.parseString(out)
+  assert len(xmldoc.getElementsByTagName('image')) == 9
+  modes = [node.childNodes[0].data
+           for node in xmldoc.getElementsByTagName('mode')]
+  assert modes == ['quick_look'] * 9, modes
+  spot_counts = [int(node.childNodes[0].data)
+                 for node in xmldoc.getElementsByTagName('spot_count')]
+  assert min(spot_counts) > 0, spot_counts
+
 
 if __name__ == '__main__':
   from dials.test import cd_auto
@@ -24,6 +24,7 @@ def run(self):
     self.test4()
     self.test_multi_sweep()
     self.test_multi_lattice()
+    self.test_cached_validation()
     self.test_output_rubbish()
 
   def test1(self):
@@ -286,6 +287,57 @@ def test_multi_lattice(self):
 
     print 'OK'
 
+  def test_cached_validation(self):
+    from os.path import join, exists
+    from libtbx import easy_run
+    import os
+
+    dirname ='cached_validation'
+    os.mkdir(dirname)
+    os.chdir(dirname)
+
+    # Integrate with and without caching the reference shoeboxes
+    import re
+    tables = []
+    images_read = []
+    for cache_shoeboxes in (False, True):
+      result = easy_run.fully_buffered([
+        'dials.integrate',
+        join(self.integration_test_data, 'multi_sweep', 'experiments.json'),
+        join(self.integration_test_data, 'multi_sweep', 'indexed.pickle'),
+        'prediction.padding=0',
+        'profile.validation.number_of_partitions=2',
+        'profile.validation.min_partition_size=10',
+        'profile.validation.cache_shoeboxes=%s' % cache_shoeboxes,
+      ]).raise_if_errors()
+
+      # The number of images read in each processing pass
+      images_read.append(sum(
+        int(match.group(1)) for match in (
+          re.search(r'Images read\D*(\d+)', line)
+          for line in result.stdout_lines) if match is not None))
+
+      import cPickle as pickle
+      tables.append(pickle.load(open('integrated.pickle', 'rb')))
+
+    # Check the cache has been removed
+    assert not any(f.startswith('shoebox_cache_') for f in os.listdir('.'))
+
+    # Check the results are the same
+    T1, T2 = tables
+    assert len(T1) == len(T2)
+    F1 = T1.get_flags(T1.flags.integrated_prf)
+    F2 = T2.get_flags(T2.flags.integrated_prf)
+    assert (F1 == F2).all_eq(True)
+    I1 = T1['intensity.prf.value'].select(F1)
+    I2 = T2['intensity.prf.value'].select(F2)
+    assert flex.abs(I1 - I2).all_lt(1e-6)
+
+    # Check the validation pass did not read the images again
+    assert images_read[0] > 0
+    assert images_read[1] < images_read[0], images_read
+
+    print 'OK'
 
   def test_output_rubbish(self):
     from os.path import join, exists
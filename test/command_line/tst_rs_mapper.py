@@ -53,6 +53,22 @@ def test1():
 
   print "OK"
 
+  # The map should be the same when the frames are split between processes
+  # and when accumulated in a tiled grid and written a slab at a time
+  for extra in ['nproc=3 grid_type=dense', 'nproc=2 tile_size=50',
+                'grid_type=tiled']:
+    cmd = 'dials.rs_mapper %s map_file="junk2.ccp4" %s' % (
+      datablock_path, extra)
+    result = easy_run.fully_buffered(command=cmd).raise_if_errors()
+    m2 = ccp4_map.map_reader(file_name="junk2.ccp4")
+    assert m2.data.all() == m.data.all()
+    assert approx_equal(m2.data, m.data)
+    assert approx_equal(m2.header_min, m.header_min)
+    assert approx_equal(m2.header_max, m.header_max)
+    assert approx_equal(m2.header_mean, m.header_mean)
+
+  print "OK"
+
   return
 
 def run():
@@ -33,6 +33,13 @@ def run():
     " d_min | d_min (distl method 1) | d_min (distl method 2) |"
     in result.stdout_lines), result.stdout_lines
 
+  # the statistics should not depend on the number of processes
+  cmd = "dials.spot_counts_per_image datablock.json strong.pickle nproc=1"
+  result_1 = easy_run.fully_buffered(cmd).raise_if_errors()
+  cmd = "dials.spot_counts_per_image datablock.json strong.pickle nproc=3"
+  result_3 = easy_run.fully_buffered(cmd).raise_if_errors()
+  assert result_1.stdout_lines == result_3.stdout_lines
+
 
 if __name__ == '__main__':
   from dials.test import cd_auto
@@ -122,6 +122,30 @@ def exercise_spotfinder():
 
   print 'OK'
 
+  # now exclude images with too many strong pixels rather than failing
+  args = ["dials.find_spots", ' '.join(template), "output.reflections=spotfinder.pickle",
+          "max_strong_pixel_fraction=0.00001",
+          "max_strong_pixel_fraction_action=exclude"]
+  result = easy_run.fully_buffered(command=" ".join(args)).raise_if_errors()
+  assert "Excluded" in "\n".join(result.stdout_lines)
+  assert os.path.exists("spotfinder.pickle")
+  with open("spotfinder.pickle", "rb") as f:
+    reflections = pickle.load(f)
+    assert len(reflections) < 653, len(reflections)
+
+  print 'OK'
+
+  # now label the spots while streaming the images
+  args = ["dials.find_spots", ' '.join(template), "output.reflections=spotfinder.pickle",
+          "streaming.enable=True", "streaming.chunk_frames=2"]
+  result = easy_run.fully_buffered(command=" ".join(args)).raise_if_errors()
+  assert os.path.exists("spotfinder.pickle")
+  with open("spotfinder.pickle", "rb") as f:
+    reflections = pickle.load(f)
+    assert len(reflections) == 653, len(reflections)
+
+  print 'OK'
+
 
   # now with XFEL stills
   data_dir = libtbx.env.find_in_repositories(
@@ -19,6 +19,7 @@ def __init__(self):
   def run(self):
     self.test_cspad_cbf_in_memory()
     self.test_sacla_h5()
+    self.test_sacla_h5(warm_workers=True)
 
   def test_cspad_cbf_in_memory(self):
     from os.path import join, exists
@@ -84,7 +85,7 @@ def test_cspad_cbf_in_memory(self):
 
     print 'OK'
 
-  def test_sacla_h5(self, in_memory=False):
+  def test_sacla_h5(self, in_memory=False, warm_workers=False):
     from os.path import join, exists
     from libtbx import easy_run
     import os
@@ -102,6 +103,7 @@ def test_sacla_h5(self, in_memory=False):
     f = open("process_sacla.phil", 'w')
     f.write("""
       dispatch.squash_errors = True
+      dispatch.warm_workers = %s
       input.reference_geometry=%s
       indexing {
         known_symmetry {
@@ -125,7 +127,7 @@ def test_sacla_h5(self, in_memory=False):
           detector.fix_list = Dist,Tau1
         }
       }
-      """%geometry_path)
+      """%(warm_workers, geometry_path))
     f.close()
 
     # Call dials.stills_process
@@ -71,3 +71,28 @@ def test_calculate_batch_ranges(self):
       assert all(isinstance(x, int) for x in itertools.chain(*self._run_ranges(data))), "Not all true integers"
       assert all([x > 0 for x in self._run_ranges_to_set([(0,0)])]), "Should be no zeroth/negative batch"
       assert not has_consecutive_ranges(self._run_ranges(data))
+
+def test_sum_partial_reflections():
+  from dials.array_family import flex
+  table = flex.reflection_table()
+  table['partial_id'] = flex.size_t([0, 1, 0, 2, 2, 3])
+  table['partiality'] = flex.double([0.5, 1.0, 0.4, 0.2, 0.2, 0.3])
+  table['intensity.sum.value'] = flex.double([10, 100, 20, 5, 6, 7])
+  table['intensity.sum.variance'] = flex.double([10, 100, 20, 5, 6, 7])
+  table['intensity.prf.value'] = flex.double([10, 100, 20, 5, 6, 7])
+  table['intensity.prf.variance'] = flex.double([5, 50, 10, 2, 3, 4])
+
+  result = export_mtz.sum_partial_reflections(table)
+
+  # The parts of partial 0 are summed into the first part, both parts of
+  # partial 2 are discarded as the total partiality is too low and the full
+  # reflection and single part partial are unchanged
+  assert list(result['partial_id']) == [0, 1, 3]
+  assert list(result['partiality']) == pytest.approx([0.9, 1.0, 0.3])
+  assert list(result['intensity.sum.value']) == pytest.approx([30, 100, 7])
+  assert list(result['intensity.sum.variance']) == pytest.approx([30, 100, 7])
+  # profile fitted values are weighted by (I/sig(I))^2: 20 and 40
+  assert list(result['intensity.prf.value']) == pytest.approx(
+    [1000 / 60, 100, 7])
+  assert list(result['intensity.prf.variance']) == pytest.approx(
+    [500 / 60, 50, 4])
@@ -0,0 +1,31 @@
+from __future__ import absolute_import, division
+
+import gzip
+
+import numpy as np
+
+from dials.array_family import flex
+from dials.util.export_records import \
+  format_records, miller_index_as_numpy, open_output, write_records
+
+def test_format_records_matches_per_row_formatting():
+  fmt = '%4d%8.2f %s\n'
+  a = flex.int(range(10))
+  b = np.linspace(0, 1, 10)
+  c = ['x%d' % i for i in range(10)]
+  expected = ''.join(fmt % row for row in zip(a, b, c))
+  for chunk_size in (1, 3, 10, 100):
+    chunks = list(format_records(fmt, [a, b, c], chunk_size=chunk_size))
+    assert len(chunks) == -(-10 // chunk_size)
+    assert ''.join(chunks) == expected
+
+def test_miller_index_as_numpy():
+  hkl = miller_index_as_numpy(flex.miller_index([(1, -2, 3), (-4, 5, 0)]))
+  assert hkl.tolist() == [[1, -2, 3], [-4, 5, 0]]
+
+def test_compressed_output(tmpdir):
+  filename = tmpdir.join('records.txt.gz').strpath
+  with open_output(filename) as fout:
+    write_records(fout, '%d %d\n', [range(5), range(5, 10)])
+  with gzip.open(filename, 'rb') as fin:
+    assert fin.read() == ''.join('%d %d\n' % (i, i + 5) for i in range(5))
@@ -0,0 +1,128 @@
+from __future__ import absolute_import, division
+
+import os
+
+import pytest
+
+from scitbx.array_family import flex
+from dials.util.image_cache import SharedImageCache
+
+class FakeData(object):
+
+  def empty(self):
+    return True
+
+class FakeItem(object):
+
+  def __init__(self):
+    self.data = FakeData()
+
+class FakeLookup(object):
+
+  def __init__(self):
+    self.gain = FakeItem()
+    self.pedestal = FakeItem()
+
+class FakeImageset(object):
+
+  def __init__(self, path, num_images):
+    self.path = path
+    self.num_images = num_images
+    self.external_lookup = FakeLookup()
+    self.num_reads = 0
+
+  def get_path(self, index):
+    return self.path
+
+  def indices(self):
+    return list(range(self.num_images))
+
+  def get_raw_data(self, index):
+    self.num_reads += 1
+    return (flex.int(flex.grid(10, 10), index),)
+
+def test_images_are_shared_between_caches(tmpdir):
+  path = tmpdir.join("images.h5")
+  path.write("")
+  directory = tmpdir.mkdir("cache").strpath
+  imageset = FakeImageset(path.strpath, 3)
+
+  cache1 = SharedImageCache(directory=directory)
+  cache2 = SharedImageCache(directory=directory)
+  for i in range(3):
+    assert list(cache1.get_raw_data(imageset, i)[0]) == [i] * 100
+  assert imageset.num_reads == 3
+  for i in range(3):
+    data = cache2.get_corrected_data(imageset, i)[0]
+    assert isinstance(data, flex.double)
+    assert list(data) == [i] * 100
+  assert imageset.num_reads == 3
+  assert cache2.hits == 3
+
+def test_least_recently_used_images_are_evicted(tmpdir):
+  import time
+  path = tmpdir.join("images.h5")
+  path.write("")
+  directory = tmpdir.mkdir("cache").strpath
+  imageset = FakeImageset(path.strpath, 3)
+
+  # Image 0 is used again after image 1 was added, so image 1 is evicted.
+  # Sleep so that the file modification times differ.
+  cache = SharedImageCache(directory=directory)
+  cache.get_raw_data(imageset, 0)
+  image_size = os.path.getsize(cache.filename(path.strpath, 0))
+  cache.max_bytes = int(2.5 * image_size)
+  time.sleep(0.1)
+  cache.get_raw_data(imageset, 1)
+  time.sleep(0.1)
+  cache.get_raw_data(imageset, 0)
+  assert cache.hits == 1
+  time.sleep(0.1)
+  cache.get_raw_data(imageset, 2)
+  assert os.path.exists(cache.filename(path.strpath, 0))
+  assert not os.path.exists(cache.filename(path.strpath, 1))
+  assert os.path.exists(cache.filename(path.strpath, 2))
+
+def test_size_limit_is_shared_between_caches(tmpdir):
+  path = tmpdir.join("images.h5")
+  path.write("")
+  directory = tmpdir.mkdir("cache").strpath
+  imageset = FakeImageset(path.strpath, 6)
+
+  caches = [SharedImageCache(directory=directory) for i in range(3)]
+  caches[0].get_raw_data(imageset, 0)
+  image_size = os.path.getsize(caches[0].filename(path.strpath, 0))
+  for cache in caches:
+    cache.max_bytes = int(2.5 * image_size)
+  for i in range(1, 6):
+    caches[i % 3].get_raw_data(imageset, i)
+  names = [name for name in os.listdir(caches[0].directory)
+           if name.endswith('.npz')]
+  assert len(names) == 2
+
+def test_cache_directory_is_private(tmpdir):
+  import getpass
+  import stat
+  cache = SharedImageCache(directory=tmpdir.strpath)
+  st = os.stat(cache.directory)
+  assert st.st_uid == os.getuid()
+  assert st.st_mode & (stat.S_IRWXG | stat.S_IRWXO) == 0
+
+  # A cache directory that other users can write to is rejected
+  shared = tmpdir.mkdir("shared")
+  directory = shared.mkdir("dials_image_cache_%s" % getpass.getuser())
+  directory.chmod(0o777)
+  with pytest.raises(RuntimeError):
+    SharedImageCache(directory=shared.strpath)
+
+def test_pickles_are_not_loaded(tmpdir):
+  import cPickle as pickle
+  path = tmpdir.join("images.h5")
+  path.write("")
+  imageset = FakeImageset(path.strpath, 1)
+  cache = SharedImageCache(directory=tmpdir.strpath)
+  with open(cache.filename(path.strpath, 0), 'wb') as outfile:
+    pickle.dump((flex.int(flex.grid(10, 10), 7),), outfile)
+  assert list(cache.get_raw_data(imageset, 0)[0]) == [0] * 100
+  assert cache.misses == 1
+  assert imageset.num_reads == 1
@@ -0,0 +1,26 @@
+from __future__ import absolute_import, division
+
+from dials.util.mp import dynamic_multi_node_parallel_map
+
+def square(x):
+  return x * x
+
+def test_dynamic_multi_node_parallel_map_processes_all_items():
+  results = []
+  dynamic_multi_node_parallel_map(
+    func     = square,
+    iterable = list(range(10)),
+    costs    = [1] * 10,
+    nproc    = 2,
+    callback = results.append)
+  assert sorted(results) == [x * x for x in range(10)]
+
+def test_dynamic_multi_node_parallel_map_largest_cost_first():
+  results = []
+  dynamic_multi_node_parallel_map(
+    func     = square,
+    iterable = [1, 2, 3, 4],
+    costs    = [10, 40, 20, 30],
+    nproc    = 1,
+    callback = results.append)
+  assert results == [4, 16, 9, 1]
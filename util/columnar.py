@@ -0,0 +1,657 @@
+#!/usr/bin/env python
+#
+# columnar.py
+#
+#  Copyright (C) 2018 Diamond Light Source
+#
+#  This code is distributed under the BSD license, a copy of which is
+#  included in the root directory of this package.
+#
+
+# Columnar reflection file format. The file contains a small header followed
+# by one contiguous, aligned buffer per column so that individual columns can
+# be memory mapped without reading the rest of the file:
+#
+#   8 bytes   magic string
+#   8 bytes   little endian length of the header
+#   n bytes   JSON header describing the number of rows and each buffer
+#   ...       buffers, each aligned to ALIGNMENT bytes
+#
+# Multi-component columns (e.g. vec3_double, miller_index) are stored as a
+# single (nrows, ncomponents) buffer. Variable length columns (std_string and
+# shoebox) are stored as blobs indexed by an array of nrows+1 offsets.
+
+from __future__ import absolute_import, division
+
+import logging
+logger = logging.getLogger(__name__)
+
+MAGIC = 'DIALSCOL'
+VERSION = 1
+ALIGNMENT = 64
+
+# The numpy dtype and number of components for each fixed size column type
+column_types = {
+  'bool'         : ('bool',    1),
+  'int'          : ('int32',   1),
+  'size_t'       : ('uint64',  1),
+  'double'       : ('float64', 1),
+  'vec2_double'  : ('float64', 2),
+  'vec3_double'  : ('float64', 3),
+  'mat3_double'  : ('float64', 9),
+  'int6'         : ('int32',   6),
+  'miller_index' : ('int32',   3),
+}
+
+
+def is_columnar_file(filename):
+  '''
+  Check if a file is in the columnar format.
+
+  :param filename: The filename
+  :return: True/False the file is a columnar file
+
+  '''
+  try:
+    with open(filename, 'rb') as infile:
+      return infile.read(len(MAGIC)) == MAGIC
+  except IOError:
+    return False
+
+
+class ColumnarWriter(object):
+  '''
+  A class to write a reflection table in the columnar format.
+
+  '''
+
+  def __init__(self, filename):
+    '''
+    Initialise the writer.
+
+    :param filename: The output filename
+
+    '''
+    self.filename = filename
+
+  def write(self, reflections):
+    '''
+    Write the reflection table.
+
+    :param reflections: The reflection table
+
+    '''
+    # Convert all the columns to buffers
+    buffers = []
+    columns = []
+    for key, data in reflections.cols():
+      columns.append(self.encode_column(key, data, buffers))
+
+    # Write the file
+    with open(self.filename, 'wb') as outfile:
+      self.write_header(
+        outfile, len(reflections), columns, [buf['info'] for buf in buffers])
+      for buf in buffers:
+        outfile.seek(buf['info']['offset'])
+        buf['array'].tofile(outfile)
+
+  def concatenate(self, filenames):
+    '''
+    Write the reflection tables in several columnar files as a single table.
+    The buffers are copied one input at a time from the memory mapped inputs,
+    so at most one column of one input is held in memory. Columns which are
+    missing from some of the inputs are filled with zeros, empty strings or
+    unallocated shoeboxes for those rows.
+
+    :param filenames: The columnar files to concatenate
+
+    '''
+    from collections import OrderedDict
+    import numpy as np
+    readers = [ColumnarReader(filename) for filename in filenames]
+    nrows = sum(len(reader) for reader in readers)
+
+    # Take the description of each column from the first input containing it
+    templates = OrderedDict()
+    for reader in readers:
+      for key, column in reader.columns.items():
+        if key not in templates:
+          templates[key] = column
+        elif templates[key]['type'] != column['type']:
+          raise RuntimeError('Column %s has different types in %s' % (
+            key, reader.filename))
+
+    # Describe the output buffers
+    columns = []
+    infos = []
+    for key, template in templates.items():
+      column = { 'name' : key, 'type' : template['type'] }
+      for name, kind in self.buffer_kinds(template['type']):
+        shape = list(template[name]['shape'][1:])
+        if kind == 'row':
+          shape = [nrows] + shape
+        elif kind == 'offsets':
+          shape = [nrows + 1]
+        else:
+          shape = [sum(
+            reader.columns[key][name]['shape'][0]
+            for reader in readers if key in reader.columns)] + shape
+        dtype = np.dtype(template[name]['dtype'])
+        column[name] = {
+          'dtype'  : dtype.str,
+          'shape'  : shape,
+          'nbytes' : int(np.prod(shape)) * dtype.itemsize,
+          'offset' : 0 }
+        infos.append(column[name])
+      columns.append(column)
+
+    # Write the file
+    with open(self.filename, 'wb') as outfile:
+      self.write_header(outfile, nrows, columns, infos)
+      for column in columns:
+        key = column['name']
+        for name, kind in self.buffer_kinds(column['type']):
+          info = column[name]
+          dtype = np.dtype(info['dtype'])
+          outfile.seek(info['offset'])
+          base = 0
+          for reader in readers:
+            if key in reader.columns:
+              array = reader.buffer(reader.columns[key][name])
+              if kind == 'offsets':
+                start, stop = array[0], array[-1]
+                array = array[:-1] - start + base
+                base += stop - start
+            elif kind == 'row':
+              array = np.zeros([len(reader)] + info['shape'][1:], dtype=dtype)
+            elif kind == 'offsets':
+              array = np.full(len(reader), base, dtype=dtype)
+            else:
+              continue
+            np.ascontiguousarray(array, dtype=dtype).tofile(outfile)
+          if kind == 'offsets':
+            np.array([base], dtype=dtype).tofile(outfile)
+
+  @staticmethod
+  def buffer_kinds(name):
+    '''
+    Get the buffers of a column type and how they are concatenated: row
+    buffers have one element per row, offsets buffers have one more element
+    than the number of rows and index into the blob buffers.
+
+    :param name: The column type
+    :return: A list of (buffer name, kind)
+
+    '''
+    if name in column_types:
+      return [('data', 'row')]
+    elif name == 'std_string':
+      return [('offsets', 'offsets'), ('data', 'blob')]
+    elif name == 'shoebox':
+      return [
+        ('panel', 'row'),
+        ('bbox', 'row'),
+        ('shape', 'row'),
+        ('offsets', 'offsets'),
+        ('data', 'blob'),
+        ('background', 'blob'),
+        ('mask', 'blob')]
+    raise RuntimeError('Unknown column type %s' % name)
+
+  def write_header(self, outfile, nrows, columns, infos):
+    '''
+    Compute the offset of each buffer and write the header.
+
+    :param outfile: The output file
+    :param nrows: The number of rows
+    :param columns: The column descriptions
+    :param infos: The buffer descriptions, in the order they are written
+
+    '''
+    import json
+    import struct
+    header = { 'version' : VERSION, 'nrows' : nrows, 'columns' : [] }
+    size = len(json.dumps(header)) + 1024
+    while True:
+      offset = self.align(len(MAGIC) + 8 + size)
+      for info in infos:
+        info['offset'] = offset
+        offset = self.align(offset + info['nbytes'])
+      header['columns'] = columns
+      text = json.dumps(header)
+      if len(text) <= size:
+        break
+      size = len(text) + 1024
+    outfile.write(MAGIC)
+    outfile.write(struct.pack('<Q', size))
+    outfile.write(text.ljust(size))
+
+  def encode_column(self, key, data, buffers):
+    '''
+    Encode a column as one or more buffers.
+
+    :param key: The column name
+    :param data: The column data
+    :param buffers: The list of buffers to append to
+    :return: The column description
+
+    '''
+    from dials.array_family import flex
+    import numpy as np
+    name = type(data).__name__
+    if name in column_types:
+      dtype, ncomp = column_types[name]
+      if name in ['vec2_double', 'vec3_double', 'mat3_double']:
+        array = data.as_double().as_numpy_array()
+      elif name == 'int6':
+        array = data.as_int().as_numpy_array()
+      elif name == 'miller_index':
+        array = data.as_vec3_double().as_double().as_numpy_array()
+      else:
+        array = data.as_numpy_array()
+      shape = (len(data), ncomp) if ncomp > 1 else (len(data),)
+      array = array.astype(dtype).reshape(shape)
+      return {
+        'name' : key,
+        'type' : name,
+        'data' : self.add_buffer(buffers, array) }
+    elif name == 'std_string':
+      # std::string holds bytes, so the raw bytes are stored unchanged
+      blob = list(data)
+      offsets = np.cumsum([0] + [len(s) for s in blob]).astype('uint64')
+      return {
+        'name'    : key,
+        'type'    : name,
+        'offsets' : self.add_buffer(buffers, offsets),
+        'data'    : self.add_buffer(
+          buffers, np.frombuffer(''.join(blob), dtype='uint8')) }
+    elif name == 'shoebox':
+      return self.encode_shoebox(key, data, buffers)
+    else:
+      raise RuntimeError('Unable to write column %s of type %s' % (key, name))
+
+  def encode_shoebox(self, key, data, buffers):
+    '''
+    Encode a shoebox column. The panel, bounding box and shape of each
+    shoebox are stored as columns and the pixel data, background and mask are
+    stored as blobs indexed by the offset of each shoebox.
+
+    :param key: The column name
+    :param data: The shoebox data
+    :param buffers: The list of buffers to append to
+    :return: The column description
+
+    '''
+    from dials.array_family import flex
+    import numpy as np
+    shape = np.zeros((len(data), 3), dtype='int32')
+    sizes = np.zeros(len(data), dtype='uint64')
+    pixels, background, mask = [], [], []
+    for i, sbox in enumerate(data):
+      if sbox.is_allocated():
+        shape[i] = sbox.data.all()
+        sizes[i] = len(sbox.data)
+        pixels.append(sbox.data.as_numpy_array())
+        background.append(sbox.background.as_numpy_array())
+        mask.append(sbox.mask.as_numpy_array().astype('int32'))
+    offsets = np.concatenate(([0], np.cumsum(sizes))).astype('uint64')
+    def concat(arrays, dtype):
+      if len(arrays) == 0:
+        return np.zeros(0, dtype=dtype)
+      return np.concatenate(arrays).astype(dtype)
+    return {
+      'name'       : key,
+      'type'       : 'shoebox',
+      'panel'      : self.add_buffer(buffers,
+                       data.panels().as_numpy_array().astype('uint64')),
+      'bbox'       : self.add_buffer(buffers,
+                       data.bounding_boxes().as_int().as_numpy_array()
+                         .astype('int32').reshape(len(data), 6)),
+      'shape'      : self.add_buffer(buffers, shape),
+      'offsets'    : self.add_buffer(buffers, offsets),
+      'data'       : self.add_buffer(buffers, concat(pixels, 'float64')),
+      'background' : self.add_buffer(buffers, concat(background, 'float64')),
+      'mask'       : self.add_buffer(buffers, concat(mask, 'int32')) }
+
+  def add_buffer(self, buffers, array):
+    '''
+    Add a buffer to the list of buffers.
+
+    :param buffers: The list of buffers
+    :param array: The numpy array
+    :return: The buffer description
+
+    '''
+    import numpy as np
+    array = np.ascontiguousarray(array)
+    info = {
+      'dtype'  : array.dtype.str,
+      'shape'  : list(array.shape),
+      'nbytes' : int(array.nbytes),
+      'offset' : 0 }
+    buffers.append({ 'array' : array, 'info' : info })
+    return info
+
+  @staticmethod
+  def align(offset):
+    '''
+    Align an offset
+
+    '''
+    return ((offset + ALIGNMENT - 1) // ALIGNMENT) * ALIGNMENT
+
+
+class ColumnarReader(object):
+  '''
+  A class to read a reflection table in the columnar format. Columns are
+  memory mapped so only the columns which are requested are read from disk.
+
+  '''
+
+  def __init__(self, filename):
+    '''
+    Read the header.
+
+    :param filename: The input filename
+
+    '''
+    import json
+    import struct
+    from collections import OrderedDict
+    self.filename = filename
+    with open(filename, 'rb') as infile:
+      if infile.read(len(MAGIC)) != MAGIC:
+        raise RuntimeError('%s is not a columnar reflection file' % filename)
+      size, = struct.unpack('<Q', infile.read(8))
+      header = json.loads(infile.read(size))
+    if header['version'] != VERSION:
+      raise RuntimeError('Unknown columnar file version %d' % header['version'])
+    self.nrows = header['nrows']
+    self.columns = OrderedDict(
+      (str(column['name']), column) for column in header['columns'])
+    self.timing = OrderedDict()
+
+  def keys(self):
+    '''
+    :return: The column names
+
+    '''
+    return list(self.columns.keys())
+
+  def __len__(self):
+    '''
+    :return: The number of rows
+
+    '''
+    return self.nrows
+
+  def read(self, columns=None, rows=None, nproc=1):
+    '''
+    Read the reflection table. The columns are decoded independently so they
+    can be decoded in parallel threads; most of the time is spent copying and
+    converting the memory mapped buffers. The time taken to read each column
+    is recorded in self.timing.
+
+    :param columns: The list of columns to read (default all)
+    :param rows: The (start, stop) range of rows to read (default all)
+    :param nproc: The number of threads to read the columns with
+    :return: The reflection table
+
+    '''
+    from dials.array_family import flex
+    from collections import OrderedDict
+    if columns is None:
+      columns = self.keys()
+    for key in columns:
+      if key not in self.columns:
+        raise KeyError('Column %s not in %s' % (key, self.filename))
+    start, stop = self.row_range(rows)
+
+    def read_timed(key):
+      from time import time
+      st = time()
+      data = self.read_column(key, start, stop)
+      return key, data, time() - st
+
+    if nproc > 1 and len(columns) > 1:
+      from multiprocessing.pool import ThreadPool
+      pool = ThreadPool(min(nproc, len(columns)))
+      try:
+        results = pool.map(read_timed, columns)
+      finally:
+        pool.close()
+        pool.join()
+    else:
+      results = [read_timed(key) for key in columns]
+
+    result = flex.reflection_table(stop - start)
+    self.timing = OrderedDict()
+    for key, data, elapsed in results:
+      result[key] = data
+      self.timing[key] = elapsed
+    self.log_timing()
+    return result
+
+  def row_range(self, rows):
+    '''
+    Get the range of rows to read, clipped to the rows in the file.
+
+    :param rows: The (start, stop) range of rows or None for all rows
+    :return: The (start, stop) range
+
+    '''
+    if rows is None:
+      return 0, self.nrows
+    start, stop = rows
+    if start is None:
+      start = 0
+    if stop is None:
+      stop = self.nrows
+    if start < 0 or stop < start:
+      raise ValueError('Invalid range of rows (%s, %s)' % tuple(rows))
+    return min(start, self.nrows), min(stop, self.nrows)
+
+  def log_timing(self):
+    '''
+    Log the time taken to read each column.
+
+    '''
+    from libtbx.table_utils import simple_table
+    rows = [[key, '%.4f' % elapsed] for key, elapsed in self.timing.items()]
+    rows.append(['Total', '%.4f' % sum(self.timing.values())])
+    logger.debug('Time taken to read columns from %s:' % self.filename)
+    logger.debug(simple_table(rows, ['Column', 'Time (s)']).format())
+
+  def read_column(self, key, start=0, stop=None):
+    '''
+    Read a single column.
+
+    :param key: The column name
+    :param start: The first row to read
+    :param stop: The row after the last row to read (default all)
+    :return: The column data
+
+    '''
+    from dials.array_family import flex
+    import numpy as np
+    if stop is None:
+      stop = self.nrows
+    column = self.columns[key]
+    name = column['type']
+    if name in column_types:
+      array = self.buffer(column['data'])[start:stop]
+      if name == 'double':
+        return flex.double(np.ascontiguousarray(array))
+      elif name == 'int':
+        return flex.int(np.ascontiguousarray(array))
+      elif name == 'size_t':
+        return flex.size_t(array.astype(int))
+      elif name == 'bool':
+        return flex.bool(np.ascontiguousarray(array))
+      elif name == 'vec2_double':
+        return flex.vec2_double(*self.parts(flex.double, array))
+      elif name == 'vec3_double':
+        return flex.vec3_double(*self.parts(flex.double, array))
+      elif name == 'mat3_double':
+        return flex.mat3_double(flex.double(array.reshape(-1)))
+      elif name == 'int6':
+        return flex.int6(flex.int(array.reshape(-1)))
+      elif name == 'miller_index':
+        return flex.miller_index(*self.parts(flex.int, array))
+    elif name == 'std_string':
+      offsets = self.buffer(column['offsets'])[start:stop+1].astype(int)
+      base = offsets[0] if len(offsets) > 0 else 0
+      offsets = offsets - base
+      blob = self.buffer(column['data'])[base:base+offsets[-1]].tostring() \
+        if len(offsets) > 0 else ''
+      return flex.std_string([
+        blob[offsets[i]:offsets[i+1]]
+        for i in range(len(offsets)-1)])
+    elif name == 'shoebox':
+      return self.read_shoebox(column, start, stop)
+    raise RuntimeError('Unable to read column %s of type %s' % (key, name))
+
+  def read_shoebox(self, column, start=0, stop=None):
+    '''
+    Read a shoebox column.
+
+    :param column: The column description
+    :param start: The first row to read
+    :param stop: The row after the last row to read (default all)
+    :return: The shoeboxes
+
+    '''
+    from dials.array_family import flex
+    if stop is None:
+      stop = self.nrows
+    panel = flex.size_t(self.buffer(column['panel'])[start:stop].astype(int))
+    bbox = flex.int6(flex.int(
+      self.buffer(column['bbox'])[start:stop].reshape(-1)))
+    shape = self.buffer(column['shape'])[start:stop]
+    offsets = self.buffer(column['offsets'])[start:stop+1]
+    data = self.buffer(column['data'])
+    background = self.buffer(column['background'])
+    mask = self.buffer(column['mask'])
+    result = flex.shoebox(panel, bbox, allocate=False)
+    for i in range(len(result)):
+      i0, i1 = int(offsets[i]), int(offsets[i+1])
+      if i1 > i0:
+        grid = flex.grid(*[int(n) for n in shape[i]])
+        sbox_data = self.as_real(flex.double(data[i0:i1].copy()))
+        sbox_background = self.as_real(flex.double(background[i0:i1].copy()))
+        sbox_mask = flex.int(mask[i0:i1].copy())
+        sbox_data.reshape(grid)
+        sbox_background.reshape(grid)
+        sbox_mask.reshape(grid)
+        sbox = result[i]
+        sbox.data = sbox_data
+        sbox.background = sbox_background
+        sbox.mask = sbox_mask
+        result[i] = sbox
+    return result
+
+  def buffer(self, info):
+    '''
+    Memory map a buffer.
+
+    :param info: The buffer description
+    :return: The numpy array
+
+    '''
+    import numpy as np
+    shape = tuple(info['shape'])
+    if info['nbytes'] == 0:
+      return np.zeros(shape, dtype=info['dtype'])
+    return np.memmap(
+      self.filename,
+      dtype=info['dtype'],
+      mode='r',
+      offset=info['offset'],
+      shape=shape)
+
+  @staticmethod
+  def as_real(array):
+    '''
+    Convert a flex.double array to the shoebox pixel type.
+
+    '''
+    from dials.array_family import flex
+    if flex.real == flex.double:
+      return array
+    return array.as_float()
+
+  @staticmethod
+  def parts(flex_type, array):
+    '''
+    Split a multi-component buffer into flex arrays.
+
+    '''
+    import numpy as np
+    return [
+      flex_type(np.ascontiguousarray(array[:,i]))
+      for i in range(array.shape[1])]
+
+
+def write(reflections, filename):
+  '''
+  Write a reflection table in the columnar format.
+
+  :param reflections: The reflection table
+  :param filename: The output filename
+
+  '''
+  ColumnarWriter(filename).write(reflections)
+
+
+def concatenate(filenames, filename):
+  '''
+  Concatenate the reflection tables in several columnar files into a single
+  columnar file, without reading the tables into memory.
+
+  :param filenames: The input filenames
+  :param filename: The output filename
+
+  '''
+  ColumnarWriter(filename).concatenate(filenames)
+
+
+def read(filename, columns=None, rows=None, nproc=1):
+  '''
+  Read a reflection table in the columnar format.
+
+  :param filename: The input filename
+  :param columns: The list of columns to read (default all)
+  :param rows: The (start, stop) range of rows to read (default all)
+  :param nproc: The number of threads to read the columns with
+  :return: The reflection table
+
+  '''
+  return ColumnarReader(filename).read(columns, rows=rows, nproc=nproc)
+
+
+def select(reflections, columns=None, rows=None):
+  '''
+  Select columns and a range of rows from a reflection table which has
+  already been read, e.g. from a pickle file, so that the result is the same
+  as reading the selection from a columnar file.
+
+  :param reflections: The reflection table
+  :param columns: The list of columns to select (default all)
+  :param rows: The (start, stop) range of rows to select (default all)
+  :return: The reflection table
+
+  '''
+  from dials.array_family import flex
+  if rows is not None:
+    start, stop = rows
+    if stop is None:
+      stop = len(reflections)
+    reflections = reflections[start or 0:stop]
+  if columns is None:
+    return reflections
+  result = flex.reflection_table(len(reflections))
+  for key in columns:
+    if key not in reflections:
+      raise KeyError('Column %s not in reflection table' % key)
+    result[key] = reflections[key]
+  return result
@@ -13,6 +13,8 @@
 logger = logging.getLogger(__name__)
 from math import pi
 from cctbx.sgtbx import bravais_types
+from dials.util.export_records import open_output, write_records
+from dials.util.export_records import as_numpy, miller_index_as_numpy
 
 RAD2DEG = 180.0/pi
 
@@ -37,6 +39,7 @@ def write(self, experiments, reflections):
 
     '''
     import iotbx.cif.model
+    import numpy as np
 
     # Select reflections
     selection = reflections.get_flags(reflections.flags.integrated, all=True)
@@ -148,10 +151,13 @@ def write(self, experiments, reflections):
     #                    a, b, c, alpha, beta, gamma))
     #cif_block.add_loop(cif_loop)
 
-    # Write reflection data
+    # Add the block
+    self._cif['dials'] = cif_block
+
+    # Print to file. The reflection data are written directly to the file
+    # rather than through the cif model, as a loop at the end of the block
     # FIXME there are three intensity fields. I've put summation in I and Isum
-    cif_loop = iotbx.cif.model.loop(
-      header=("_pdbx_diffrn_unmerged_refln.reflection_id",
+    header = ("_pdbx_diffrn_unmerged_refln.reflection_id",
               "_pdbx_diffrn_unmerged_refln.scan_id",
               "_pdbx_diffrn_unmerged_refln.image_id_begin",
               "_pdbx_diffrn_unmerged_refln.image_id_end",
@@ -166,30 +172,33 @@ def write(self, experiments, reflections):
               "_pdbx_diffrn_unmerged_refln.intensity_profile_sigma",
               "_pdbx_diffrn_unmerged_refln.scan_angle_reflection",
               "_pdbx_diffrn_unmerged_refln.partiality",
-              "_pdbx_diffrn_unmerged_refln.scale_value"))
-    for i, r in enumerate(reflections):
-      refl_id       = i + 1
-      scan_id       = r['id'] + 1
-      _,_,_,_,z0,z1 = r['bbox']
-      h, k, l       = r['miller_index']
-      I             = r['intensity.sum.value']
-      sigI          = r['intensity.sum.variance']
-      Isum          = r['intensity.sum.value']
-      sigIsum       = r['intensity.sum.variance']
-      Iprf          = r['intensity.prf.value']
-      sigIprf       = r['intensity.prf.variance']
-      phi           = r['xyzcal.mm'][2] * RAD2DEG
-      partiality    = r['partiality']
-      scale         = 1.0
-      cif_loop.add_row((refl_id, scan_id, z0, z1, h, k, l, I, sigI, Isum,
-          sigIsum, Iprf, sigIprf, phi, partiality, scale))
-    cif_block.add_loop(cif_loop)
-
-    # Add the block
-    self._cif['dials'] = cif_block
-
-    # Print to file
-    print >>open(self.filename, "w"), self._cif
+              "_pdbx_diffrn_unmerged_refln.scale_value")
+    nref = len(reflections)
+    _, _, _, _, z0, z1 = reflections['bbox'].parts()
+    hkl = miller_index_as_numpy(reflections['miller_index'])
+    columns = [
+      np.arange(1, nref+1),
+      as_numpy(reflections['id']) + 1,
+      z0,
+      z1,
+      hkl[:,0],
+      hkl[:,1],
+      hkl[:,2],
+      reflections['intensity.sum.value'],
+      reflections['intensity.sum.variance'],
+      reflections['intensity.sum.value'],
+      reflections['intensity.sum.variance'],
+      reflections['intensity.prf.value'],
+      reflections['intensity.prf.variance'],
+      as_numpy(reflections['xyzcal.mm'].parts()[2]) * RAD2DEG,
+      reflections['partiality'],
+      np.ones(nref)]
+    with open_output(self.filename) as outfile:
+      outfile.write('%s\n' % self._cif)
+      outfile.write('loop_\n')
+      outfile.write(''.join('  %s\n' % name for name in header))
+      write_records(outfile, '  %d %d %d %d %d %d %d' + ' %.12g' * 9 + '\n',
+                    columns)
 
     # Log
     logger.info("Wrote reflections to %s" % self.filename)
@@ -2,7 +2,6 @@
 
 from __future__ import absolute_import, division, print_function
 
-from collections import defaultdict
 from math import floor, ceil, sqrt, sin, cos, pi, log
 import time
 
@@ -65,83 +64,68 @@ def sum_partial_reflections(integrated_data, min_total_partiality=0.5):
   if len(isel) == 0:
     return integrated_data
 
-  delete = flex.size_t()
-  partial_map = defaultdict(list)
+  import numpy as np
 
-  # create map of partial_id to reflections j
+  # group the partial reflections by partial_id with a stable sort, so that
+  # within each group the rows stay in order and the first row of the group
+  # is the one that is kept; each group is then a contiguous segment
 
-  for j in isel:
-    partial_map[integrated_data['partial_id'][j]].append(j)
+  rows = isel.as_numpy_array()
+  partial_id = integrated_data['partial_id'].select(isel).as_numpy_array()
+  order = np.argsort(partial_id, kind='mergesort')
+  rows = rows[order]
+  partial_id = partial_id[order]
+  starts = np.flatnonzero(
+    np.concatenate(([True], partial_id[1:] != partial_id[:-1])))
+  counts = np.diff(np.append(starts, len(rows)))
+  group = np.repeat(np.arange(len(starts)), counts)
+
+  def segment_sum(values):
+    return np.add.reduceat(values, starts)
 
-  # now work through this map - get total partiality for every reflection;
-  # here only consider reflections with > 1 component; if total partiality
-  # less than min_total_partiality discard all parts.
+  def column(name):
+    return integrated_data[name].as_numpy_array()[rows]
 
-  partial_ids = []
+  # only consider reflections with > 1 component; if total partiality less
+  # than min_total_partiality discard all parts, otherwise sum into the first
+  # part and delete the extra parts
 
-  for p_id in partial_map:
-    if len(partial_map[p_id]) > 1:
-      partial_ids.append(p_id)
+  partiality = segment_sum(column('partiality'))
+  multi_part = counts > 1
+  keep = multi_part & (partiality >= min_total_partiality)
+  discard = multi_part & (partiality < min_total_partiality)
 
-  # work through multipart partials; compute those weighted values I need
-  # if total partiality less than min, delete. if summing, delete extra parts
+  first = np.zeros(len(rows), dtype=bool)
+  first[starts] = True
+  delete = rows[discard[group] | (keep[group] & ~first)]
 
   we_got_profiles = 'intensity.prf.value' in integrated_data
   logger.info('Profile fitted reflections: %s' % we_got_profiles)
 
-  for p_id in partial_ids:
-    p_tot = sum([integrated_data['partiality'][j] for j in partial_map[p_id]])
-    if p_tot < min_total_partiality:
-      for j in partial_map[p_id]:
-        delete.append(j)
-      continue
+  target = flex.size_t(rows[starts[keep]].astype(int))
 
-    j0 = partial_map[p_id][0]
-    jrest = partial_map[p_id][1:]
+  def write_back(name, values):
+    integrated_data[name].set_selected(
+      target, flex.double(values[keep].astype(np.float64)))
 
-    # FIXME revisiting this calculation am not sure it is correct - why
-    # weighting by (I/sig(I))^2 not just 1/variance?
-    if we_got_profiles:
-      prf_value = integrated_data['intensity.prf.value'][j0]
-      prf_variance = integrated_data['intensity.prf.variance'][j0]
+  # FIXME revisiting this calculation am not sure it is correct - why
+  # weighting by (I/sig(I))^2 not just 1/variance?
+  if we_got_profiles:
+    prf_value = column('intensity.prf.value')
+    prf_variance = column('intensity.prf.variance')
+    with np.errstate(divide='ignore', invalid='ignore'):
       weight = prf_value * prf_value / prf_variance
-      prf_value *= weight
-      prf_variance *= weight
-      total_weight = weight
-    sum_value = integrated_data['intensity.sum.value'][j0]
-    sum_variance = integrated_data['intensity.sum.variance'][j0]
-    partiality = integrated_data['partiality'][j0]
-
-    # weight profile fitted intensity and variance computed from weights
-    # proportional to (I/sig(I))^2; schedule for deletion spare parts
-
-    for j in jrest:
-      delete.append(j)
-
-      sum_value += integrated_data['intensity.sum.value'][j]
-      sum_variance += integrated_data['intensity.sum.variance'][j]
-      partiality += integrated_data['partiality'][j]
-
-      if we_got_profiles:
-        _prf_value = integrated_data['intensity.prf.value'][j]
-        _prf_variance = integrated_data['intensity.prf.variance'][j]
-
-        _weight = _prf_value * _prf_value / _prf_variance
-        prf_value += _weight * _prf_value
-        prf_variance += _weight * _prf_variance
-        total_weight += _weight
-
-    # now write these back into original reflection
-    if we_got_profiles:
-      prf_value /= total_weight
-      prf_variance /= total_weight
-      integrated_data['intensity.prf.value'][j0] = prf_value
-      integrated_data['intensity.prf.variance'][j0] = prf_variance
-    integrated_data['intensity.sum.value'][j0] = sum_value
-    integrated_data['intensity.sum.variance'][j0] = sum_variance
-    integrated_data['partiality'][j0] = partiality
-
-  integrated_data.del_selected(delete)
+      total_weight = segment_sum(weight)
+      write_back('intensity.prf.value',
+        segment_sum(weight * prf_value) / total_weight)
+      write_back('intensity.prf.variance',
+        segment_sum(weight * prf_variance) / total_weight)
+  write_back('intensity.sum.value', segment_sum(column('intensity.sum.value')))
+  write_back('intensity.sum.variance',
+    segment_sum(column('intensity.sum.variance')))
+  write_back('partiality', partiality)
+
+  integrated_data.del_selected(flex.size_t(np.sort(delete).astype(int)))
 
   return integrated_data
 
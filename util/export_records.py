@@ -0,0 +1,102 @@
+#
+# export_records.py
+#
+#  This code is distributed under the BSD license, a copy of which is
+#  included in the root directory of this package.
+#
+
+# Helpers for the text exporters to write one fixed format record per
+# reflection. The columns are gathered into numpy arrays once and the records
+# are formatted a chunk at a time, with a single string formatting operation
+# for each chunk, rather than indexing the columns and formatting each
+# reflection in turn.
+
+from __future__ import absolute_import, division
+
+from itertools import chain
+
+# The number of records to format at once
+CHUNK_SIZE = 65536
+
+
+def open_output(filename, mode='w'):
+  '''
+  Open an output file, compressing the output if the filename ends with .gz
+  or .bz2
+
+  :param filename: The filename
+  :param mode: The file mode
+  :return: The file object
+
+  '''
+  if filename.endswith('.gz'):
+    import gzip
+    return gzip.GzipFile(filename, mode + 'b' if 'b' not in mode else mode)
+  elif filename.endswith('.bz2'):
+    import bz2
+    return bz2.BZ2File(filename, mode + 'b' if 'b' not in mode else mode)
+  return open(filename, mode)
+
+
+def as_numpy(column):
+  '''
+  Convert a column to a numpy array
+
+  :param column: A flex array, numpy array or sequence
+  :return: The numpy array
+
+  '''
+  import numpy as np
+  if isinstance(column, np.ndarray):
+    return column
+  if hasattr(column, 'as_numpy_array'):
+    return column.as_numpy_array()
+  return np.asarray(column)
+
+
+def miller_index_as_numpy(miller_index):
+  '''
+  Convert a flex.miller_index to an (n, 3) numpy array of ints
+
+  :param miller_index: The miller indices
+  :return: The numpy array
+
+  '''
+  import numpy as np
+  array = miller_index.as_vec3_double().as_double().as_numpy_array()
+  return array.reshape(-1, 3).astype(np.int64)
+
+
+def format_records(fmt, columns, chunk_size=CHUNK_SIZE):
+  '''
+  Format the records a chunk at a time. Each record is formatted with fmt
+  from one value in each column.
+
+  :param fmt: The format of a single record
+  :param columns: The columns, in the order of the fields in fmt
+  :param chunk_size: The number of records to format at once
+  :return: An iterator over the formatted chunks
+
+  '''
+  columns = [as_numpy(column) for column in columns]
+  num_records = len(columns[0])
+  assert all(len(column) == num_records for column in columns)
+  for start in range(0, num_records, chunk_size):
+    stop = min(start + chunk_size, num_records)
+    values = [column[start:stop].tolist() for column in columns]
+    yield (fmt * (stop - start)) % tuple(chain.from_iterable(zip(*values)))
+
+
+def write_records(fout, fmt, columns, chunk_size=CHUNK_SIZE):
+  '''
+  Write the records to a file. Each record is formatted with fmt from one
+  value in each column.
+
+  :param fout: The file to write to
+  :param fmt: The format of a single record, including the newline
+  :param columns: The columns, in the order of the fields in fmt
+  :param chunk_size: The number of records to format at once
+
+  '''
+  for chunk in format_records(fmt, columns, chunk_size=chunk_size):
+    fout.write(chunk)
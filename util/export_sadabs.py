@@ -5,6 +5,8 @@
 
 from dials.util.export_mtz import sum_partial_reflections
 from dials.util.export_mtz import scale_partial_reflections
+from dials.util.export_records import open_output, write_records
+from dials.util.export_records import as_numpy, miller_index_as_numpy
 
 def export_sadabs(integrated_data, experiment_list, hklout, run=0,
                   summation=False, include_partials=False, keep_partials=False,
@@ -15,7 +17,7 @@ def export_sadabs(integrated_data, experiment_list, hklout, run=0,
 
   from dials.array_family import flex
   from scitbx import matrix
-  import math
+  import numpy as np
 
   # for the moment assume (and assert) that we will convert data from exactly
   # one lattice...
@@ -70,10 +72,9 @@ def export_sadabs(integrated_data, experiment_list, hklout, run=0,
   assert(not experiment.scan is None)
 
   # sort data before output
-  nref = len(integrated_data['miller_index'])
-  indices = flex.size_t_range(nref)
-  perm = sorted(indices, key=lambda k: integrated_data['miller_index'][k])
-  integrated_data = integrated_data.select(flex.size_t(perm))
+  hkl = miller_index_as_numpy(integrated_data['miller_index'])
+  perm = np.lexsort((hkl[:,2], hkl[:,1], hkl[:,0]))
+  integrated_data = integrated_data.select(flex.size_t(perm.astype(int)))
 
   assert (not experiment.goniometer is None)
 
@@ -184,59 +185,76 @@ def export_sadabs(integrated_data, experiment_list, hklout, run=0,
   else:
     static = False
 
-  fout = open(hklout, 'w')
-
-  for j in range(nref):
-
-    h, k, l = miller_index[j]
-
-    if predict:
-      x_mm, y_mm, z_rad = integrated_data['xyzcal.mm'][j]
-    else:
-      x_mm, y_mm, z_rad = integrated_data['xyzobs.mm.value'][j]
-
-    z0 = integrated_data['xyzcal.px'][j][2]
-    istol = int(round(10000 * unit_cell.stol((h, k, l))))
-
-    if predict or static:
-      # work from a scan static model & assume perfect goniometer
-      # FIXME maybe should work back in the option to predict spot positions
-      UB = matrix.sqr(experiment.crystal.get_A())
-      phi = phi_start + z0 * phi_range
-      R = axis.axis_and_angle_as_r3_rotation_matrix(phi, deg=True)
-      RUB = S * R * F * UB
-    else:
-      # properly compute RUB for every reflection
-      UB = matrix.sqr(experiment.crystal.get_A_at_scan_point(int(round(z0))))
-      phi = phi_start + z0 * phi_range
-      R = axis.axis_and_angle_as_r3_rotation_matrix(phi, deg=True)
-      RUB = S * R * F * UB
-
-    x = RUB * (h, k, l)
-    s = (s0 + x).normalize()
+  def round_half_away(v):
+    # as python's round, rather than numpy's round half to even
+    return np.where(v >= 0, np.floor(v + 0.5), np.ceil(v - 0.5))
 
-    # can also compute s based on centre of mass of spot
-    # s = (origin + x_mm * fast_axis + y_mm * slow_axis).normalize()
+  def normalize(v):
+    return v / np.sqrt((v * v).sum(axis=1))[:,np.newaxis]
 
-    astar = (RUB * (1, 0, 0)).normalize()
-    bstar = (RUB * (0, 1, 0)).normalize()
-    cstar = (RUB * (0, 0, 1)).normalize()
-
-    ix = beam.dot(astar)
-    iy = beam.dot(bstar)
-    iz = beam.dot(cstar)
-
-    dx = s.dot(astar)
-    dy = s.dot(bstar)
-    dz = s.dot(cstar)
-
-    x = x_mm * scl_x
-    y = y_mm * scl_y
-    z = (z_rad * 180 / math.pi - phi_start) / phi_range
-
-    fout.write('%4d%4d%4d%8.2f%8.2f%4d%8.5f%8.5f%8.5f%8.5f%8.5f%8.5f' % \
-               (h, k, l, I[j], sigI[j], run, ix, dx, iy, dy, iz, dz))
-    fout.write('%7.2f%7.2f%8.2f%7.2f%5d\n' % (x, y, z, detector2t, istol))
+  hkl = miller_index_as_numpy(miller_index)
 
+  if predict:
+    xyz_mm = integrated_data['xyzcal.mm']
+  else:
+    xyz_mm = integrated_data['xyzobs.mm.value']
+  x_mm, y_mm, z_rad = [as_numpy(c) for c in xyz_mm.parts()]
+
+  z0 = as_numpy(integrated_data['xyzcal.px'].parts()[2])
+  istol = round_half_away(
+    10000 * as_numpy(unit_cell.stol(miller_index))).astype(int)
+
+  # compute RUB = S * R * F * UB for every reflection; with a scan static model
+  # assume a perfect goniometer, otherwise use UB at the nearest scan point
+  # FIXME maybe should work back in the option to predict spot positions
+  phi = np.radians(phi_start + z0 * phi_range)
+  u = np.array(axis.normalize().elems)
+  c = np.cos(phi)[:,np.newaxis,np.newaxis]
+  s = np.sin(phi)[:,np.newaxis,np.newaxis]
+  K = np.array([[0, -u[2], u[1]], [u[2], 0, -u[0]], [-u[1], u[0], 0]])
+  R = c * np.identity(3) + s * K + (1 - c) * np.outer(u, u)
+  S_array = np.array(S.elems).reshape(3, 3)
+  F_array = np.array(F.elems).reshape(3, 3)
+  if predict or static:
+    FUB = F_array.dot(np.array(experiment.crystal.get_A()).reshape(3, 3))
+    RUB = np.einsum('ij,njk,kl->nil', S_array, R, FUB)
+  else:
+    scan_point = round_half_away(z0).astype(int)
+    points, index = np.unique(scan_point, return_inverse=True)
+    UB = np.array([
+      experiment.crystal.get_A_at_scan_point(int(p)) for p in points
+    ]).reshape(-1, 3, 3)[index]
+    RUB = np.einsum('ij,njk,kl,nlm->nim', S_array, R, F_array, UB)
+
+  x = np.einsum('nij,nj->ni', RUB, hkl)
+  s = normalize(np.array(s0.elems) + x)
+
+  # can also compute s based on centre of mass of spot
+  # s = (origin + x_mm * fast_axis + y_mm * slow_axis).normalize()
+
+  astar = normalize(RUB[:,:,0])
+  bstar = normalize(RUB[:,:,1])
+  cstar = normalize(RUB[:,:,2])
+
+  beam = np.array(beam.elems)
+  ix = astar.dot(beam)
+  iy = bstar.dot(beam)
+  iz = cstar.dot(beam)
+
+  dx = (s * astar).sum(axis=1)
+  dy = (s * bstar).sum(axis=1)
+  dz = (s * cstar).sum(axis=1)
+
+  x = x_mm * scl_x
+  y = y_mm * scl_y
+  z = (np.degrees(z_rad) - phi_start) / phi_range
+
+  fout = open_output(hklout)
+  write_records(
+    fout,
+    '%4d%4d%4d%8.2f%8.2f%4d%8.5f%8.5f%8.5f%8.5f%8.5f%8.5f'
+    '%7.2f%7.2f%8.2f%7.2f%5d\n',
+    [hkl[:,0], hkl[:,1], hkl[:,2], I, sigI, np.full(nref, run, dtype=int),
+     ix, dx, iy, dy, iz, dz, x, y, z, np.full(nref, detector2t), istol])
   fout.close()
   logger.info('Output %d reflections to %s' % (nref, hklout))
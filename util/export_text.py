@@ -1,9 +1,15 @@
 from __future__ import absolute_import, division
-def export_text(integrated_data):
-  '''Export contents of a dials reflection table as text.'''
+def export_text(integrated_data, out=None):
+  '''Export contents of a dials reflection table as text to out, or to
+  standard output if out is None.'''
 
-  mi = integrated_data['miller_index']
-  h, k, l = zip(*integrated_data['miller_index'])
+  import sys
+  from dials.util.export_records import miller_index_as_numpy, write_records
+
+  if out is None:
+    out = sys.stdout
+
+  hkl = miller_index_as_numpy(integrated_data['miller_index'])
 
   # FIXME Currently outputting either summation or profile fitting. Should do
   # both?
@@ -14,8 +20,7 @@ def export_text(integrated_data):
     i = integrated_data['intensity.sum.value']
     v = integrated_data['intensity.sum.variance']
   lp = integrated_data['lp']
-  i *= lp
-  v *= lp
+  i = i * lp
+  v = v * lp
 
-  for _h, _k, _l, _i, _v in zip(h, k, l, i, v):
-    print '%4d %4d %4d %f %f' % (_h, _k, _l, _i, _v)
+  write_records(out, '%4d %4d %4d %f %f\n', [hkl[:,0], hkl[:,1], hkl[:,2], i, v])
@@ -5,6 +5,8 @@
 
 from dials.util.export_mtz import sum_partial_reflections
 from dials.util.export_mtz import scale_partial_reflections
+from dials.util.export_records import open_output, write_records
+from dials.util.export_records import as_numpy, miller_index_as_numpy
 
 def export_xds_ascii(integrated_data, experiment_list, hklout, summation=False,
                      include_partials=False, keep_partials=False, var_model=(1,0)):
@@ -12,6 +14,7 @@ def export_xds_ascii(integrated_data, experiment_list, hklout, summation=False,
   an XDS_ASCII.HKL formatted text file.'''
 
   from dials.array_family import flex
+  import numpy as np
 
   # for the moment assume (and assert) that we will convert data from exactly
   # one lattice...
@@ -61,16 +64,14 @@ def export_xds_ascii(integrated_data, experiment_list, hklout, summation=False,
   experiment = experiment_list[0]
 
   # sort data before output
-  nref = len(integrated_data['miller_index'])
-  indices = flex.size_t_range(nref)
-
   import copy
   unique = copy.deepcopy(integrated_data['miller_index'])
   from cctbx.miller import map_to_asu
   map_to_asu(experiment.crystal.get_space_group().type(), False, unique)
 
-  perm = sorted(indices, key=lambda k: unique[k])
-  integrated_data = integrated_data.select(flex.size_t(perm))
+  unique = miller_index_as_numpy(unique)
+  perm = np.lexsort((unique[:,2], unique[:,1], unique[:,0]))
+  integrated_data = integrated_data.select(flex.size_t(perm.astype(int)))
 
   from scitbx import matrix
   from rstbx.cftbx.coordinate_frame_helpers import align_reference_frame
@@ -118,7 +119,7 @@ def export_xds_ascii(integrated_data, experiment_list, hklout, summation=False,
   if 'partiality' in integrated_data:
     partiality = 100 * integrated_data['partiality']
   else:
-    prof_corr = flex.double(nref, 100.0)
+    partiality = flex.double(nref, 100.0)
 
   if summation:
     I = integrated_data['intensity.sum.value'] * scl
@@ -133,7 +134,7 @@ def export_xds_ascii(integrated_data, experiment_list, hklout, summation=False,
     V = var_model[0] * (V + var_model[1] * I * I)
     sigI = flex.sqrt(V)
 
-  fout = open(hklout, 'w')
+  fout = open_output(hklout)
 
   # first write the header - in the "standard" coordinate frame...
 
@@ -203,32 +204,42 @@ def export_xds_ascii(integrated_data, experiment_list, hklout, summation=False,
 
   # then write the data records
 
-  s0 = Rd * matrix.col(experiment.beam.get_s0())
-
-  for j in range(nref):
-    x, y, z = integrated_data['xyzcal.px'][j]
-    phi = phi_start + z * phi_range
-    h, k, l = miller_index[j]
-    X = (UB * (h, k, l)).rotate(axis, phi, deg=True)
-    s = s0 + X
-    g = s.cross(s0).normalize()
-    f = (s - s0).normalize()
-
-    # find component of beam perpendicular to f, e
-    e = - (s + s0).normalize()
-    if h == k and k == l:
-      u = (h, -h, 0)
-    else:
-      u = (k - l, l - h, h - k)
-    q = (matrix.col(u).transpose() * UB.inverse()).normalize(
-        ).transpose().rotate(axis, phi, deg=True)
-
-    psi = q.angle(g, deg=True)
-    if q.dot(e) < 0:
-      psi *= -1
-
-    fout.write('%d %d %d %f %f %f %f %f %f %.1f %.1f %f\n' %
-               (h, k, l, I[j], sigI[j], x, y, z, scl[j], partiality[j], prof_corr[j], psi))
+  s0 = np.array((Rd * matrix.col(experiment.beam.get_s0())).elems)
+  rotation_axis = np.array(axis.normalize().elems)
+  UB_array = np.array(UB.elems).reshape(3, 3)
+  UB_inverse = np.array(UB.inverse().elems).reshape(3, 3)
+
+  def normalize(v):
+    return v / np.sqrt((v * v).sum(axis=1))[:,np.newaxis]
+
+  def rotate(v, angle):
+    # rotate each row of v about the rotation axis by angle (in radians)
+    c = np.cos(angle)[:,np.newaxis]
+    s = np.sin(angle)[:,np.newaxis]
+    return (v * c + np.cross(rotation_axis, v) * s +
+            rotation_axis * v.dot(rotation_axis)[:,np.newaxis] * (1 - c))
+
+  hkl = miller_index_as_numpy(miller_index)
+  h, k, l = hkl[:,0], hkl[:,1], hkl[:,2]
+  x, y, z = [as_numpy(c) for c in integrated_data['xyzcal.px'].parts()]
+  phi = np.radians(phi_start + z * phi_range)
+  X = rotate(hkl.dot(UB_array.T), phi)
+  s = s0 + X
+  g = normalize(np.cross(s, s0))
+
+  # find component of beam perpendicular to s - s0, e
+  e = - normalize(s + s0)
+  u = np.column_stack((k - l, l - h, h - k))
+  same = (h == k) & (k == l)
+  u[same] = np.column_stack((h, -h, np.zeros_like(h)))[same]
+  q = rotate(normalize(u.dot(UB_inverse)), phi)
+
+  psi = np.degrees(np.arccos(np.clip((q * g).sum(axis=1), -1, 1)))
+  psi[(q * e).sum(axis=1) < 0] *= -1
+
+  write_records(
+    fout, '%d %d %d %f %f %f %f %f %f %.1f %.1f %f\n',
+    [h, k, l, I, sigI, x, y, z, scl, partiality, prof_corr, psi])
 
   fout.write('!END_OF_DATA\n')
   fout.close()
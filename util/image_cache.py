@@ -0,0 +1,371 @@
+#
+# image_cache.py
+#
+#  This code is distributed under the BSD license, a copy of which is
+#  included in the root directory of this package.
+
+from __future__ import absolute_import, division
+from contextlib import contextmanager
+from iotbx.phil import parse
+
+import logging
+logger = logging.getLogger(__name__)
+
+phil_scope = parse('''
+  image_cache
+    .expert_level = 2
+  {
+    enable = False
+      .type = bool
+      .help = "Cache the decoded images so that they can be shared between"
+              "processes, and between programs which are run one after the"
+              "other on the same machine."
+
+    directory = None
+      .type = path
+      .help = "The directory in which to create a private directory for the"
+              "decoded images. This should be on a memory backed file system."
+              "By default /dev/shm is used if it exists, otherwise the"
+              "temporary directory."
+
+    max_megabytes = 1024
+      .type = float(value_min=0)
+      .help = "The maximum size of the cache. The least recently used images"
+              "are removed when the cache is larger than this."
+  }
+''')
+
+
+class SharedImageCache(object):
+  '''
+  A cache of decoded images which can be shared between processes.
+
+  Each image is stored as a file in a directory which should be on a memory
+  backed file system. The files are keyed on the image path and the index of
+  the image within the file. The images are stored as raw numpy buffers, not
+  pickles, and the cache directory is private to the user, so other users
+  cannot plant data in it. Files are written to a temporary name and then
+  renamed, so a reader never sees a partially written image. Whenever an image
+  is read its modification time is updated.
+
+  The size of the cache is shared by all the processes using it: the total is
+  kept in a file in the cache directory which is locked while it is updated.
+  When an image takes the cache over its size limit, the directory is scanned
+  and the least recently used images are removed until the cache is well
+  within the limit, so that the directory is not scanned for every image.
+
+  '''
+
+  # The flex type for each numpy dtype an image may have
+  flex_types = {
+    'int32'   : 'int',
+    'float64' : 'double',
+    'float32' : 'float',
+  }
+
+  # The fraction of the size limit to reduce the cache to when it is full
+  low_water = 0.9
+
+  def __init__(self, directory=None, max_bytes=2**30):
+    '''
+    Initialise the cache
+
+    :param directory: The directory to create the cache directory in
+    :param max_bytes: The maximum size of the cache in bytes
+
+    '''
+    import getpass
+    import os
+    import tempfile
+    if directory is None:
+      if os.path.isdir('/dev/shm'):
+        directory = '/dev/shm'
+      else:
+        directory = tempfile.gettempdir()
+    directory = os.path.join(
+      directory, 'dials_image_cache_%s' % getpass.getuser())
+    if not os.path.isdir(directory):
+      try:
+        os.makedirs(directory, 0o700)
+      except OSError:
+        # Another process may have just created it
+        if not os.path.isdir(directory):
+          raise
+    self.check_private(directory)
+    self.directory = directory
+    self.max_bytes = max_bytes
+    self.hits = 0
+    self.misses = 0
+
+  @staticmethod
+  def check_private(directory):
+    '''
+    Check that the cache directory belongs to the user and that no one else
+    can access it
+
+    :param directory: The cache directory
+
+    '''
+    import os
+    import stat
+    st = os.lstat(directory)
+    if not stat.S_ISDIR(st.st_mode):
+      raise RuntimeError('Image cache %s is not a directory' % directory)
+    if hasattr(os, 'getuid'):
+      if st.st_uid != os.getuid():
+        raise RuntimeError(
+          'Image cache directory %s is owned by another user' % directory)
+      if st.st_mode & (stat.S_IRWXG | stat.S_IRWXO):
+        raise RuntimeError(
+          'Image cache directory %s is accessible to other users' % directory)
+
+  @classmethod
+  def from_parameters(cls, params):
+    '''
+    Create the cache from the image_cache parameters
+
+    :param params: The image_cache parameters
+    :return: The cache or None if it is not enabled
+
+    '''
+    if not params.enable:
+      return None
+    return cls(
+      directory=params.directory,
+      max_bytes=int(params.max_megabytes * 2**20))
+
+  def filename(self, path, index):
+    '''
+    Get the name of the file for an image. The modification time of the image
+    file is part of the key so that images are not used once the file changes.
+
+    :param path: The path of the image file
+    :param index: The index of the image within the file
+    :return: The cache filename
+
+    '''
+    import hashlib
+    import os
+    try:
+      mtime = os.path.getmtime(path)
+    except OSError:
+      mtime = None
+    key = hashlib.sha1(
+      repr((os.path.abspath(path), index, mtime))).hexdigest()
+    return os.path.join(self.directory, '%s.npz' % key)
+
+  def get(self, path, index):
+    '''
+    Get an image from the cache
+
+    :param path: The path of the image file
+    :param index: The index of the image within the file
+    :return: The image or None if it is not in the cache
+
+    '''
+    import numpy as np
+    import os
+    from scitbx.array_family import flex
+    filename = self.filename(path, index)
+    try:
+      with open(filename, 'rb') as infile:
+        npz = np.load(infile, allow_pickle=False)
+        try:
+          arrays = [npz['panel_%d' % i] for i in range(len(npz.files))]
+        finally:
+          npz.close()
+      os.utime(filename, None)
+    except (IOError, OSError, EOFError, KeyError, ValueError):
+      self.misses += 1
+      return None
+    image = []
+    for array in arrays:
+      if array.dtype.name not in self.flex_types:
+        self.misses += 1
+        return None
+      data = getattr(flex, self.flex_types[array.dtype.name])(
+        np.ascontiguousarray(array).reshape(-1))
+      data.reshape(flex.grid(*array.shape))
+      image.append(data)
+    self.hits += 1
+    return tuple(image)
+
+  def put(self, path, index, image):
+    '''
+    Add an image to the cache
+
+    :param path: The path of the image file
+    :param index: The index of the image within the file
+    :param image: The image
+
+    '''
+    import numpy as np
+    import os
+    import tempfile
+    arrays = dict(
+      ('panel_%d' % i, data.as_numpy_array()) for i, data in enumerate(image))
+    if any(a.dtype.name not in self.flex_types for a in arrays.values()):
+      logger.debug("Unable to cache %s image %d of this type" % (path, index))
+      return
+    filename = self.filename(path, index)
+    handle, tmp_filename = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+    try:
+      with os.fdopen(handle, 'wb') as outfile:
+        np.savez(outfile, **arrays)
+      size = os.path.getsize(tmp_filename)
+      try:
+        # Another process may have added the same image
+        size -= os.path.getsize(filename)
+      except OSError:
+        pass
+      os.rename(tmp_filename, filename)
+    except (IOError, OSError):
+      if os.path.exists(tmp_filename):
+        os.remove(tmp_filename)
+      logger.debug("Unable to add %s image %d to the cache" % (path, index))
+      return
+    with self.lock() as lock:
+      total = self.read_total(lock)
+      if total is None or total + size > self.max_bytes:
+        total = self.evict()
+      else:
+        total += size
+      self.write_total(lock, total)
+
+  @contextmanager
+  def lock(self):
+    '''
+    Lock the file holding the total size of the cache. The lock is released
+    when the file is closed.
+
+    :return: A context manager giving the file descriptor
+
+    '''
+    import os
+    try:
+      import fcntl
+    except ImportError:
+      fcntl = None
+    handle = os.open(
+      os.path.join(self.directory, 'total_bytes'),
+      os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+      if fcntl is not None:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+      yield handle
+    finally:
+      os.close(handle)
+
+  @staticmethod
+  def read_total(handle):
+    '''
+    Read the total size of the cache from the locked file
+
+    :param handle: The file descriptor
+    :return: The total size in bytes or None if it is not known
+
+    '''
+    import os
+    os.lseek(handle, 0, os.SEEK_SET)
+    try:
+      return int(os.read(handle, 64))
+    except ValueError:
+      return None
+
+  @staticmethod
+  def write_total(handle, total):
+    '''
+    Write the total size of the cache to the locked file
+
+    :param handle: The file descriptor
+    :param total: The total size in bytes
+
+    '''
+    import os
+    os.lseek(handle, 0, os.SEEK_SET)
+    os.ftruncate(handle, 0)
+    os.write(handle, str(total))
+
+  def evict(self):
+    '''
+    Scan the cache directory and, if the cache is over its size limit, remove
+    the least recently used images until it is within the low water mark. The
+    lock must be held while this is called.
+
+    :return: The total size of the images left in the cache
+
+    '''
+    import os
+    entries = []
+    for name in os.listdir(self.directory):
+      if not name.endswith('.npz'):
+        continue
+      filename = os.path.join(self.directory, name)
+      try:
+        st = os.stat(filename)
+      except OSError:
+        continue
+      entries.append((st.st_mtime, filename, st.st_size))
+    total = sum(size for mtime, filename, size in entries)
+    if total > self.max_bytes:
+      for mtime, filename, size in sorted(entries):
+        if total <= self.max_bytes * self.low_water:
+          break
+        try:
+          os.remove(filename)
+        except OSError:
+          pass
+        total -= size
+    return total
+
+  def clear(self):
+    '''
+    Remove all the images from the cache
+
+    '''
+    import os
+    with self.lock() as lock:
+      for name in os.listdir(self.directory):
+        if name.endswith('.npz'):
+          try:
+            os.remove(os.path.join(self.directory, name))
+          except OSError:
+            pass
+      self.write_total(lock, 0)
+
+  def get_raw_data(self, imageset, index):
+    '''
+    Get the raw data for an image in an imageset, decoding it and adding it to
+    the cache if it is not already there.
+
+    :param imageset: The imageset
+    :param index: The index of the image in the imageset
+    :return: The raw data
+
+    '''
+    path = imageset.get_path(index)
+    file_index = imageset.indices()[index]
+    image = self.get(path, file_index)
+    if image is None:
+      image = imageset.get_raw_data(index)
+      self.put(path, file_index, image)
+    return image
+
+  def get_corrected_data(self, imageset, index):
+    '''
+    Get the corrected data for an image in an imageset. Without a gain or
+    pedestal the corrected data are the raw data so the cached raw data are
+    used, otherwise the imageset computes the corrected data.
+
+    :param imageset: The imageset
+    :param index: The index of the image in the imageset
+    :return: The corrected data
+
+    '''
+    from scitbx.array_family import flex
+    lookup = imageset.external_lookup
+    if not lookup.gain.data.empty() or not lookup.pedestal.data.empty():
+      return imageset.get_corrected_data(index)
+    return tuple(
+      data if isinstance(data, flex.double) else data.as_double()
+      for data in self.get_raw_data(imageset, index))
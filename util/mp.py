@@ -174,6 +174,60 @@ def multi_node_parallel_map(
   return [item for rlist in result for item in rlist]
 
 
+def dynamic_multi_node_parallel_map(
+    func,
+    iterable,
+    costs,
+    njobs=1,
+    nproc=1,
+    cluster_method=None,
+    callback=None,
+    preserve_exception_message=False):
+  '''
+  A wrapper function to call a function using multiple cluster nodes and with
+  multiple processors on each node where the items are dispatched on demand
+  in order of decreasing estimated cost.
+
+  On a single node, each process takes the next most expensive item as soon
+  as it has finished its current item. On multiple nodes, items of similar
+  cost are grouped together so that the processes on a node are not left idle
+  waiting for a single expensive item to finish. The results are returned in
+  order of completion rather than in the order of the input.
+
+  '''
+  from libtbx.easy_mp import parallel_map as easy_mp_parallel_map
+
+  # Order the items by decreasing cost
+  iterable = list(iterable)
+  assert len(costs) == len(iterable), "Need one cost per item"
+  order = sorted(range(len(iterable)), key=lambda i: costs[i], reverse=True)
+  iterable = [iterable[i] for i in order]
+
+  # On a single node just let the processes take items as they are free
+  if njobs == 1:
+    return easy_mp_parallel_map(
+      func                       = func,
+      iterable                   = iterable,
+      processes                  = nproc,
+      method                     = "multiprocessing",
+      callback                   = callback,
+      asynchronous               = True,
+      preserve_order             = False,
+      preserve_exception_message = preserve_exception_message)
+
+  # Otherwise dispatch the groups of items to the cluster
+  return multi_node_parallel_map(
+    func                       = func,
+    iterable                   = iterable,
+    njobs                      = njobs,
+    nproc                      = nproc,
+    cluster_method             = cluster_method,
+    asynchronous               = True,
+    callback                   = callback,
+    preserve_order             = False,
+    preserve_exception_message = preserve_exception_message)
+
+
 class BatchFunc(object):
   '''
   Process the batch iterables
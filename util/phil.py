@@ -115,7 +115,7 @@ def from_string(self, s):
     if s not in self.cache:
       if not exists(s):
         raise Sorry('File %s does not exist' % s)
-      self.cache[s] = FilenameDataWrapper(s, flex.reflection_table.from_pickle(s))
+      self.cache[s] = FilenameDataWrapper(s, flex.reflection_table.from_file(s))
     return self.cache[s]
 
   def from_words(self, words, master):